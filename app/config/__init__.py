@@ -1,4 +1,5 @@
 import os
+import re
 from dataclasses import dataclass
 from dotenv import load_dotenv
 
@@ -11,6 +12,47 @@ class Settings:
     proxyapi_key: str
     proxyapi_base_url: str
     gpt_model: str
+    storage_backend: str = "json"   # json | sqlite | records
+    sqlite_path: str = "data/storage.sqlite3"
+    scenario_cache_mb: int = 64
+    pro_scenario_layout: str = "single"   # single | sharded (только для json)
+    storage_flush_interval_ms: int = 200
+    storage_flush_max_changes: int = 50
+    ai_cache_ttl_s: int = 86400
+    ai_cache_max_entries: int = 1000
+    ai_cache_variants: int = 3
+    ai_cache_dir: str = ""   # пусто — только память
+    ai_cache_disk_max_mb: int = 256
+    nutrition_pool_size: int = 0   # 0 — без пула (по умолчанию выключен)
+    nutrition_pool_concurrency: int = 2
+    nutrition_pool_max_age_s: int = 6 * 3600
+    ai_max_concurrent: int = 8
+    ai_max_per_user: int = 1
+    ai_timeout_s: float = 180.0
+    ai_first_token_timeout_s: float = 30.0
+    ai_max_retries: int = 2
+    ai_hedge_percentile: float = 0.0   # 0 — без хеджирования
+    scenario_speculative: bool = False
+    scenario_speculative_min_ctr: float = 0.5
+    scenario_speculative_min_history: int = 2
+    ai_metrics_path: str = "data/ai_metrics.jsonl"   # пусто — только в памяти
+    ai_http_max_connections: int = 32
+    ai_http_max_keepalive: int = 16
+    ai_http_keepalive_expiry_s: float = 60.0
+    ai_http2: bool = False
+    ai_warmup_connections: int = 2
+    bot_mode: str = "polling"   # polling | webhook
+    webhook_base_url: str = ""   # публичный https-адрес, без пути
+    webhook_path: str = "/tg/webhook"
+    webhook_secret: str = ""
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_queue_size: int = 1000
+    webhook_workers: int = 64
+    tg_global_rate: float = 25.0   # сообщений в секунду на весь бот
+    tg_chat_rate: float = 1.0   # сообщений в секунду в одном чате
+    tg_chat_burst: float = 3.0
+    tg_max_retries: int = 3   # повторов после 429
 
 
 def get_settings() -> Settings:
@@ -25,9 +67,122 @@ def get_settings() -> Settings:
     base_url = os.getenv("PROXYAPI_BASE_URL", "https://api.proxyapi.ru/openai/v1").strip()
     model = os.getenv("GPT_MODEL", "gpt-5").strip()
 
+    storage_backend = os.getenv("STORAGE_BACKEND", "json").strip().lower()
+    if storage_backend not in ("json", "sqlite", "records"):
+        raise RuntimeError(f"STORAGE_BACKEND must be json, sqlite or records, got: {storage_backend}")
+    sqlite_path = os.getenv("SQLITE_PATH", "data/storage.sqlite3").strip()
+    scenario_cache_mb = int(os.getenv("SCENARIO_CACHE_MB", "64").strip() or 64)
+    pro_scenario_layout = os.getenv("PRO_SCENARIO_LAYOUT", "single").strip().lower()
+    if pro_scenario_layout not in ("single", "sharded"):
+        raise RuntimeError(f"PRO_SCENARIO_LAYOUT must be single or sharded, got: {pro_scenario_layout}")
+    flush_interval_ms = int(os.getenv("STORAGE_FLUSH_INTERVAL_MS", "200").strip() or 200)
+    flush_max_changes = int(os.getenv("STORAGE_FLUSH_MAX_CHANGES", "50").strip() or 50)
+
+    ai_cache_ttl_s = int(os.getenv("AI_CACHE_TTL_S", "86400").strip() or 86400)
+    ai_cache_max_entries = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000").strip() or 1000)
+    ai_cache_variants = int(os.getenv("AI_CACHE_VARIANTS", "3").strip() or 3)
+    if ai_cache_variants < 1:
+        raise RuntimeError(f"AI_CACHE_VARIANTS must be >= 1, got: {ai_cache_variants}")
+    ai_cache_dir = os.getenv("AI_CACHE_DIR", "").strip()
+    ai_cache_disk_max_mb = int(os.getenv("AI_CACHE_DISK_MAX_MB", "256").strip() or 256)
+
+    nutrition_pool_size = int(os.getenv("NUTRITION_POOL_SIZE", "0").strip() or 0)
+    nutrition_pool_concurrency = int(os.getenv("NUTRITION_POOL_CONCURRENCY", "2").strip() or 2)
+    nutrition_pool_max_age_s = int(os.getenv("NUTRITION_POOL_MAX_AGE_S", "21600").strip() or 21600)
+
+    ai_max_concurrent = int(os.getenv("AI_MAX_CONCURRENT", "8").strip() or 8)
+    ai_max_per_user = int(os.getenv("AI_MAX_PER_USER", "1").strip() or 1)
+    ai_timeout_s = float(os.getenv("AI_TIMEOUT_S", "180").strip() or 180)
+    ai_first_token_timeout_s = float(os.getenv("AI_FIRST_TOKEN_TIMEOUT_S", "30").strip() or 30)
+    ai_max_retries = int(os.getenv("AI_MAX_RETRIES", "2").strip() or 2)
+    ai_hedge_percentile = float(os.getenv("AI_HEDGE_PERCENTILE", "0").strip() or 0)
+    if not 0 <= ai_hedge_percentile < 1:
+        raise RuntimeError(f"AI_HEDGE_PERCENTILE must be in [0, 1), got: {ai_hedge_percentile}")
+
+    scenario_speculative = os.getenv("SCENARIO_SPECULATIVE", "0").strip().lower() in ("1", "true", "yes", "on")
+    scenario_speculative_min_ctr = float(os.getenv("SCENARIO_SPECULATIVE_MIN_CTR", "0.5").strip() or 0.5)
+    scenario_speculative_min_history = int(os.getenv("SCENARIO_SPECULATIVE_MIN_HISTORY", "2").strip() or 2)
+
+    ai_metrics_path = os.getenv("AI_METRICS_PATH", "data/ai_metrics.jsonl").strip()
+
+    ai_http_max_connections = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "32").strip() or 32)
+    ai_http_max_keepalive = int(os.getenv("AI_HTTP_MAX_KEEPALIVE", "16").strip() or 16)
+    ai_http_keepalive_expiry_s = float(os.getenv("AI_HTTP_KEEPALIVE_EXPIRY_S", "60").strip() or 60)
+    ai_http2 = os.getenv("AI_HTTP2", "0").strip().lower() in ("1", "true", "yes", "on")
+    ai_warmup_connections = int(os.getenv("AI_WARMUP_CONNECTIONS", "2").strip() or 0)
+
+    bot_mode = os.getenv("BOT_MODE", "polling").strip().lower()
+    if bot_mode not in ("polling", "webhook"):
+        raise RuntimeError(f"BOT_MODE must be polling or webhook, got: {bot_mode}")
+    webhook_base_url = os.getenv("WEBHOOK_BASE_URL", "").strip()
+    webhook_path = os.getenv("WEBHOOK_PATH", "/tg/webhook").strip() or "/tg/webhook"
+    if not webhook_path.startswith("/"):
+        webhook_path = "/" + webhook_path
+    webhook_secret = os.getenv("WEBHOOK_SECRET", "").strip()
+    webhook_host = os.getenv("WEBHOOK_HOST", "0.0.0.0").strip() or "0.0.0.0"
+    webhook_port = int(os.getenv("WEBHOOK_PORT", "8080").strip() or 8080)
+    webhook_queue_size = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000").strip() or 1000)
+    webhook_workers = int(os.getenv("WEBHOOK_WORKERS", "64").strip() or 64)
+
+    tg_global_rate = float(os.getenv("TG_GLOBAL_RATE", "25").strip() or 25)
+    tg_chat_rate = float(os.getenv("TG_CHAT_RATE", "1").strip() or 1)
+    tg_chat_burst = float(os.getenv("TG_CHAT_BURST", "3").strip() or 3)
+    if tg_global_rate <= 0 or tg_chat_rate <= 0 or tg_chat_burst < 1:
+        raise RuntimeError("TG_GLOBAL_RATE and TG_CHAT_RATE must be > 0, TG_CHAT_BURST must be >= 1")
+    tg_max_retries = int(os.getenv("TG_MAX_RETRIES", "3").strip() or 0)
+    if bot_mode == "webhook":
+        if not webhook_base_url:
+            raise RuntimeError("WEBHOOK_BASE_URL is missing in .env (required for BOT_MODE=webhook)")
+        # Telegram допускает в секрете только A-Z, a-z, 0-9, _ и -, до 256 символов
+        if not webhook_secret:
+            raise RuntimeError("WEBHOOK_SECRET is missing in .env (required for BOT_MODE=webhook)")
+        if len(webhook_secret) > 256 or not re.fullmatch(r"[A-Za-z0-9_-]+", webhook_secret):
+            raise RuntimeError("WEBHOOK_SECRET may contain only A-Z, a-z, 0-9, _ and -, up to 256 chars")
+
     return Settings(
         bot_token=bot_token,
         proxyapi_key=proxy_key,
         proxyapi_base_url=base_url,
         gpt_model=model,
+        storage_backend=storage_backend,
+        sqlite_path=sqlite_path,
+        scenario_cache_mb=scenario_cache_mb,
+        pro_scenario_layout=pro_scenario_layout,
+        storage_flush_interval_ms=flush_interval_ms,
+        storage_flush_max_changes=flush_max_changes,
+        ai_cache_ttl_s=ai_cache_ttl_s,
+        ai_cache_max_entries=ai_cache_max_entries,
+        ai_cache_variants=ai_cache_variants,
+        ai_cache_dir=ai_cache_dir,
+        ai_cache_disk_max_mb=ai_cache_disk_max_mb,
+        nutrition_pool_size=nutrition_pool_size,
+        nutrition_pool_concurrency=nutrition_pool_concurrency,
+        nutrition_pool_max_age_s=nutrition_pool_max_age_s,
+        ai_max_concurrent=ai_max_concurrent,
+        ai_max_per_user=ai_max_per_user,
+        ai_timeout_s=ai_timeout_s,
+        ai_first_token_timeout_s=ai_first_token_timeout_s,
+        ai_max_retries=ai_max_retries,
+        ai_hedge_percentile=ai_hedge_percentile,
+        scenario_speculative=scenario_speculative,
+        scenario_speculative_min_ctr=scenario_speculative_min_ctr,
+        scenario_speculative_min_history=scenario_speculative_min_history,
+        ai_metrics_path=ai_metrics_path,
+        ai_http_max_connections=ai_http_max_connections,
+        ai_http_max_keepalive=ai_http_max_keepalive,
+        ai_http_keepalive_expiry_s=ai_http_keepalive_expiry_s,
+        ai_http2=ai_http2,
+        ai_warmup_connections=ai_warmup_connections,
+        bot_mode=bot_mode,
+        webhook_base_url=webhook_base_url,
+        webhook_path=webhook_path,
+        webhook_secret=webhook_secret,
+        webhook_host=webhook_host,
+        webhook_port=webhook_port,
+        webhook_queue_size=webhook_queue_size,
+        webhook_workers=webhook_workers,
+        tg_global_rate=tg_global_rate,
+        tg_chat_rate=tg_chat_rate,
+        tg_chat_burst=tg_chat_burst,
+        tg_max_retries=tg_max_retries,
     )
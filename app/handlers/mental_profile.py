@@ -1,16 +1,14 @@
-import asyncio
-import yaml
-from pathlib import Path
-
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.exceptions import TelegramBadRequest
 
 
-from app.ui.keyboards import main_menu_keyboard, question_keyboard, custom_keyboard
+from app.ui.keyboards import main_menu_keyboard
+from app.ui.questionnaire import get_questionnaire
 from app.services.ai_provider import AIProvider
 from app.storage.users_store import save_fitness_profile_result  # пока используем текущую функцию хранилища
-from app.services.ui_session import set_ui_message, get_ui_message
+from app.services.ui_session import set_ui_message, force_new_ui, render_ui, run_in_background
+from app.services.ai_scheduler import get_scheduler
 from aiogram.dispatcher.event.bases import SkipHandler
 
 
@@ -28,15 +26,10 @@ ASK_TO_SHORTEN_TO = 800
 # флаг тестового режима: не тратим деньги на GPT
 DRY_RUN_NO_GPT = True
 
-# -------- YAML загрузка надёжно (через Path) --------
-BASE_DIR = Path(__file__).resolve().parents[2]  # корень проекта
-TEST_PATH = BASE_DIR / "config" / "mental_test.yaml"
-
-with open(TEST_PATH, "r", encoding="utf-8") as f:
-    TEST = yaml.safe_load(f)
-
-QUESTIONS = TEST["questions"]
-TITLE = TEST.get("title", "Психологический портрет")
+# тексты, клавиатуры и варианты собраны из config/mental_test.yaml один раз
+TEST = get_questionnaire("mental")
+QUESTIONS = TEST.questions
+TITLE = TEST.title or "Психологический портрет"
 
 # “чистые” вопросы для финального промта (без подсказок)
 PROMPT_QUESTIONS = [
@@ -64,27 +57,10 @@ def _init_user(tg_id: int):
     }
 
 
-def _q_text(i: int) -> str:
-    return f"Вопрос {i + 1}/{len(QUESTIONS)}:\n{QUESTIONS[i]['text']}"
-
-
 def _is_finished(tg_id: int) -> bool:
     return STATE[tg_id]["q"] >= len(QUESTIONS)
 
 
-def _strip_option_prefix(text: str) -> str:
-    """
-    Убирает префиксы вида 'A) ' / 'B) ' и т.п. в начале строки.
-    Пример: 'A) Тревога о будущем' -> 'Тревога о будущем'
-    """
-    t = (text or "").strip()
-    if len(t) >= 3 and t[0].isalpha() and t[1] == ")" and t[2] == " ":
-        return t[3:].strip()
-    if len(t) >= 2 and t[0].isalpha() and t[1] == ")":
-        return t[2:].strip()
-    return t
-
-
 async def _safe_answer_callback(cb: CallbackQuery):
     try:
         await cb.answer()
@@ -92,47 +68,6 @@ async def _safe_answer_callback(cb: CallbackQuery):
         pass
 
 
-async def _render_ui(message: Message, tg_id: int, text: str, reply_markup=None, parse_mode: str | None = None):
-    """
-    UI всегда должен быть последним сообщением:
-    - если текущая UI-панель всё ещё последняя -> редактируем её
-    - если после неё появились сообщения -> создаём новую UI-панель
-    """
-    ui = get_ui_message(tg_id)
-
-    if not ui:
-        sent = await message.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
-        set_ui_message(tg_id, sent.chat.id, sent.message_id)
-        return
-
-    chat_id, ui_msg_id = ui
-
-    # если текущее событие новее чем UI — UI не последний, создаём новый
-    if message.message_id and message.message_id > ui_msg_id:
-        sent = await message.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
-        set_ui_message(tg_id, sent.chat.id, sent.message_id)
-        return
-
-    try:
-        await message.bot.edit_message_text(
-            chat_id=chat_id,
-            message_id=ui_msg_id,
-            text=text,
-            reply_markup=reply_markup,
-            parse_mode=parse_mode,
-        )
-    except TelegramBadRequest as e:
-        if "message is not modified" in str(e):
-            return
-        raise
-
-
-async def _force_new_ui(message: Message, tg_id: int, text: str, reply_markup=None, parse_mode: str | None = None):
-    """Всегда создаёт новую UI-панель и делает её последним сообщением."""
-    sent = await message.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
-    set_ui_message(tg_id, sent.chat.id, sent.message_id)
-
-
 def _build_prompt_prefix() -> str:
     return (
         "Ты — клинический психолог с 20-летним опытом, работающий на стыке психодинамики, "
@@ -205,7 +140,8 @@ async def home(cb: CallbackQuery):
     set_ui_message(tg_id, cb.message.chat.id, cb.message.message_id)
 
     STATE.pop(tg_id, None)
-    await _render_ui(
+    get_scheduler().cancel(tg_id)
+    await render_ui(
         cb.message,
         tg_id,
         "Главное меню 👇",
@@ -220,11 +156,11 @@ async def start_test(cb: CallbackQuery):
     set_ui_message(tg_id, cb.message.chat.id, cb.message.message_id)
 
     _init_user(tg_id)
-    await _render_ui(
+    await render_ui(
         cb.message,
         tg_id,
-        _q_text(0),
-        reply_markup=question_keyboard(PREFIX, 0, QUESTIONS[0]["options"]),
+        QUESTIONS[0].text,
+        reply_markup=QUESTIONS[0].keyboard,
     )
 
 
@@ -235,7 +171,7 @@ async def back(cb: CallbackQuery):
     set_ui_message(tg_id, cb.message.chat.id, cb.message.message_id)
 
     if tg_id not in STATE:
-        await _render_ui(
+        await render_ui(
             cb.message,
             tg_id,
             "Тест сбросился. Нажми «Психологический портрет (Free)» ещё раз 🙂",
@@ -248,12 +184,12 @@ async def back(cb: CallbackQuery):
     st["awaiting_q"] = None
     st["q"] = max(0, st["q"] - 1)
 
-    q = st["q"]
-    await _render_ui(
+    q = QUESTIONS[st["q"]]
+    await render_ui(
         cb.message,
         tg_id,
-        _q_text(q),
-        reply_markup=question_keyboard(PREFIX, q, QUESTIONS[q]["options"]),
+        q.text,
+        reply_markup=q.keyboard,
     )
 
 
@@ -264,7 +200,7 @@ async def answer(cb: CallbackQuery):
     set_ui_message(tg_id, cb.message.chat.id, cb.message.message_id)
 
     if tg_id not in STATE:
-        await _render_ui(
+        await render_ui(
             cb.message,
             tg_id,
             "Тест сбросился. Нажми «Психологический портрет (Free)» ещё раз 🙂",
@@ -276,8 +212,7 @@ async def answer(cb: CallbackQuery):
     _, _, q_index_str, opt_id = cb.data.split(":", 3)
     q_index = int(q_index_str)
 
-    q = QUESTIONS[q_index]
-    opt = next((o for o in q["options"] if o["id"] == opt_id), None)
+    opt = QUESTIONS[q_index].options.get(opt_id)
     if not opt:
         return
 
@@ -287,30 +222,30 @@ async def answer(cb: CallbackQuery):
     if opt_id == "custom":
         st["awaiting_custom"] = True
         st["awaiting_q"] = q_index
-        await _render_ui(
+        await render_ui(
             cb.message,
             tg_id,
             "✍ Можно ответить коротко, либо расписать более подробно в рамках одного предложения.\n\n"
             f"Ограничение: до {MAX_CUSTOM_CHARS} символов.",
-            reply_markup=custom_keyboard(PREFIX),
+            reply_markup=TEST.custom_keyboard,
         )
         return
 
     # обычный ответ: сохраняем без A)/B)...
-    st["answers"][q_index] = _strip_option_prefix(opt["text"])
+    st["answers"][q_index] = opt.answer
     st["q"] = q_index + 1
 
     if _is_finished(tg_id):
-        await _render_ui(cb.message, tg_id, "Готово ✅\n\nСобираю запрос…", reply_markup=None)
-        asyncio.create_task(_finish(cb.message, tg_id))
+        await render_ui(cb.message, tg_id, "Готово ✅\n\nСобираю запрос…", reply_markup=None)
+        run_in_background(_finish(cb.message, tg_id))
         return
 
-    nq = st["q"]
-    await _render_ui(
+    nq = QUESTIONS[st["q"]]
+    await render_ui(
         cb.message,
         tg_id,
-        _q_text(nq),
-        reply_markup=question_keyboard(PREFIX, nq, QUESTIONS[nq]["options"]),
+        nq.text,
+        reply_markup=nq.keyboard,
     )
 
 
@@ -342,18 +277,18 @@ async def custom_text(message: Message):
     st["awaiting_q"] = None
     st["q"] = q_index + 1
 
-    # после сообщения пользователя UI должен стать последним -> _render_ui создаст новую панель
+    # после сообщения пользователя UI должен стать последним -> render_ui создаст новую панель
     if _is_finished(tg_id):
-        await _render_ui(message, tg_id, "Готово ✅\n\nСобираю запрос…", reply_markup=None)
-        asyncio.create_task(_finish(message, tg_id))
+        await render_ui(message, tg_id, "Готово ✅\n\nСобираю запрос…", reply_markup=None)
+        run_in_background(_finish(message, tg_id))
         return
 
-    nq = st["q"]
-    await _render_ui(
+    nq = QUESTIONS[st["q"]]
+    await render_ui(
         message,
         tg_id,
-        _q_text(nq),
-        reply_markup=question_keyboard(PREFIX, nq, QUESTIONS[nq]["options"]),
+        nq.text,
+        reply_markup=nq.keyboard,
     )
 
 
@@ -384,7 +319,7 @@ async def _finish(message: Message, tg_id: int):
     else:
         await message.answer("Реальный вызов GPT ещё не включён.")
 
-    await _force_new_ui(
+    await force_new_ui(
         message,
         tg_id,
         "Главное меню 👇",
@@ -1,15 +1,20 @@
-import asyncio
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, Message
 from aiogram.exceptions import TelegramBadRequest
 
-from app.ui.keyboards import start_keyboard
-from app.storage.users_store import can_use_free_nutrition, consume_free_nutrition_use
-from app.services.ai_provider import AIProvider
-from app.services.ui_session import set_ui_message, get_ui_message
+from app.ui.keyboards import main_menu_keyboard
+from app.storage.users_store import can_use_free_nutrition, consume_free_nutrition_use, reserve_free_nutrition_use
+from app.services.access import is_pro
+from app.services.ai_provider import AIProvider, EMPTY_ANSWER
+from app.services.ai_scheduler import AIRequestCancelled, PRIORITY_BACKGROUND, PRIORITY_FREE, get_scheduler
+from app.services.nutrition_pool import PlanPool
+from app.services.ui_session import set_ui_message, force_new_ui, render_ui, run_in_background
+from app.services.stream_delivery import stream_to_message
 
 router = Router()
 ai: AIProvider | None = None
+# готовые рационы для пресетов (см. start_pool)
+pool: PlanPool | None = None
 
 STATE_NUT: dict[int, dict] = {}
 
@@ -45,45 +50,6 @@ async def _safe_answer_callback(cb: CallbackQuery):
         pass
 
 
-async def _render_ui(message: Message, tg_id: int, text: str, reply_markup=None, parse_mode: str | None = None):
-    """
-    UI всегда должен быть последним сообщением:
-    - если UI последнее -> редактируем
-    - если после UI были сообщения -> создаём новое UI
-    """
-    ui = get_ui_message(tg_id)
-
-    if not ui:
-        sent = await message.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
-        set_ui_message(tg_id, sent.chat.id, sent.message_id)
-        return
-
-    chat_id, ui_msg_id = ui
-
-    if message.message_id and message.message_id > ui_msg_id:
-        sent = await message.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
-        set_ui_message(tg_id, sent.chat.id, sent.message_id)
-        return
-
-    try:
-        await message.bot.edit_message_text(
-            chat_id=chat_id,
-            message_id=ui_msg_id,
-            text=text,
-            reply_markup=reply_markup,
-            parse_mode=parse_mode,
-        )
-    except TelegramBadRequest as e:
-        if "message is not modified" in str(e):
-            return
-        raise
-
-
-async def _force_new_ui(message: Message, tg_id: int, text: str, reply_markup=None, parse_mode: str | None = None):
-    sent = await message.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
-    set_ui_message(tg_id, sent.chat.id, sent.message_id)
-
-
 async def _format_nutrition_report(text: str) -> str:
     divider = "━━━━━━━━━━━━━━━━━━━━"
     blocks = [b.strip() for b in text.split("\n\n") if b.strip()]
@@ -102,7 +68,8 @@ async def nut_home(cb: CallbackQuery):
     set_ui_message(tg_id, cb.message.chat.id, cb.message.message_id)
 
     STATE_NUT.pop(tg_id, None)
-    await _render_ui(cb.message, tg_id, "Выбери действие 👇", reply_markup=start_keyboard())
+    get_scheduler().cancel(tg_id)
+    await render_ui(cb.message, tg_id, "Выбери действие 👇", reply_markup=main_menu_keyboard())
 
 
 @router.callback_query(F.data == "nut:start")
@@ -112,9 +79,9 @@ async def nut_start(cb: CallbackQuery):
 
     set_ui_message(tg_id, cb.message.chat.id, cb.message.message_id)
 
-    ok, msg = await can_use_free_nutrition(tg_id, limit_per_week=3)
+    ok, msg = await can_use_free_nutrition(tg_id)
     if not ok:
-        await _render_ui(cb.message, tg_id, msg, reply_markup=start_keyboard(), parse_mode="Markdown")
+        await render_ui(cb.message, tg_id, msg, reply_markup=main_menu_keyboard(), parse_mode="Markdown")
         return
 
     STATE_NUT[tg_id] = {
@@ -122,10 +89,9 @@ async def nut_start(cb: CallbackQuery):
         "calories": None,
         "format": None,
         "awaiting_custom": None,  # "calories" or "format"
-        "consumed": False,
     }
 
-    await _render_ui(cb.message, tg_id, "Выбери примерную калорийность:", reply_markup=_kb("nut:cal:", CAL_OPTIONS))
+    await render_ui(cb.message, tg_id, "Выбери примерную калорийность:", reply_markup=_kb("nut:cal:", CAL_OPTIONS))
 
 
 @router.callback_query(F.data.startswith("nut:cal:"))
@@ -143,7 +109,7 @@ async def nut_pick_cal(cb: CallbackQuery):
 
     if "Свой вариант" in choice:
         st["awaiting_custom"] = "calories"
-        await _render_ui(
+        await render_ui(
             cb.message,
             tg_id,
             "✍ Напиши свой вариант калорийности одним сообщением (например: 1750–1850 ккал):",
@@ -153,7 +119,7 @@ async def nut_pick_cal(cb: CallbackQuery):
 
     st["calories"] = choice
     st["step"] = "format"
-    await _render_ui(cb.message, tg_id, "Выбери формат питания:", reply_markup=_kb("nut:fmt:", FORMAT_OPTIONS))
+    await render_ui(cb.message, tg_id, "Выбери формат питания:", reply_markup=_kb("nut:fmt:", FORMAT_OPTIONS))
 
 
 @router.callback_query(F.data.startswith("nut:fmt:"))
@@ -171,7 +137,7 @@ async def nut_pick_format(cb: CallbackQuery):
 
     if "Свой вариант" in choice:
         st["awaiting_custom"] = "format"
-        await _render_ui(
+        await render_ui(
             cb.message,
             tg_id,
             "✍ Напиши свой вариант формата питания одним сообщением (например: “ем в столовой на работе”):",
@@ -182,8 +148,8 @@ async def nut_pick_format(cb: CallbackQuery):
     st["format"] = choice
     st["step"] = "done"
 
-    await _render_ui(cb.message, tg_id, "Формирую пример рациона…", reply_markup=None)
-    asyncio.create_task(_finish_nutrition(cb.message, tg_id))
+    await render_ui(cb.message, tg_id, "Формирую пример рациона…", reply_markup=None)
+    run_in_background(_finish_nutrition(cb.message, tg_id))
 
 
 # этот handler срабатывает ТОЛЬКО когда ждём custom
@@ -206,7 +172,7 @@ async def nut_custom_text(message: Message):
         st["step"] = "format"
 
         # после сообщения пользователя делаем новую UI, чтобы она была последней
-        await _render_ui(message, tg_id, "Выбери формат питания:", reply_markup=_kb("nut:fmt:", FORMAT_OPTIONS))
+        await render_ui(message, tg_id, "Выбери формат питания:", reply_markup=_kb("nut:fmt:", FORMAT_OPTIONS))
         return
 
     if awaiting == "format":
@@ -214,24 +180,12 @@ async def nut_custom_text(message: Message):
         st["awaiting_custom"] = None
         st["step"] = "done"
 
-        await _render_ui(message, tg_id, "Формирую пример рациона…", reply_markup=None)
-        asyncio.create_task(_finish_nutrition(message, tg_id))
+        await render_ui(message, tg_id, "Формирую пример рациона…", reply_markup=None)
+        run_in_background(_finish_nutrition(message, tg_id))
         return
 
 
-async def _finish_nutrition(message: Message, tg_id: int):
-    global ai
-    if ai is None:
-        await message.answer("AI не инициализирован. Проверь запуск main.py")
-        return
-
-    st = STATE_NUT.get(tg_id)
-    if not st:
-        return
-
-    calories = st.get("calories") or "не указано"
-    fmt = st.get("format") or "не указано"
-
+def _build_prompts(calories: str, fmt: str) -> tuple[str, str]:
     system_prompt = (
         "Твоя роль:\n"
         "Представь, что ты персональный AI-ассистент по питанию и образу жизни с 20-летним опытом работы с людьми. "
@@ -283,31 +237,114 @@ async def _finish_nutrition(message: Message, tg_id: int):
         f"Формат питания: “{fmt}”\n"
     )
 
-    try:
-        report = await ai.generate(system_prompt=system_prompt, user_text=user_text)
-    except Exception as e:
-        await _render_ui(message, tg_id, f"Не удалось получить рацион от AI.\n\n(Тех. причина: {e})", reply_markup=start_keyboard())
+    return system_prompt, user_text
+
+
+# все сочетания без "Свой вариант" — их можно сгенерировать заранее
+PRESETS = [(c, f) for c in CAL_OPTIONS[:-1] for f in FORMAT_OPTIONS[:-1]]
+
+
+async def _produce_preset(key: tuple[str, str]) -> str | None:
+    system_prompt, user_text = _build_prompts(*key)
+    # фон не должен отнимать слоты у живых пользователей
+    text = await get_scheduler().run(None, PRIORITY_BACKGROUND, lambda: ai.generate(
+        system_prompt=system_prompt, user_text=user_text, feature="nutrition_pool",
+    ))
+    return None if text == EMPTY_ANSWER else text
+
+
+def start_pool(size: int, concurrency: int, max_age_s: float) -> PlanPool | None:
+    """Запускает фоновое наполнение пула; вызывать после того, как задан ai."""
+    global pool
+    if size <= 0 or ai is None:
+        return None
+    pool = PlanPool(PRESETS, _produce_preset, size=size, concurrency=concurrency, max_age_s=max_age_s)
+    pool.start()
+    return pool
+
+
+async def _finish_nutrition(message: Message, tg_id: int):
+    global ai
+    if ai is None:
+        await message.answer("AI не инициализирован. Проверь запуск main.py")
         return
 
-    if not report or "пустой ответ" in report.lower():
-        await _render_ui(message, tg_id, report or "AI вернул пустой ответ. Попробуй ещё раз.", reply_markup=start_keyboard())
+    st = STATE_NUT.get(tg_id)
+    if not st:
         return
 
-    # списываем попытку только после успешного ответа
-    if not st.get("consumed"):
-        ok, msg = await consume_free_nutrition_use(tg_id, limit_per_week=3)
+    calories = st.get("calories") or "не указано"
+    fmt = st.get("format") or "не указано"
+
+    system_prompt, user_text = _build_prompts(calories, fmt)
+
+    # пресеты отдаём из пула сразу, остальное — генерируем с показом по мере готовности
+    report = pool.take((calories, fmt)) if pool else None
+    draft = None
+
+    if report:
+        # готовый рацион: попытка списывается обычным consume_free_nutrition_use.
+        # Если лимит успели исчерпать в параллельном запросе, взятый рацион
+        # пропадает — пул дольёт его в фоне
+        ok, msg = await consume_free_nutrition_use(tg_id)
         if not ok:
-            await _render_ui(message, tg_id, msg, reply_markup=start_keyboard(), parse_mode="Markdown")
+            await render_ui(message, tg_id, msg, reply_markup=main_menu_keyboard(), parse_mode="Markdown")
+            STATE_NUT.pop(tg_id, None)
+            return
+    else:
+        # генерация может не удаться, поэтому здесь попытку резервируем
+        # атомарно ДО запроса; если AI не ответит — вернём её
+        reservation, msg = await reserve_free_nutrition_use(tg_id)
+        if reservation is None:
+            await render_ui(message, tg_id, msg, reply_markup=main_menu_keyboard(), parse_mode="Markdown")
+            STATE_NUT.pop(tg_id, None)
+            return
+
+        try:
+            report, draft = await stream_to_message(
+                message,
+                get_scheduler().stream(tg_id, PRIORITY_FREE, lambda: ai.generate_stream(
+                    system_prompt=system_prompt, user_text=user_text, feature="nutrition", cache=True,
+                    tier="pro" if is_pro(tg_id) else "free",
+                )),
+                placeholder="🍽 Составляю рацион…",
+            )
+        except AIRequestCancelled:
+            await reservation.refund()
+            STATE_NUT.pop(tg_id, None)
+            return
+        except Exception as e:
+            # заготовку «Составляю рацион…» stream_to_message уже удалил
+            await reservation.refund()
+            await force_new_ui(
+                message, tg_id,
+                f"Не удалось получить рацион от AI.\n\n(Тех. причина: {e})",
+                reply_markup=main_menu_keyboard(),
+            )
             STATE_NUT.pop(tg_id, None)
             return
-        st["consumed"] = True
+
+        if not report:
+            await reservation.refund()
+            await draft.edit_text("AI вернул пустой ответ. Попробуй ещё раз.")
+            await force_new_ui(message, tg_id, "Выбери действие 👇", reply_markup=main_menu_keyboard())
+            STATE_NUT.pop(tg_id, None)
+            return
+
+        reservation.commit()
 
     report = await _format_nutrition_report(report)
 
-    # результат отдельным сообщением (остаётся)
-    await message.answer(report, parse_mode="Markdown")
+    # результат остаётся отдельным сообщением: финальный текст пишем в черновик
+    if draft is None:
+        await message.answer(report, parse_mode="Markdown")
+    else:
+        try:
+            await draft.edit_text(report, parse_mode="Markdown")
+        except TelegramBadRequest:
+            await message.answer(report, parse_mode="Markdown")
 
     # UI делаем последним сообщением
-    await _force_new_ui(message, tg_id, "Готово ✅\n\nВыбери действие 👇", reply_markup=start_keyboard())
+    await force_new_ui(message, tg_id, "Готово ✅\n\nВыбери действие 👇", reply_markup=main_menu_keyboard())
 
     STATE_NUT.pop(tg_id, None)
@@ -1,10 +1,11 @@
 from aiogram import Router, F
-from aiogram.types import CallbackQuery, Message
+from aiogram.types import CallbackQuery
 from aiogram.exceptions import TelegramBadRequest
 
 from app.ui.keyboards import main_menu_keyboard, pro_menu_keyboard, pro_locked_keyboard
 from app.services.access import is_pro
-from app.services.ui_session import set_ui_message, get_ui_message
+from app.services.ui_session import set_ui_message, render_ui
+from app.services.ai_scheduler import get_scheduler
 
 router = Router()
 
@@ -16,41 +17,16 @@ async def _safe_answer(cb: CallbackQuery):
         pass
 
 
-async def _render_ui(message: Message, tg_id: int, text: str, reply_markup=None):
-    ui = get_ui_message(tg_id)
-
-    if not ui:
-        sent = await message.answer(text, reply_markup=reply_markup)
-        set_ui_message(tg_id, sent.chat.id, sent.message_id)
-        return
-
-    chat_id, ui_msg_id = ui
-
-    if message.message_id and message.message_id > ui_msg_id:
-        sent = await message.answer(text, reply_markup=reply_markup)
-        set_ui_message(tg_id, sent.chat.id, sent.message_id)
-        return
-
-    try:
-        await message.bot.edit_message_text(
-            chat_id=chat_id,
-            message_id=ui_msg_id,
-            text=text,
-            reply_markup=reply_markup
-        )
-    except TelegramBadRequest as e:
-        if "message is not modified" in str(e):
-            return
-        raise
-
-
 @router.callback_query(F.data == "pro:home")
 async def pro_home(cb: CallbackQuery):
     await _safe_answer(cb)
     tg_id = cb.from_user.id
     set_ui_message(tg_id, cb.message.chat.id, cb.message.message_id)
 
-    await _render_ui(
+    # ушёл на главную — незачем дожидаться генерации
+    get_scheduler().cancel(tg_id)
+
+    await render_ui(
         cb.message,
         tg_id,
         "Главное меню 👇",
@@ -65,7 +41,7 @@ async def pro_menu(cb: CallbackQuery):
     set_ui_message(tg_id, cb.message.chat.id, cb.message.message_id)
 
     if not is_pro(tg_id):
-        await _render_ui(
+        await render_ui(
             cb.message,
             tg_id,
             "⭐ PRO раздел\n\nЧтобы открыть PRO-функции, нужна подписка.\n"
@@ -74,7 +50,7 @@ async def pro_menu(cb: CallbackQuery):
         )
         return
 
-    await _render_ui(
+    await render_ui(
         cb.message,
         tg_id,
         "⭐ PRO функции\n\nВыбери, что запустить 👇",
@@ -88,7 +64,7 @@ async def pro_buy(cb: CallbackQuery):
     tg_id = cb.from_user.id
     set_ui_message(tg_id, cb.message.chat.id, cb.message.message_id)
 
-    await _render_ui(
+    await render_ui(
         cb.message,
         tg_id,
         "Оплата/подписка будет подключена позже.\n\n"
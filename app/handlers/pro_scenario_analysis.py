@@ -1,4 +1,5 @@
 import asyncio
+import logging
 import re
 import html
 
@@ -8,15 +9,24 @@ from aiogram.exceptions import TelegramBadRequest
 from aiogram.dispatcher.event.bases import SkipHandler
 
 from app.services.access import is_pro
-from app.services.ui_session import set_ui_message, get_ui_message
+from app.services.ui_session import set_ui_message, force_new_ui, render_ui, run_in_background
 from app.ui.keyboards import pro_locked_keyboard
 from app.services.ai_provider import AIProvider
+from app.services.ai_scheduler import AIRequestCancelled, PRIORITY_BACKGROUND, PRIORITY_PRO, get_scheduler
+from app.services.single_flight import SingleFlight, input_hash
+from app.services.speculation import SpeculationPolicy
+from app.services.stream_delivery import stream_to_message
+from app.services.tg_outbound import PRIORITY_BULK, send_priority
 from app.storage.pro_scenario_store import (
-    get_scenario, upsert_stage1, upsert_stage2, upsert_stage3
+    get_scenario, upsert_stage1, upsert_stage2, upsert_stage3, claim_speculative, record_funnel
 )
 
+logger = logging.getLogger(__name__)
+
 router = Router()
 ai: AIProvider | None = None
+# заранее генерировать этапы 2/3 после этапа 1 (main.py включает по настройкам)
+speculation = SpeculationPolicy()
 
 DRY_RUN_NO_GPT = False
 
@@ -36,6 +46,16 @@ QUESTIONS = [
 
 STATE: dict[int, dict] = {}
 
+# идущие генерации этапов 2/3: ключ = пользователь + этап + хэш входа
+_flights = SingleFlight()
+# ключи из _flights, запущенные заранее (пользователь ещё не нажимал кнопку)
+_speculative: set[str] = set()
+
+
+def flight_stats() -> dict:
+    """Сколько генераций этапов 2/3 запущено и сколько нажатий к ним присоединилось."""
+    return _flights.stats()
+
 
 # ---------- UI helpers ----------
 
@@ -70,39 +90,6 @@ async def _safe_answer(cb: CallbackQuery):
         pass
 
 
-async def _render_ui(message: Message, tg_id: int, text: str, reply_markup=None):
-    ui = get_ui_message(tg_id)
-
-    if not ui:
-        sent = await message.answer(text, reply_markup=reply_markup)
-        set_ui_message(tg_id, sent.chat.id, sent.message_id)
-        return
-
-    chat_id, ui_msg_id = ui
-
-    if message.message_id and message.message_id > ui_msg_id:
-        sent = await message.answer(text, reply_markup=reply_markup)
-        set_ui_message(tg_id, sent.chat.id, sent.message_id)
-        return
-
-    try:
-        await message.bot.edit_message_text(
-            chat_id=chat_id,
-            message_id=ui_msg_id,
-            text=text,
-            reply_markup=reply_markup
-        )
-    except TelegramBadRequest as e:
-        if "message is not modified" in str(e):
-            return
-        raise
-
-
-async def _force_new_ui(message: Message, tg_id: int, text: str, reply_markup=None):
-    sent = await message.answer(text, reply_markup=reply_markup)
-    set_ui_message(tg_id, sent.chat.id, sent.message_id)
-
-
 async def _send_scenario_menu(message: Message):
     await message.answer("🧩 Меню «Сценарный анализ жизни»", reply_markup=scenario_menu_keyboard())
 
@@ -136,10 +123,28 @@ def sanitize_telegram_html(text: str) -> str:
     return out
 
 
-async def _send_long_html(message: Message, raw_html_text: str, limit: int = 3500):
+async def _send_long_html(message: Message, raw_html_text: str, limit: int = 3500, reuse: Message | None = None):
+    """
+    reuse — сообщение-черновик после стриминга: первый кусок пишем в него,
+    остальные отправляем новыми сообщениями.
+
+    Куски идут с низким приоритетом отправки, чтобы не тормозить кнопки других пользователей.
+    """
+    async def _emit(text: str):
+        nonlocal reuse
+        with send_priority(PRIORITY_BULK):
+            if reuse is not None:
+                draft, reuse = reuse, None
+                try:
+                    await draft.edit_text(text, parse_mode="HTML")
+                    return
+                except TelegramBadRequest:
+                    pass
+            await message.answer(text, parse_mode="HTML")
+
     safe = sanitize_telegram_html(raw_html_text).strip()
     if not safe:
-        await message.answer("Пустой ответ.")
+        await _emit("Пустой ответ.")
         return
 
     paragraphs = safe.split("\n\n")
@@ -156,17 +161,17 @@ async def _send_long_html(message: Message, raw_html_text: str, limit: int = 350
             continue
 
         if chunk:
-            await message.answer(chunk, parse_mode="HTML")
+            await _emit(chunk)
             chunk = p
         else:
             t = p
             while t:
-                await message.answer(t[:limit], parse_mode="HTML")
+                await _emit(t[:limit])
                 t = t[limit:]
             chunk = ""
 
     if chunk:
-        await message.answer(chunk, parse_mode="HTML")
+        await _emit(chunk)
 
 
 # ---------- prompts ----------
@@ -332,10 +337,10 @@ async def scenario_entry(cb: CallbackQuery):
     set_ui_message(tg_id, cb.message.chat.id, cb.message.message_id)
 
     if not is_pro(tg_id):
-        await _render_ui(cb.message, tg_id, "Эта функция доступна только в ⭐ PRO.", reply_markup=pro_locked_keyboard())
+        await render_ui(cb.message, tg_id, "Эта функция доступна только в ⭐ PRO.", reply_markup=pro_locked_keyboard())
         return
 
-    await _render_ui(
+    await render_ui(
         cb.message,
         tg_id,
         "🧩 Сценарный анализ жизни\n\n"
@@ -360,7 +365,7 @@ async def start_test(cb: CallbackQuery):
     set_ui_message(tg_id, cb.message.chat.id, cb.message.message_id)
 
     if not is_pro(tg_id):
-        await _render_ui(cb.message, tg_id, "Эта функция доступна только в ⭐ PRO.", reply_markup=pro_locked_keyboard())
+        await render_ui(cb.message, tg_id, "Эта функция доступна только в ⭐ PRO.", reply_markup=pro_locked_keyboard())
         return
 
     saved = await get_scenario(tg_id)
@@ -377,7 +382,7 @@ async def start_test(cb: CallbackQuery):
         return
 
     _init_user(tg_id)
-    await _render_ui(
+    await render_ui(
         cb.message,
         tg_id,
         f"{_question_text(0)}\n\nНапишите ответ (до {MAX_CUSTOM_CHARS} символов).",
@@ -392,19 +397,19 @@ async def back(cb: CallbackQuery):
     set_ui_message(tg_id, cb.message.chat.id, cb.message.message_id)
 
     if tg_id not in STATE:
-        await _render_ui(cb.message, tg_id, "🧩 Сценарный анализ жизни\n\nВыберите действие:", reply_markup=scenario_menu_keyboard())
+        await render_ui(cb.message, tg_id, "🧩 Сценарный анализ жизни\n\nВыберите действие:", reply_markup=scenario_menu_keyboard())
         return
 
     st = STATE[tg_id]
 
     if st["q"] <= 0:
-        await _render_ui(cb.message, tg_id, "🧩 Сценарный анализ жизни\n\nВыберите действие:", reply_markup=scenario_menu_keyboard())
+        await render_ui(cb.message, tg_id, "🧩 Сценарный анализ жизни\n\nВыберите действие:", reply_markup=scenario_menu_keyboard())
         return
 
     st["q"] -= 1
     q = st["q"]
 
-    await _render_ui(
+    await render_ui(
         cb.message,
         tg_id,
         f"{_question_text(q)}\n\nНапишите ответ (до {MAX_CUSTOM_CHARS} символов).",
@@ -436,12 +441,12 @@ async def handle_text(message: Message):
     st["q"] += 1
 
     if st["q"] >= len(QUESTIONS):
-        await _force_new_ui(message, tg_id, "Готово ✅\n\nЗапускаю Этап 1 (GPT)…")
-        asyncio.create_task(_finish_stage1(message, tg_id))
+        await force_new_ui(message, tg_id, "Готово ✅\n\nЗапускаю Этап 1 (GPT)…")
+        run_in_background(_finish_stage1(message, tg_id))
         return
 
     nq = st["q"]
-    await _force_new_ui(
+    await force_new_ui(
         message,
         tg_id,
         f"{_question_text(nq)}\n\nНапишите ответ (до {MAX_CUSTOM_CHARS} символов).",
@@ -472,24 +477,35 @@ async def _finish_stage1(message: Message, tg_id: int):
             await _send_scenario_menu(message)
             return
 
-        resp = await ai.generate(
-            system_prompt=prompt,
-            user_text="Сгенерируй ответ строго по формату. Не добавляй ничего кроме FULL и SUMMARY."
+        resp, draft = await stream_to_message(
+            message,
+            get_scheduler().stream(tg_id, PRIORITY_PRO, lambda: ai.generate_stream(
+                system_prompt=prompt,
+                user_text="Сгенерируй ответ строго по формату. Не добавляй ничего кроме FULL и SUMMARY.",
+                feature="scenario_stage1",
+                tier="pro",
+            )),
+            placeholder="✍ Этап 1: пишу анализ…",
+            preview=lambda t: _parse_between(t, "===FULL===", "===SUMMARY===") or "",
         )
 
         full = _parse_between(resp, "===FULL===", "===SUMMARY===")
         summary = _parse_between(resp, "===SUMMARY===", "")
 
         if not full:
-            await message.answer("❌ Не удалось распарсить FULL. Ниже сырой ответ:")
+            await draft.edit_text("❌ Не удалось распарсить FULL. Ниже сырой ответ:")
             await _send_long_html(message, resp)
             await _send_scenario_menu(message)
             return
 
         await upsert_stage1(tg_id=tg_id, qa=qa, analysis_full=full, analysis_short=summary)
 
-        await message.answer("✅ Этап 1 готов. Отправляю результат:")
-        await _send_long_html(message, full)
+        funnel = await record_funnel(tg_id, "stage1")
+        speculation.observe_stage1()
+        if summary and speculation.should_speculate(is_pro(tg_id), funnel):
+            run_in_background(_speculate(tg_id, summary))
+
+        await _send_long_html(message, full, reuse=draft)
 
         if summary:
             await message.answer("📌 Короткая выжимка:")
@@ -497,6 +513,10 @@ async def _finish_stage1(message: Message, tg_id: int):
 
         await _send_scenario_menu(message)
 
+    except AIRequestCancelled:
+        # пользователь ушёл на главную — меню уже показано
+        pass
+
     except Exception as e:
         await message.answer(f"❌ Ошибка при генерации Stage 1: {e}")
         await _send_scenario_menu(message)
@@ -505,67 +525,77 @@ async def _finish_stage1(message: Message, tg_id: int):
         STATE.pop(tg_id, None)
 
 
-@router.callback_query(F.data == f"{PREFIX}:stage2")
-async def stage2(cb: CallbackQuery):
-    await _safe_answer(cb)
-    tg_id = cb.from_user.id
-    set_ui_message(tg_id, cb.message.chat.id, cb.message.message_id)
+def _stage_text(saved: dict | None, stage: str, h: str) -> str | None:
+    """Сохранённый текст этапа, если он посчитан по текущей выжимке этапа 1."""
+    entry = (saved or {}).get(stage) or {}
+    # у старых записей хэша входа нет — считаем их актуальными
+    if entry.get("input", h) != h:
+        return None
+    return entry.get("text")
 
-    if not is_pro(tg_id):
-        await _render_ui(cb.message, tg_id, "Эта функция доступна только в ⭐ PRO.", reply_markup=pro_locked_keyboard())
-        return
 
-    saved = await get_scenario(tg_id)
-    summary = saved.get("stage1", {}).get("analysis_short") if saved else None
+# ---------- спекулятивная генерация этапов 2/3 ----------
 
-    if not summary:
-        await cb.message.answer("Сначала нужно пройти этап 1 (сценарный анализ).")
-        await _send_scenario_menu(cb.message)
-        return
+_STAGES = {
+    "stage2": (_build_stage2_system, _build_stage2_user, "===STAGE2===", upsert_stage2),
+    "stage3": (_build_stage3_system, _build_stage3_user, "===STAGE3===", upsert_stage3),
+}
 
-    existing = saved.get("stage2", {}).get("text") if saved else None
-    if existing:
-        await cb.message.answer("✅ Этап 2 уже рассчитан. Отправляю снова:")
-        await _send_long_html(cb.message, existing)
-        await _send_scenario_menu(cb.message)
-        return
 
-    if DRY_RUN_NO_GPT:
-        await cb.message.answer("Тестовый режим: GPT не вызываем.")
-        await _send_scenario_menu(cb.message)
-        return
+async def _generate_speculative(tg_id: int, summary: str, stage: str) -> str | None:
+    build_system, build_user, marker, upsert = _STAGES[stage]
+    system_prompt, user_text = build_system(summary), build_user()
 
-    if not ai:
-        await cb.message.answer("❌ AI не настроен (ai=None).")
-        await _send_scenario_menu(cb.message)
-        return
+    # фоновый приоритет: живые запросы пользователей идут раньше
+    resp = await get_scheduler().run(None, PRIORITY_BACKGROUND, lambda: ai.generate(
+        system_prompt=system_prompt, user_text=user_text, feature=f"scenario_{stage}_speculative", tier="pro",
+    ))
+    text = _parse_between(resp or "", marker, "")
+    if not text:
+        return None
 
-    system_prompt = _build_stage2_system(summary)
-    user_text = _build_stage2_user()
+    if await upsert(tg_id, text, speculative=True, input_hash=input_hash(summary)):
+        speculation.wasted += 1
+    speculation.generated += 1
+    return text
 
-    resp = await ai.generate(system_prompt=system_prompt, user_text=user_text)
-    text = _parse_between(resp, "===STAGE2===", "")
 
-    if not text:
-        await cb.message.answer("❌ Не удалось распарсить STAGE2. Ниже сырой ответ:")
-        await _send_long_html(cb.message, resp)
-        await _send_scenario_menu(cb.message)
+async def _speculate_stage(tg_id: int, summary: str, stage: str) -> None:
+    key = f"{tg_id}:{stage}:{input_hash(summary)}"
+    if _flights.in_flight(key):
         return
+    _speculative.add(key)
+    try:
+        await _flights.do(key, lambda: _generate_speculative(tg_id, summary, stage))
+    except Exception:
+        logger.exception("Не удалось заранее сгенерировать %s для %s", stage, tg_id)
+    finally:
+        _speculative.discard(key)
+
 
-    await upsert_stage2(tg_id, text)
-    await cb.message.answer("✅ Этап 2 готов:")
-    await _send_long_html(cb.message, text)
-    await _send_scenario_menu(cb.message)
+async def _speculate(tg_id: int, summary: str) -> None:
+    await asyncio.gather(*(_speculate_stage(tg_id, summary, stage) for stage in _STAGES))
+
+
+@router.callback_query(F.data == f"{PREFIX}:stage2")
+async def stage2(cb: CallbackQuery):
+    await _run_stage(cb, "stage2")
 
 
 @router.callback_query(F.data == f"{PREFIX}:stage3")
 async def stage3(cb: CallbackQuery):
+    await _run_stage(cb, "stage3")
+
+
+async def _run_stage(cb: CallbackQuery, stage: str):
+    """Общий handler этапов 2 и 3: готовый (в т.ч. заранее) текст или генерация по выжимке этапа 1."""
     await _safe_answer(cb)
     tg_id = cb.from_user.id
     set_ui_message(tg_id, cb.message.chat.id, cb.message.message_id)
+    title = f"Этап {stage.removeprefix('stage')}"
 
     if not is_pro(tg_id):
-        await _render_ui(cb.message, tg_id, "Эта функция доступна только в ⭐ PRO.", reply_markup=pro_locked_keyboard())
+        await render_ui(cb.message, tg_id, "Эта функция доступна только в ⭐ PRO.", reply_markup=pro_locked_keyboard())
         return
 
     saved = await get_scenario(tg_id)
@@ -576,9 +606,27 @@ async def stage3(cb: CallbackQuery):
         await _send_scenario_menu(cb.message)
         return
 
-    existing = saved.get("stage3", {}).get("text") if saved else None
+    await record_funnel(tg_id, stage)
+    speculation.observe_click()
+
+    h = input_hash(summary)
+    key = f"{tg_id}:{stage}:{h}"
+    if key in _speculative:
+        # этап уже генерируется заранее — дожидаемся его, а не запускаем второй запрос
+        await cb.message.answer(f"⏳ {title} почти готов, секунду…")
+        try:
+            await _flights.wait(key)
+        except Exception:
+            pass
+        saved = await get_scenario(tg_id)
+
+    existing = _stage_text(saved, stage, h)
     if existing:
-        await cb.message.answer("✅ Этап 3 уже рассчитан. Отправляю снова:")
+        if await claim_speculative(tg_id, stage):
+            speculation.hits += 1
+            await cb.message.answer(f"✅ {title} готов:")
+        else:
+            await cb.message.answer(f"✅ {title} уже рассчитан. Отправляю снова:")
         await _send_long_html(cb.message, existing)
         await _send_scenario_menu(cb.message)
         return
@@ -593,19 +641,45 @@ async def stage3(cb: CallbackQuery):
         await _send_scenario_menu(cb.message)
         return
 
-    system_prompt = _build_stage3_system(summary)
-    user_text = _build_stage3_user()
+    # повторные нажатия, пока идёт генерация, не запускают новый запрос
+    if _flights.in_flight(key):
+        await cb.message.answer(f"⏳ {title} уже генерируется — ответ придёт в этот чат.")
+        return
 
-    resp = await ai.generate(system_prompt=system_prompt, user_text=user_text)
-    text = _parse_between(resp, "===STAGE3===", "")
+    await _flights.do(key, lambda: _generate_stage(cb.message, tg_id, summary, stage))
 
-    if not text:
-        await cb.message.answer("❌ Не удалось распарсить STAGE3. Ниже сырой ответ:")
-        await _send_long_html(cb.message, resp)
-        await _send_scenario_menu(cb.message)
-        return
 
-    await upsert_stage3(tg_id, text)
-    await cb.message.answer("✅ Этап 3 готов:")
-    await _send_long_html(cb.message, text)
-    await _send_scenario_menu(cb.message)
+async def _generate_stage(message: Message, tg_id: int, summary: str, stage: str):
+    build_system, build_user, marker, upsert = _STAGES[stage]
+    system_prompt, user_text = build_system(summary), build_user()
+    title = f"Этап {stage.removeprefix('stage')}"
+
+    try:
+        resp, draft = await stream_to_message(
+            message,
+            get_scheduler().stream(tg_id, PRIORITY_PRO, lambda: ai.generate_stream(
+                system_prompt=system_prompt, user_text=user_text, feature=f"scenario_{stage}", tier="pro",
+            )),
+            placeholder=f"✍ {title}: пишу ответ…",
+            preview=lambda t: _parse_between(t, marker, ""),
+        )
+        text = _parse_between(resp, marker, "")
+
+        if not text:
+            await draft.edit_text(f"❌ Не удалось распарсить {stage.upper()}. Ниже сырой ответ:")
+            await _send_long_html(message, resp)
+            await _send_scenario_menu(message)
+            return
+
+        if await upsert(tg_id, text, input_hash=input_hash(summary)):
+            speculation.wasted += 1
+        await _send_long_html(message, text, reuse=draft)
+        await _send_scenario_menu(message)
+
+    except AIRequestCancelled:
+        # пользователь ушёл на главную — меню уже показано
+        pass
+
+    except Exception as e:
+        await message.answer(f"❌ Ошибка при генерации Stage {stage.removeprefix('stage')}: {e}")
+        await _send_scenario_menu(message)
@@ -3,7 +3,7 @@ from aiogram.filters import CommandStart, Command
 from aiogram.types import Message
 
 from app.ui.keyboards import main_menu_keyboard
-from app.services.ui_session import set_ui_message
+from app.services.ui_session import force_new_ui
 
 router = Router()
 
@@ -14,5 +14,4 @@ async def cmd_start(message: Message):
     tg_id = message.from_user.id
 
     # Всегда создаём новое меню и делаем его "последним UI"
-    sent = await message.answer("Главное меню 👇", reply_markup=main_menu_keyboard())
-    set_ui_message(tg_id, sent.chat.id, sent.message_id)
+    await force_new_ui(message, tg_id, "Главное меню 👇", reply_markup=main_menu_keyboard())
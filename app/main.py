@@ -1,45 +1,199 @@
 import asyncio
+from pathlib import Path
+
 from aiogram import Bot, Dispatcher
 
-from app.config import get_settings
+from app.config import get_settings, Settings
+from app.services.ai_cache import ResponseCache
+from app.services.ai_metrics import AIMetrics
 from app.services.ai_provider import AIProvider
+from app.services.ai_scheduler import AIScheduler, get_scheduler, set_scheduler
+from app.services.speculation import SpeculationPolicy
+from app.services.tg_outbound import OutboundScheduler
+from app.services.ui_session import UpdateOrderMiddleware, render_stats
+from app.ui.questionnaire import compile_all
 from app.handlers import mental_profile
+from app.handlers import nutrition_plan
 from app.handlers import pro_menu
 from app.handlers import start
 from app.handlers import pro_scenario_analysis
+from app.storage import users_store, pro_scenario_store
+from app.storage.backends import JsonFileBackend, ShardedJsonBackend
+from app.storage.cache import CachedBackend
+from app.storage.record_file import RecordFileBackend
+from app.storage.sqlite_backend import SqliteBackend
+from app.webhook import run_webhook
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _setup_storage(s: Settings):
+    if s.storage_backend == "sqlite":
+        db_path = Path(s.sqlite_path)
+        if not db_path.is_absolute():
+            db_path = PROJECT_ROOT / db_path
+        users_store.set_backend(SqliteBackend(db_path, table="users"))
+        scenario_backend = SqliteBackend(db_path, table="pro_scenario")
+    elif s.storage_backend == "records":
+        users_store.set_backend(RecordFileBackend(users_store.DATA_DIR / "users.rec"))
+        scenario_backend = RecordFileBackend(pro_scenario_store.BASE_DIR / "data" / "pro_scenario.rec")
+    elif s.pro_scenario_layout == "sharded":
+        # перед переключением: python -m app.storage.migrate_pro_scenario
+        scenario_backend = ShardedJsonBackend(pro_scenario_store.SHARDS_DIR)
+    else:
+        # JSON-файл и так целиком в памяти — LRU поверх него только тратит память
+        pro_scenario_store.set_backend(JsonFileBackend(
+            pro_scenario_store.DATA_PATH,
+            flush_interval_ms=s.storage_flush_interval_ms,
+            flush_max_changes=s.storage_flush_max_changes,
+        ))
+        return
+
+    # остальные backends читают с диска на каждый get — им нужен кэш разобранных записей
+    pro_scenario_store.set_backend(
+        CachedBackend(scenario_backend, max_bytes=s.scenario_cache_mb * 1024 * 1024)
+    )
+
+
+def _make_ai_cache(s: Settings) -> ResponseCache:
+    disk_dir = None
+    if s.ai_cache_dir:
+        disk_dir = Path(s.ai_cache_dir)
+        if not disk_dir.is_absolute():
+            disk_dir = PROJECT_ROOT / disk_dir
+    return ResponseCache(
+        ttl_s=s.ai_cache_ttl_s,
+        max_entries=s.ai_cache_max_entries,
+        variants=s.ai_cache_variants,
+        disk_dir=disk_dir,
+        disk_max_bytes=s.ai_cache_disk_max_mb * 1024 * 1024,
+    )
+
 
+def _make_ai_metrics(s: Settings) -> AIMetrics:
+    path = None
+    if s.ai_metrics_path:
+        path = Path(s.ai_metrics_path)
+        if not path.is_absolute():
+            path = PROJECT_ROOT / path
+    return AIMetrics(path)
+
+
+async def _close_storage():
+    # дописываем на диск всё, что ещё висит в group commit, и закрываем хранилища
+    for store in (users_store, pro_scenario_store):
+        try:
+            await store.flush()
+        finally:
+            await store.get_backend().close()
 
 
 async def main():
     s = get_settings()
+    _setup_storage(s)
 
     bot = Bot(token=s.bot_token)
+    # все отправки в чаты — через очередь с лимитами Telegram
+    outbound = OutboundScheduler(
+        global_rate=s.tg_global_rate,
+        chat_rate=s.tg_chat_rate,
+        chat_burst=s.tg_chat_burst,
+        max_retries=s.tg_max_retries,
+    )
+    bot.session.middleware(outbound)
     dp = Dispatcher()
+    # нумерация апдейтов: по ней render_ui отбрасывает устаревшие отрисовки панели
+    dp.update.outer_middleware(UpdateOrderMiddleware())
+
+    # все запросы к AI идут через общий планировщик с лимитами
+    set_scheduler(AIScheduler(max_concurrent=s.ai_max_concurrent, per_user=s.ai_max_per_user))
+
+    ai_metrics = _make_ai_metrics(s)
+    ai_metrics.start()
 
     # создаём AIProvider (общий)
     mental_profile.ai = AIProvider(
         api_key=s.proxyapi_key,
         base_url=s.proxyapi_base_url,
         model=s.gpt_model,
+        cache=_make_ai_cache(s),
+        timeout_s=s.ai_timeout_s,
+        first_token_timeout_s=s.ai_first_token_timeout_s,
+        max_retries=s.ai_max_retries,
+        hedge_percentile=s.ai_hedge_percentile,
+        metrics=ai_metrics,
+        http_limits={
+            "max_connections": s.ai_http_max_connections,
+            "max_keepalive": s.ai_http_max_keepalive,
+            "keepalive_expiry_s": s.ai_http_keepalive_expiry_s,
+            "http2": s.ai_http2,
+        },
     )
 
     pro_scenario_analysis.ai = mental_profile.ai
+    nutrition_plan.ai = mental_profile.ai
+    pro_scenario_analysis.speculation = SpeculationPolicy(
+        enabled=s.scenario_speculative,
+        min_ctr=s.scenario_speculative_min_ctr,
+        min_history=s.scenario_speculative_min_history,
+    )
+
+    # анкеты из config/*.yaml собираем до первого апдейта
+    compile_all()
 
     # подключаем роутеры
     dp.include_router(start.router)
     dp.include_router(pro_menu.router)
+    dp.include_router(nutrition_plan.router)
     dp.include_router(pro_scenario_analysis.router)
     dp.include_router(mental_profile.router)
 
+    # соединения с AI открываем до первого пользователя
+    await mental_profile.ai.warm_up(s.ai_warmup_connections)
 
-    
-
+    # пресеты рационов генерируются в фоне с низким приоритетом и занимают
+    # не больше половины слотов AI, чтобы живым запросам всегда было место
+    nutrition_plan.start_pool(
+        s.nutrition_pool_size,
+        concurrency=min(s.nutrition_pool_concurrency, max(1, s.ai_max_concurrent // 2)),
+        max_age_s=s.nutrition_pool_max_age_s,
+    )
 
-    # сбрасываем старые апдейты и отключаем webhook (если он был)
-    await bot.delete_webhook(drop_pending_updates=True)
+    try:
+        if s.bot_mode == "webhook":
+            print(f"🤖 Bot started, webhook on {s.webhook_host}:{s.webhook_port}{s.webhook_path}")
+            await run_webhook(
+                bot,
+                dp,
+                base_url=s.webhook_base_url,
+                path=s.webhook_path,
+                secret=s.webhook_secret,
+                host=s.webhook_host,
+                port=s.webhook_port,
+                queue_size=s.webhook_queue_size,
+                workers=s.webhook_workers,
+            )
+        else:
+            # сбрасываем старые апдейты и отключаем webhook (если он был)
+            await bot.delete_webhook(drop_pending_updates=True)
 
-    print("🤖 Bot started and polling Telegram...")
-    await dp.start_polling(bot, drop_pending_updates=True)
+            print("🤖 Bot started and polling Telegram...")
+            await dp.start_polling(bot, drop_pending_updates=True)
+    finally:
+        print(f"Telegram outbound: {outbound.stats()}, UI renders: {render_stats()}")
+        print(f"AI HTTP pool: {mental_profile.ai.http_stats.stats()}, AI calls: {mental_profile.ai.stats()}")
+        print(f"AI cache: {mental_profile.ai.cache.stats()}, AI scheduler: {get_scheduler().stats()}")
+        print(
+            f"Scenario speculation: {pro_scenario_analysis.speculation.stats()}, "
+            f"stage flights: {pro_scenario_analysis.flight_stats()}"
+        )
+        if nutrition_plan.pool is not None:
+            print(f"Nutrition pool: {nutrition_plan.pool.stats()}")
+            await nutrition_plan.pool.stop()
+        await outbound.stop()
+        await mental_profile.ai.aclose()
+        await ai_metrics.stop()
+        await _close_storage()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from app.storage.io import run_io, write_atomic
+
+logger = logging.getLogger(__name__)
+
+# как часто проверяем дисковый уровень на просроченные файлы и превышение объёма
+DISK_SWEEP_INTERVAL_S = 600
+
+
+class _Entry:
+    __slots__ = ("created", "variants")
+
+    def __init__(self, created: float, variants: list[str]):
+        self.created = created
+        self.variants = variants
+
+
+class ResponseCache:
+    """
+    Кэш ответов AI по хэшу (модель + нормализованные сообщения + параметры).
+
+    - TTL и LRU-ограничение по числу ключей в памяти;
+    - опциональный дисковый уровень (disk_dir): переживает перезапуск;
+      раз в DISK_SWEEP_INTERVAL_S из него удаляются просроченные файлы, а если
+      он больше disk_max_bytes — самые давно записанные, до 90% лимита;
+    - variants=N: на ключ копим до N разных ответов и только потом начинаем
+      отдавать из кэша случайный из них, чтобы повторный запрос не получал тот же текст.
+
+    Счётчики попаданий ведутся по фичам (feature), см. stats().
+    """
+
+    def __init__(
+        self,
+        ttl_s: int = 86400,
+        max_entries: int = 1000,
+        variants: int = 1,
+        disk_dir: Path | None = None,
+        disk_max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.variants = max(1, variants)
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self._mem: OrderedDict[str, _Entry] = OrderedDict()
+        self._swept_at = 0.0
+        self._sweep_task: asyncio.Task | None = None
+        self.disk_evicted = 0
+        # feature -> [hits, misses]
+        self._counters: dict[str, list[int]] = {}
+
+    # ---------- ключ ----------
+
+    @staticmethod
+    def make_key(model: str, messages: list[dict], params: dict) -> str:
+        normalized = [
+            {"role": m["role"], "content": " ".join((m.get("content") or "").split())}
+            for m in messages
+        ]
+        raw = json.dumps({"model": model, "messages": normalized, "params": params}, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ---------- диск ----------
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _read_disk(self, key: str) -> _Entry | None:
+        try:
+            data = json.loads(self._disk_path(key).read_text(encoding="utf-8"))
+            return _Entry(float(data["created"]), [str(v) for v in data["variants"]])
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_disk(self, key: str, entry: _Entry) -> None:
+        payload = json.dumps({"created": entry.created, "variants": entry.variants}, ensure_ascii=False)
+        write_atomic(self._disk_path(key), payload, durable=False)
+
+    def _delete_disk(self, key: str) -> None:
+        try:
+            self._disk_path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _sweep_disk(self) -> int:
+        """
+        Удаляет просроченные файлы и, если нужно, самые давно записанные сверх лимита.
+        Срок считаем по mtime: created не позже последней записи, так что
+        удаляются только точно просроченные (остальные уберёт _entry при чтении).
+        """
+        now = time.time()
+        removed = 0
+        files = []
+        for path in self.disk_dir.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - st.st_mtime > self.ttl_s:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                files.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        if total > self.disk_max_bytes:
+            files.sort()
+            target = self.disk_max_bytes * 0.9
+            for _, size, path in files:
+                if total <= target:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                removed += 1
+
+        # пустые каталоги-префиксы не копим
+        for prefix in self.disk_dir.iterdir():
+            if prefix.is_dir():
+                try:
+                    os.rmdir(prefix)
+                except OSError:
+                    pass
+        return removed
+
+    async def _sweep(self) -> None:
+        try:
+            self.disk_evicted += await run_io(self._sweep_disk)
+        except Exception:
+            logger.exception("Не удалось почистить дисковый кэш AI в %s", self.disk_dir)
+
+    def _maybe_sweep(self) -> None:
+        now = time.monotonic()
+        if now - self._swept_at < DISK_SWEEP_INTERVAL_S:
+            return
+        if self._sweep_task is not None and not self._sweep_task.done():
+            return
+        self._swept_at = now
+        self._sweep_task = asyncio.get_running_loop().create_task(self._sweep())
+
+    # ---------- API ----------
+
+    def _count(self, feature: str, hit: bool) -> None:
+        c = self._counters.setdefault(feature, [0, 0])
+        c[0 if hit else 1] += 1
+
+    def _expired(self, entry: _Entry) -> bool:
+        return time.time() - entry.created > self.ttl_s
+
+    async def _entry(self, key: str) -> _Entry | None:
+        entry = self._mem.get(key)
+        if entry is None and self.disk_dir is not None:
+            entry = await run_io(self._read_disk, key)
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is not None and self._expired(entry):
+            self._mem.pop(key, None)
+            if self.disk_dir is not None:
+                await run_io(self._delete_disk, key)
+            return None
+        return entry
+
+    def _remember(self, key: str, entry: _Entry) -> None:
+        self._mem[key] = entry
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    async def get(self, key: str, feature: str) -> str | None:
+        entry = await self._entry(key)
+        if entry is not None and len(entry.variants) >= self.variants:
+            self._mem.move_to_end(key)
+            self._count(feature, hit=True)
+            return random.choice(entry.variants)
+        self._count(feature, hit=False)
+        return None
+
+    async def put(self, key: str, text: str) -> None:
+        entry = await self._entry(key)
+        if entry is None:
+            entry = _Entry(time.time(), [])
+        if text not in entry.variants:
+            entry.variants.append(text)
+            del entry.variants[:-self.variants]
+        self._remember(key, entry)
+        if self.disk_dir is not None:
+            await run_io(self._write_disk, key, entry)
+            self._maybe_sweep()
+
+    def stats(self) -> dict[str, dict]:
+        out = {}
+        for feature, (hits, misses) in sorted(self._counters.items()):
+            total = hits + misses
+            out[feature] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": round(hits / total, 4) if total else 0.0,
+            }
+        return out
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import logging
+import time
+
+import httpx
+from openai import DefaultAsyncHttpxClient
+
+logger = logging.getLogger(__name__)
+
+
+class HttpPoolStats:
+    """
+    Повторное использование соединений и время до первого байта по событиям
+    httpcore (расширение trace): новое соединение = был connect_tcp.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self._ttfb_ms: list[float] = []
+
+    async def on_request(self, request: httpx.Request) -> None:
+        self.requests += 1
+        sent_at: list[float] = []
+
+        async def trace(event: str, info: dict) -> None:
+            if event == "connection.connect_tcp.complete":
+                self.new_connections += 1
+            elif event == "connection.start_tls.complete":
+                self.tls_handshakes += 1
+            elif event.endswith("send_request_headers.started"):
+                sent_at.append(time.perf_counter())
+            elif event.endswith("receive_response_headers.complete") and sent_at:
+                self._ttfb_ms.append((time.perf_counter() - sent_at[0]) * 1000)
+                if len(self._ttfb_ms) > 1000:
+                    del self._ttfb_ms[:500]
+
+        request.extensions["trace"] = trace
+
+    def stats(self) -> dict:
+        ordered = sorted(self._ttfb_ms)
+
+        def pct(q: float) -> float | None:
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 1) if ordered else None
+
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "tls_handshakes": self.tls_handshakes,
+            "reuse_rate": round(1 - self.new_connections / self.requests, 4) if self.requests else None,
+            "ttfb_p50_ms": pct(0.50),
+            "ttfb_p95_ms": pct(0.95),
+        }
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def make_http_client(
+    max_connections: int = 32,
+    max_keepalive: int = 16,
+    keepalive_expiry_s: float = 60.0,
+    http2: bool = False,
+    timeout_s: float = 180.0,
+    stats: HttpPoolStats | None = None,
+) -> httpx.AsyncClient:
+    """Общий httpx-клиент для AsyncOpenAI с явными лимитами пула."""
+    if http2 and not _h2_available():
+        logger.warning("AI_HTTP2 включён, но пакет h2 не установлен (pip install httpx[http2]) — работаем по HTTP/1.1")
+        http2 = False
+
+    return DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry_s,
+        ),
+        http2=http2,
+        timeout=httpx.Timeout(timeout_s, connect=10.0),
+        event_hooks={"request": [stats.on_request]} if stats else None,
+    )
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.storage.io import run_io
+
+logger = logging.getLogger(__name__)
+
+# границы корзин задержки, мс: геометрическая сетка 50 мс … ~5 минут
+BUCKETS_MS = [int(50 * 1.25 ** i) for i in range(40)]
+
+
+@dataclass
+class CallRecord:
+    feature: str
+    tier: str
+    model: str
+    wall_ms: int
+    ok: bool = True
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    # проигравший или отменённый запрос хеджа: токены считаем, задержку — нет
+    hedge: bool = False
+
+    def to_line(self, ts: float) -> str:
+        # короткие ключи — файл растёт на каждый вызов AI
+        row = {
+            "t": int(ts), "f": self.feature, "u": self.tier, "m": self.model, "ms": self.wall_ms,
+            "p": self.prompt_tokens, "c": self.completion_tokens, "k": self.cached_tokens,
+        }
+        if not self.ok:
+            row["e"] = 1
+        if self.hedge:
+            row["h"] = 1
+        return json.dumps(row, ensure_ascii=False, separators=(",", ":"))
+
+
+class _Window:
+    __slots__ = ("start", "counts", "calls", "errors", "hedge_losers", "prompt", "completion", "cached")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.calls = 0
+        self.errors = 0
+        self.hedge_losers = 0
+        self.prompt = 0
+        self.completion = 0
+        self.cached = 0
+
+
+class RollingHistogram:
+    """Гистограмма задержек и суммы токенов за последние keep окон по window_s секунд."""
+
+    def __init__(self, window_s: int = 3600, keep: int = 24):
+        self.window_s = window_s
+        self._windows: deque[_Window] = deque(maxlen=keep)
+
+    def _current(self, now: float) -> _Window:
+        start = now - now % self.window_s
+        if not self._windows or self._windows[-1].start != start:
+            self._windows.append(_Window(start))
+        return self._windows[-1]
+
+    def add(self, rec: CallRecord, now: float) -> None:
+        w = self._current(now)
+        if rec.hedge:
+            w.hedge_losers += 1
+        else:
+            w.counts[bisect.bisect_left(BUCKETS_MS, rec.wall_ms)] += 1
+            w.calls += 1
+            w.errors += 0 if rec.ok else 1
+        w.prompt += rec.prompt_tokens
+        w.completion += rec.completion_tokens
+        w.cached += rec.cached_tokens
+
+    def summary(self, now: float) -> dict:
+        horizon = now - self.window_s * self._windows.maxlen
+        live = [w for w in self._windows if w.start > horizon]
+        counts = [sum(c) for c in zip(*(w.counts for w in live))] if live else []
+        total = sum(counts)
+
+        def pct(q: float) -> int | None:
+            if not total:
+                return None
+            need = q * total
+            acc = 0
+            for i, c in enumerate(counts):
+                acc += c
+                if acc >= need:
+                    # верхняя граница корзины; последняя корзина — «больше максимума»
+                    return BUCKETS_MS[i] if i < len(BUCKETS_MS) else BUCKETS_MS[-1]
+            return BUCKETS_MS[-1]
+
+        return {
+            "calls": sum(w.calls for w in live),
+            "errors": sum(w.errors for w in live),
+            "hedge_losers": sum(w.hedge_losers for w in live),
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "prompt_tokens": sum(w.prompt for w in live),
+            "completion_tokens": sum(w.completion for w in live),
+            "cached_tokens": sum(w.cached for w in live),
+        }
+
+
+class AIMetrics:
+    """
+    Учёт каждого вызова AI: токены, время, модель, фича и тариф пользователя.
+
+    В памяти — скользящие гистограммы (по умолчанию 24 часа по часу) для stats().
+    На диск (если задан path) — строка JSON на вызов в append-only файл;
+    пишем пачками из фоновой задачи. Отчёт: python -m app.services.ai_metrics_report
+    """
+
+    def __init__(self, path: Path | None = None, window_s: int = 3600, keep: int = 24):
+        self.path = path
+        self._window_s = window_s
+        self._keep = keep
+        self._hist: dict[tuple[str, str], RollingHistogram] = {}
+        self._pending: list[str] = []
+        self._task: asyncio.Task | None = None
+
+    def record(self, rec: CallRecord) -> None:
+        now = time.time()
+        key = (rec.feature, rec.tier)
+        hist = self._hist.get(key)
+        if hist is None:
+            hist = self._hist[key] = RollingHistogram(self._window_s, self._keep)
+        hist.add(rec, now)
+        if self.path is not None:
+            self._pending.append(rec.to_line(now))
+
+    def stats(self) -> dict[str, dict]:
+        now = time.time()
+        return {f"{feature}:{tier}": h.summary(now) for (feature, tier), h in sorted(self._hist.items())}
+
+    # ---------- запись на диск ----------
+
+    def _append(self, lines: list[str]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        try:
+            await run_io(self._append, lines)
+        except Exception:
+            # метрики не должны ронять бота; вернём строки и попробуем позже
+            self._pending[:0] = lines
+            logger.exception("Не удалось записать метрики AI в %s", self.path)
+
+    async def _flush_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    def start(self, interval_s: float = 5.0) -> None:
+        if self.path is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop(interval_s))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
@@ -0,0 +1,111 @@
+"""
+Сводка по вызовам AI из файла метрик (см. AIMetrics).
+
+Запуск из корня проекта:
+    python -m app.services.ai_metrics_report --path data/ai_metrics.jsonl --days 7
+
+По каждой паре фича/тариф: число вызовов, ошибки, p50/p95 задержки
+и токены в среднем за день.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+
+def _pct(ordered: list[int], q: float) -> int | None:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def summarize(path: Path, days: float | None = None) -> dict:
+    since = time.time() - days * 86400 if days else 0
+    rows: dict[str, dict] = defaultdict(lambda: {"ms": [], "errors": 0, "hedges": 0, "p": 0, "c": 0, "k": 0})
+    first = last = None
+
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except ValueError:
+                # недописанная последняя строка после падения
+                continue
+            if r["t"] < since:
+                continue
+            first = r["t"] if first is None else min(first, r["t"])
+            last = r["t"] if last is None else max(last, r["t"])
+
+            row = rows[f'{r["f"]}:{r["u"]}']
+            if r.get("h"):
+                # проигравший запрос хеджа: только токены
+                row["hedges"] += 1
+            else:
+                row["ms"].append(r["ms"])
+                row["errors"] += r.get("e", 0)
+            row["p"] += r.get("p", 0)
+            row["c"] += r.get("c", 0)
+            row["k"] += r.get("k", 0)
+
+    if first is None:
+        return {"days": 0, "features": {}}
+
+    span_days = days or max(1, math.ceil((last - first) / 86400))
+    out = {}
+    for key, row in sorted(rows.items()):
+        ordered = sorted(row["ms"])
+        tokens = row["p"] + row["c"]
+        out[key] = {
+            "calls": len(ordered),
+            "errors": row["errors"],
+            "hedge_losers": row["hedges"],
+            "p50_ms": _pct(ordered, 0.50),
+            "p95_ms": _pct(ordered, 0.95),
+            "prompt_tokens": row["p"],
+            "completion_tokens": row["c"],
+            "cached_tokens": row["k"],
+            "tokens_per_day": round(tokens / span_days),
+        }
+    return {"days": span_days, "features": out}
+
+
+def _print_table(report: dict) -> None:
+    print(f"Период: {report['days']} дн.")
+    header = f"{'фича:тариф':<36}{'вызовы':>8}{'ошибки':>8}{'p50 мс':>9}{'p95 мс':>9}{'токены/день':>13}"
+    print(header)
+    print("-" * len(header))
+    for key, r in report["features"].items():
+        print(
+            f"{key:<36}{r['calls']:>8}{r['errors']:>8}{r['p50_ms'] or '-':>9}"
+            f"{r['p95_ms'] or '-':>9}{r['tokens_per_day']:>13}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default="data/ai_metrics.jsonl")
+    parser.add_argument("--days", type=float, default=None, help="только последние N дней (по умолчанию весь файл)")
+    parser.add_argument("--json", action="store_true", help="вывести JSON вместо таблицы")
+    args = parser.parse_args()
+
+    path = Path(args.path)
+    if not path.is_absolute():
+        path = PROJECT_ROOT / path
+    if not path.exists():
+        print(f"Файл метрик не найден: {path}", file=sys.stderr)
+        sys.exit(1)
+
+    report = summarize(path, args.days)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_table(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,329 @@
 from __future__ import annotations
 
-from typing import Optional
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import AsyncIterator, Optional
 
 from openai import AsyncOpenAI
 
+from app.services.ai_cache import ResponseCache
+from app.services.ai_http import HttpPoolStats, make_http_client
+from app.services.ai_metrics import AIMetrics, CallRecord
+from app.services.ai_retry import LatencyWindow, backoff_delay, hedged, is_retryable
+
+logger = logging.getLogger(__name__)
+
+EMPTY_ANSWER = "AI вернул пустой ответ. Попробуй ещё раз (или чуть позже)."
+
+# пока замеров меньше, порог хеджирования не считаем
+HEDGE_MIN_SAMPLES = 20
+
 
 class AIProvider:
-    def __init__(self, api_key: str, base_url: str, model: str):
-        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+    """
+    timeout_s — дедлайн одного запроса (для потока — на весь поток);
+    first_token_timeout_s — сколько ждём первый кусок потока;
+    max_retries — повторы для временных ошибок (429/5xx/сеть/таймаут);
+    hedge_percentile — если ответа нет дольше этого перцентиля задержек фичи,
+    параллельно шлём второй такой же запрос и берём первый (0 — выключено).
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        model: str,
+        cache: ResponseCache | None = None,
+        timeout_s: float = 180.0,
+        first_token_timeout_s: float = 30.0,
+        max_retries: int = 2,
+        hedge_percentile: float = 0.0,
+        metrics: AIMetrics | None = None,
+        http_limits: dict | None = None,
+    ):
+        # свой пул соединений: лимиты под нашу конкуренцию + статистика переиспользования
+        self.http_stats = HttpPoolStats()
+        http_client = make_http_client(timeout_s=timeout_s, stats=self.http_stats, **(http_limits or {}))
+        # повторы делаем сами, чтобы считать их и не повторять поверх хеджа
+        self.client = AsyncOpenAI(
+            api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout_s, http_client=http_client,
+        )
         self.model = model
+        self.cache = cache
+        # для GPT-5 корректнее max_completion_tokens
+        self.params = {"max_completion_tokens": 4000, "temperature": 0.7}
+
+        self.timeout_s = timeout_s
+        self.first_token_timeout_s = first_token_timeout_s
+        self.max_retries = max_retries
+        self.hedge_percentile = hedge_percentile
+        self.metrics = metrics
 
-    async def generate(self, system_prompt: str, user_text: str) -> str:
+        self._latency: dict[tuple[str, str], LatencyWindow] = {}
+        self._counters: dict[str, Counter] = {}
+
+    async def warm_up(self, connections: int = 2) -> None:
         """
-        Возвращает строку. Если модель вернула пусто — вернём понятную ошибку.
+        Открывает соединения заранее (DNS + TCP + TLS), чтобы первый пользователь
+        не платил за них. Любой ответ API, даже ошибка, уже оставляет соединение в пуле.
         """
-        resp = await self.client.chat.completions.create(
+        async def _one():
+            try:
+                await asyncio.wait_for(self.client.models.list(), timeout=10)
+            except Exception:
+                pass
+
+        started = time.monotonic()
+        await asyncio.gather(*(_one() for _ in range(max(0, connections))))
+        logger.info(
+            "AI warm-up: %s соединений за %.0f мс",
+            self.http_stats.new_connections, (time.monotonic() - started) * 1000,
+        )
+
+    async def aclose(self) -> None:
+        await self.client.close()
+
+    def _messages(self, system_prompt: str, user_text: str) -> list[dict]:
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_text},
+        ]
+
+    def _cache_key(self, messages: list[dict], cache: bool) -> str | None:
+        if not cache or self.cache is None:
+            return None
+        return ResponseCache.make_key(self.model, messages, self.params)
+
+    # ---------- метрики ----------
+
+    def _count(self, feature: str, name: str) -> None:
+        self._counters.setdefault(feature, Counter())[name] += 1
+
+    def _observe(self, feature: str, kind: str, seconds: float) -> None:
+        self._latency.setdefault((feature, kind), LatencyWindow()).add(seconds)
+
+    def _hedge_after(self, feature: str, kind: str) -> float | None:
+        if not self.hedge_percentile:
+            return None
+        window = self._latency.get((feature, kind))
+        if window is None or len(window) < HEDGE_MIN_SAMPLES:
+            return None
+        return window.percentile(self.hedge_percentile)
+
+    def _account(self, feature: str, tier: str, started: float, ok: bool, usage=None, hedge: bool = False) -> None:
+        if self.metrics is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.metrics.record(CallRecord(
+            feature=feature,
+            tier=tier,
             model=self.model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_text},
-            ],
-            # для GPT-5 корректнее max_completion_tokens
-            max_completion_tokens=4000,
-            temperature=0.7,
+            wall_ms=int((time.monotonic() - started) * 1000),
+            ok=ok,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            cached_tokens=getattr(details, "cached_tokens", 0) or 0,
+            hedge=hedge,
+        ))
+
+    def stats(self) -> dict[str, dict]:
+        """feature -> calls / retries / timeouts / hedges / hedge_wins / failures."""
+        return {feature: dict(c) for feature, c in sorted(self._counters.items())}
+
+    # ---------- повторы ----------
+
+    async def _with_retries(self, feature: str, attempt):
+        for n in range(self.max_retries + 1):
+            try:
+                return await attempt()
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self._count(feature, "timeouts")
+                if n >= self.max_retries or not is_retryable(e):
+                    self._count(feature, "failures")
+                    raise
+                self._count(feature, "retries")
+                await asyncio.sleep(backoff_delay(n, e))
+
+    async def _hedged(self, feature: str, tier: str, kind: str, make, discard=None):
+        """
+        make(attempt) — одна попытка; в attempt["usage"] она кладёт usage, когда он известен.
+        Возвращает (результат, attempt победителя).
+        """
+        attempts: list[dict] = []
+
+        def start():
+            attempt = {"started": time.monotonic(), "usage": None}
+            attempts.append(attempt)
+            return make(attempt)
+
+        def on_hedge():
+            self._count(feature, "hedges")
+
+        won = None
+        try:
+            result, hedge_won = await hedged(start, self._hedge_after(feature, kind), on_hedge=on_hedge, discard=discard)
+            won = attempts[-1] if hedge_won else attempts[0]
+        finally:
+            # отменённый запрос тоже мог стоить токенов — пишем его отдельной строкой метрик;
+            # если упали все, ошибку основного учтёт вызывающий код
+            for attempt in attempts if won is not None else attempts[1:]:
+                if attempt is not won:
+                    self._account(feature, tier, attempt["started"], ok=False, usage=attempt["usage"], hedge=True)
+        if hedge_won:
+            self._count(feature, "hedge_wins")
+        return result, won
+
+    # ---------- обычный запрос ----------
+
+    async def _complete(self, feature: str, messages: list[dict], attempt: dict) -> str:
+        started = time.monotonic()
+        resp = await asyncio.wait_for(
+            self.client.chat.completions.create(model=self.model, messages=messages, **self.params),
+            timeout=self.timeout_s,
         )
+        self._observe(feature, "total", time.monotonic() - started)
 
         content: Optional[str] = None
         if resp and resp.choices:
             msg = resp.choices[0].message
             content = (msg.content or "").strip() if msg else ""
+        attempt["usage"] = getattr(resp, "usage", None)
+        return content or ""
+
+    async def generate(
+        self, system_prompt: str, user_text: str, feature: str = "default", cache: bool = False, tier: str = "free"
+    ) -> str:
+        """
+        Возвращает строку. Если модель вернула пусто — вернём понятную ошибку.
+        cache=True — ответ можно взять из кэша (только для не персональных запросов).
+        tier — тариф пользователя для учёта расходов (free / pro).
+        """
+        messages = self._messages(system_prompt, user_text)
+        key = self._cache_key(messages, cache)
+        if key:
+            cached = await self.cache.get(key, feature)
+            if cached is not None:
+                return cached
+
+        self._count(feature, "calls")
+        started = time.monotonic()
+        try:
+            content, attempt = await self._with_retries(
+                feature,
+                lambda: self._hedged(feature, tier, "total", lambda a: self._complete(feature, messages, a)),
+            )
+        except BaseException:
+            self._account(feature, tier, started, ok=False)
+            raise
+        self._account(feature, tier, started, ok=True, usage=attempt["usage"])
 
         if not content:
-            return "AI вернул пустой ответ. Попробуй ещё раз (или чуть позже)."
+            return EMPTY_ANSWER
 
+        if key:
+            await self.cache.put(key, content)
         return content
+
+    # ---------- поток ----------
+
+    async def _deltas(self, stream, attempt: dict) -> AsyncIterator[str]:
+        try:
+            async for chunk in stream:
+                # с include_usage последний кусок несёт usage и пустой choices
+                if getattr(chunk, "usage", None) is not None:
+                    attempt["usage"] = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta and delta.content:
+                    yield delta.content
+        finally:
+            await stream.close()
+
+    async def _open_stream(self, feature: str, messages: list[dict], attempt: dict) -> tuple[AsyncIterator[str], str | None]:
+        """Открывает поток и дожидается первого куска (None — модель ответила пусто)."""
+        started = time.monotonic()
+
+        async def _first():
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **self.params,
+            )
+            it = self._deltas(stream, attempt)
+            try:
+                return it, await anext(it, None)
+            except BaseException:
+                await it.aclose()
+                raise
+
+        it, first = await asyncio.wait_for(_first(), timeout=self.first_token_timeout_s)
+        self._observe(feature, "first_token", time.monotonic() - started)
+        return it, first
+
+    @staticmethod
+    async def _close_opened(opened: tuple[AsyncIterator[str], str | None]) -> None:
+        await opened[0].aclose()
+
+    async def generate_stream(
+        self, system_prompt: str, user_text: str, feature: str = "default", cache: bool = False, tier: str = "free"
+    ) -> AsyncIterator[str]:
+        """
+        То же, что generate(), но отдаёт текст кусками по мере генерации.
+        Пустой ответ = ни одного куска; проверку делает вызывающий код.
+        Ответ из кэша приходит одним куском.
+
+        Повторы и хедж — только до первого куска: начатый ответ уже у пользователя.
+        """
+        messages = self._messages(system_prompt, user_text)
+        key = self._cache_key(messages, cache)
+        if key:
+            cached = await self.cache.get(key, feature)
+            if cached is not None:
+                yield cached
+                return
+
+        self._count(feature, "calls")
+        started = time.monotonic()
+        deadline = started + self.timeout_s
+
+        ok = False
+        try:
+            (it, first), attempt = await self._with_retries(
+                feature,
+                lambda: self._hedged(
+                    feature, tier, "first_token",
+                    lambda a: self._open_stream(feature, messages, a),
+                    discard=self._close_opened,
+                ),
+            )
+        except BaseException:
+            self._account(feature, tier, started, ok=False)
+            raise
+
+        parts: list[str] = []
+        try:
+            chunk = first
+            while chunk is not None:
+                parts.append(chunk)
+                yield chunk
+                try:
+                    chunk = await asyncio.wait_for(anext(it, None), timeout=max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    self._count(feature, "timeouts")
+                    raise
+            ok = True
+        finally:
+            await it.aclose()
+            # usage потока приходит последним куском — берём из попытки-победителя
+            self._account(feature, tier, started, ok=ok, usage=attempt["usage"])
+
+        # в кэш кладём только полностью дочитанный непустой ответ
+        content = "".join(parts).strip()
+        if key and content:
+            await self.cache.put(key, content)
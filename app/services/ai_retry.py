@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import asyncio
+import random
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+from openai import APIConnectionError, APIStatusError
+
+T = TypeVar("T")
+
+# 408/409 — таймаут/конфликт на стороне прокси, 429 — лимит, 5xx — сбой апстрима
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+BACKOFF_BASE_S = 0.5
+BACKOFF_CAP_S = 8.0
+
+
+def is_retryable(e: BaseException) -> bool:
+    # APITimeoutError — подкласс APIConnectionError
+    if isinstance(e, (asyncio.TimeoutError, APIConnectionError)):
+        return True
+    return isinstance(e, APIStatusError) and e.status_code in RETRYABLE_STATUS
+
+
+def backoff_delay(attempt: int, e: BaseException | None = None) -> float:
+    """
+    Экспоненциальная задержка с полным джиттером: случайно в [0, base * 2^attempt].
+    Если сервер прислал Retry-After — ждём столько (но не дольше BACKOFF_CAP_S).
+    """
+    response = getattr(e, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(BACKOFF_CAP_S, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * (2 ** attempt)))
+
+
+class LatencyWindow:
+    """Последние N замеров задержки — для порога хеджирования."""
+
+    def __init__(self, size: int = 200):
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> float | None:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def hedged(
+    make: Callable[[], Awaitable[T]],
+    after_s: float | None,
+    on_hedge: Callable[[], None] | None = None,
+    discard: Callable[[T], Awaitable[None]] | None = None,
+) -> tuple[T, bool]:
+    """
+    Запускает make(); если за after_s ответа нет — запускает второй такой же запрос.
+    Берём первый успешный, проигравший отменяем (discard — как освободить
+    результат, если он всё-таки успел прийти).
+
+    Возвращает (результат, выиграл_ли_хедж).
+    """
+    tasks = [asyncio.ensure_future(make())]
+    winner = None
+    try:
+        if after_s is not None:
+            done, _ = await asyncio.wait(tasks, timeout=after_s)
+            if not done:
+                if on_hedge:
+                    on_hedge()
+                tasks.append(asyncio.ensure_future(make()))
+
+        pending = set(tasks)
+        while pending:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in tasks:
+                if t.done() and not t.cancelled() and t.exception() is None:
+                    winner = t
+                    return t.result(), t is not tasks[0]
+        # упали все — отдаём ошибку основного запроса
+        return tasks[0].result(), False
+    finally:
+        losers = [t for t in tasks if t is not winner]
+        for t in losers:
+            t.cancel()
+        results = await asyncio.gather(*losers, return_exceptions=True)
+        if discard:
+            for r in results:
+                if not isinstance(r, BaseException):
+                    await discard(r)
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+# чем меньше число, тем раньше обслуживаем
+PRIORITY_PRO = 0
+PRIORITY_FREE = 10
+PRIORITY_BACKGROUND = 20
+
+# как часто пересчитываем место в очереди для ожидающего
+POSITION_POLL_S = 2.0
+
+
+class AIRequestCancelled(Exception):
+    """Запрос к AI отменён (пользователь ушёл на главную)."""
+
+
+@dataclass(frozen=True)
+class QueuePosition:
+    """Служебный элемент потока: место в очереди (0 — очередь дошла)."""
+    position: int
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tg_id", "fut")
+
+    def __init__(self, priority: int, seq: int, tg_id: int | None, fut: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.tg_id = tg_id
+        self.fut = fut
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+_DONE = object()
+
+
+class AIScheduler:
+    """
+    Единая точка входа для запросов к AI:
+    - не больше max_concurrent одновременных запросов к API;
+    - не больше per_user одновременных запросов одного пользователя
+      (tg_id=None — фоновые задачи без этого ограничения);
+    - очередь с приоритетами: PRO-этапы раньше бесплатного питания, фон — в конце;
+    - cancel(tg_id) отменяет и ожидающие, и уже идущие запросы пользователя.
+
+    Каждый запрос выполняется в отдельной задаче, поэтому отмена затрагивает
+    только работу с AI, а не handler, который ждёт ответ.
+    """
+
+    def __init__(self, max_concurrent: int = 8, per_user: int = 1):
+        self.max_concurrent = max(1, max_concurrent)
+        self.per_user = max(1, per_user)
+
+        self._heap: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._running = 0
+        self._user_running: Counter[int] = Counter()
+        self._tasks: dict[int, set[asyncio.Task]] = {}
+
+        self.granted = 0
+        self.queued = 0
+        self.cancelled = 0
+        self.max_queue = 0
+        self.wait_s_total = 0.0
+
+    # ---------- слоты ----------
+
+    def _user_ok(self, tg_id: int | None) -> bool:
+        return tg_id is None or self._user_running[tg_id] < self.per_user
+
+    def _grant(self, tg_id: int | None) -> None:
+        self._running += 1
+        if tg_id is not None:
+            self._user_running[tg_id] += 1
+        self.granted += 1
+
+    def _release(self, tg_id: int | None) -> None:
+        self._running -= 1
+        if tg_id is not None:
+            self._user_running[tg_id] -= 1
+            if self._user_running[tg_id] <= 0:
+                del self._user_running[tg_id]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        skipped = []
+        while self._heap and self._running < self.max_concurrent:
+            w = heapq.heappop(self._heap)
+            if w.fut.done():
+                continue
+            if not self._user_ok(w.tg_id):
+                # у этого пользователя уже идёт запрос — пропускаем, но не теряем место
+                skipped.append(w)
+                continue
+            self._grant(w.tg_id)
+            w.fut.set_result(None)
+        for w in skipped:
+            heapq.heappush(self._heap, w)
+
+    def _position(self, me: _Waiter) -> int:
+        return 1 + sum(1 for w in self._heap if w < me and not w.fut.done())
+
+    async def _acquire(self, tg_id: int | None, priority: int, out: asyncio.Queue) -> None:
+        me = _Waiter(priority, next(self._seq), tg_id, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._heap, me)
+        self._dispatch()
+        if me.fut.done():
+            return
+
+        self.queued += 1
+        self.max_queue = max(self.max_queue, len(self._heap))
+        started = time.monotonic()
+
+        shown = None
+        try:
+            while True:
+                done, _ = await asyncio.wait({me.fut}, timeout=POSITION_POLL_S if shown else 0)
+                if done:
+                    break
+                pos = self._position(me)
+                if pos != shown:
+                    shown = pos
+                    out.put_nowait(QueuePosition(pos))
+        except asyncio.CancelledError:
+            if me.fut.done() and not me.fut.cancelled():
+                # слот уже выдан, но забрать его не успели — возвращаем
+                self._release(tg_id)
+            else:
+                me.fut.cancel()
+            raise
+        finally:
+            self.wait_s_total += time.monotonic() - started
+
+        if shown:
+            out.put_nowait(QueuePosition(0))
+
+    # ---------- выполнение ----------
+
+    async def _produce(self, tg_id, priority, make_stream, out: asyncio.Queue) -> None:
+        try:
+            await self._acquire(tg_id, priority, out)
+            try:
+                async for chunk in make_stream():
+                    out.put_nowait(chunk)
+            finally:
+                self._release(tg_id)
+            out.put_nowait(_DONE)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            out.put_nowait(AIRequestCancelled("Запрос к AI отменён"))
+        except Exception as e:
+            out.put_nowait(e)
+
+    async def stream(
+        self,
+        tg_id: int | None,
+        priority: int,
+        make_stream: Callable[[], AsyncIterator[str]],
+    ) -> AsyncIterator[str | QueuePosition]:
+        """
+        Поток кусков ответа вперемешку с QueuePosition, пока запрос ждёт в очереди.
+        Отмена через cancel(tg_id) приходит как AIRequestCancelled.
+        """
+        out: asyncio.Queue = asyncio.Queue()
+        producer = asyncio.get_running_loop().create_task(self._produce(tg_id, priority, make_stream, out))
+        if tg_id is not None:
+            self._tasks.setdefault(tg_id, set()).add(producer)
+        try:
+            while True:
+                item = await out.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            producer.cancel()
+            if tg_id is not None:
+                tasks = self._tasks.get(tg_id)
+                if tasks is not None:
+                    tasks.discard(producer)
+                    if not tasks:
+                        del self._tasks[tg_id]
+
+    async def run(self, tg_id: int | None, priority: int, make_coro: Callable[[], Awaitable[Any]]) -> Any:
+        """То же для обычного (не потокового) запроса: место в очереди не показываем."""
+        async def once():
+            yield await make_coro()
+
+        async with aclosing(self.stream(tg_id, priority, once)) as items:
+            async for item in items:
+                if not isinstance(item, QueuePosition):
+                    return item
+        return None
+
+    def cancel(self, tg_id: int) -> int:
+        """Отменяет все запросы пользователя. Возвращает, сколько отменили."""
+        tasks = [t for t in self._tasks.get(tg_id, ()) if not t.done()]
+        for t in tasks:
+            t.cancel()
+        return len(tasks)
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "waiting": sum(1 for w in self._heap if not w.fut.done()),
+            "granted": self.granted,
+            "queued": self.queued,
+            "cancelled": self.cancelled,
+            "max_queue": self.max_queue,
+            "avg_wait_s": round(self.wait_s_total / self.queued, 3) if self.queued else 0.0,
+        }
+
+
+_scheduler = AIScheduler()
+
+
+def set_scheduler(scheduler: AIScheduler) -> None:
+    global _scheduler
+    _scheduler = scheduler
+
+
+def get_scheduler() -> AIScheduler:
+    return _scheduler
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class PlanPool:
+    """
+    Пул заранее сгенерированных ответов для конечного набора вариантов
+    (например, пресеты калорийности × формата питания).
+
+    На каждый ключ держим до size свежих ответов. take() отдаёт готовый ответ
+    сразу и будит фоновую задачу, которая доливает пул не более чем
+    в concurrency параллельных запросов — сначала самые пустые ключи,
+    так что и при старте одновременно идёт не больше concurrency генераций.
+    Ответы старше max_age_s выкидываются.
+    """
+
+    def __init__(
+        self,
+        keys: list[Hashable],
+        produce: Callable[[Hashable], Awaitable[str | None]],
+        size: int = 2,
+        concurrency: int = 2,
+        max_age_s: float = 6 * 3600,
+        retry_s: float = 60.0,
+    ):
+        self.keys = list(keys)
+        self.size = size
+        self.max_age_s = max_age_s
+        self.retry_s = retry_s
+        self.concurrency = max(1, concurrency)
+        self._produce = produce
+
+        self._plans: dict[Hashable, deque[tuple[float, str]]] = {k: deque() for k in self.keys}
+        self._inflight: dict[Hashable, int] = {k: 0 for k in self.keys}
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._workers: set[asyncio.Task] = set()
+
+        self.served = 0
+        self.empty = 0
+        self.generated = 0
+        self.expired = 0
+        self.failed = 0
+
+    # ---------- API ----------
+
+    def take(self, key: Hashable) -> str | None:
+        plans = self._plans.get(key)
+        if plans is None:
+            return None
+        self._drop_stale(key)
+        self._wake.set()
+        if not plans:
+            self.empty += 1
+            return None
+        self.served += 1
+        return plans.popleft()[1]
+
+    def stats(self) -> dict:
+        return {
+            "ready": sum(len(p) for p in self._plans.values()),
+            "capacity": self.size * len(self.keys),
+            "served": self.served,
+            "empty": self.empty,
+            "generated": self.generated,
+            "expired": self.expired,
+            "failed": self.failed,
+        }
+
+    # ---------- фон ----------
+
+    def _drop_stale(self, key: Hashable) -> None:
+        plans = self._plans[key]
+        deadline = time.time() - self.max_age_s
+        while plans and plans[0][0] < deadline:
+            plans.popleft()
+            self.expired += 1
+
+    async def _produce_one(self, key: Hashable) -> None:
+        ok = False
+        try:
+            text = await self._produce(key)
+            if text:
+                self._plans[key].append((time.time(), text))
+                self.generated += 1
+                ok = True
+            else:
+                self.failed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception("Не удалось сгенерировать ответ для пула: %s", key)
+        finally:
+            self._inflight[key] -= 1
+            # после ошибки не будим цикл сразу, иначе он будет долбить упавший API
+            if ok:
+                self._wake.set()
+
+    def _spawn(self, key: Hashable) -> None:
+        self._inflight[key] += 1
+        task = asyncio.get_running_loop().create_task(self._produce_one(key))
+        self._workers.add(task)
+        task.add_done_callback(self._workers.discard)
+
+    async def _refill_loop(self) -> None:
+        while True:
+            self._wake.clear()
+            for key in self.keys:
+                self._drop_stale(key)
+            budget = self.concurrency - sum(self._inflight.values())
+            # по одному запросу за проход: пустые ключи доливаем раньше почти полных
+            while budget > 0:
+                key = min(self.keys, key=lambda k: len(self._plans[k]) + self._inflight[k])
+                if len(self._plans[key]) + self._inflight[key] >= self.size:
+                    break
+                self._spawn(key)
+                budget -= 1
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=min(self.retry_s, self.max_age_s))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._refill_loop())
+
+    async def stop(self) -> None:
+        tasks = list(self._workers)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
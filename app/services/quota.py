@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+
+@dataclass(frozen=True)
+class QuotaRule:
+    """
+    limit использований за окно.
+    calendar_week=True — окно это календарная неделя с понедельника 00:00 UTC,
+    иначе скользящее окно длиной period от каждого использования (кулдаун).
+    """
+    limit: int
+    period: timedelta = timedelta(days=7)
+    calendar_week: bool = False
+
+
+@dataclass(frozen=True)
+class QuotaDecision:
+    ok: bool
+    # когда снова станет можно (если ok=False)
+    retry_at: Optional[datetime] = None
+
+
+def week_start_utc(dt: datetime) -> datetime:
+    dt0 = dt.astimezone(timezone.utc)
+    return (dt0 - timedelta(days=dt0.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _parse_iso(dt_str: str) -> datetime | None:
+    try:
+        return datetime.fromisoformat(dt_str.replace("Z", "+00:00"))
+    except Exception:
+        return None
+
+
+class Reservation:
+    """
+    Попытка уже списана. Если дорогая операция (AI) не удалась — refund() вернёт её,
+    при успехе — commit(). Повторные вызовы ничего не делают.
+    """
+
+    def __init__(self, engine: "QuotaEngine", tg_id: int, feature: str, stamp: datetime):
+        self._engine = engine
+        self.tg_id = tg_id
+        self.feature = feature
+        self.stamp = stamp
+        self._done = False
+
+    def commit(self) -> None:
+        self._done = True
+
+    async def refund(self) -> None:
+        if not self._done:
+            self._done = True
+            await self._engine._refund(self.tg_id, self.feature, self.stamp)
+
+
+# user record -> список прошлых использований (для записей, сохранённых до QuotaEngine)
+LegacyLoader = Callable[[dict], list[datetime]]
+
+# feature -> отметки использований
+Uses = dict[str, list[datetime]]
+
+
+class QuotaEngine:
+    """
+    Квоты по фичам: (tg_id, feature) -> отметки времени использований в поле "quota" записи.
+
+    Проверка и списание делаются внутри одного backend.update: счётчик
+    сохраняется вместе со списанием, а лок записи (в SQLite — транзакция,
+    общая для всех процессов) не даёт двум запросам списать одну попытку.
+
+    check() только читает и берёт отметки из ограниченного LRU-кэша
+    (cache_size пользователей); кэш обновляется после каждого списания и возврата.
+    """
+
+    def __init__(
+        self,
+        rules: dict[str, QuotaRule],
+        backend_getter: Callable,
+        legacy_loaders: dict[str, LegacyLoader] | None = None,
+        cache_size: int = 10000,
+    ):
+        self.rules = rules
+        self._backend_getter = backend_getter
+        self._legacy_loaders = legacy_loaders or {}
+        self.cache_size = max(1, cache_size)
+
+        self._cache: OrderedDict[int, Uses] = OrderedDict()
+
+    # ---------- запись пользователя ----------
+
+    def _parse(self, user: dict) -> Uses:
+        saved = user.get("quota") if isinstance(user.get("quota"), dict) else {}
+        uses: Uses = {}
+        for feature in self.rules:
+            if isinstance(saved.get(feature), list):
+                items = [d for d in (_parse_iso(s) for s in saved[feature] if isinstance(s, str)) if d]
+            elif feature in self._legacy_loaders:
+                items = self._legacy_loaders[feature](user)
+            else:
+                items = []
+            uses[feature] = sorted(items)
+        return uses
+
+    @staticmethod
+    def _dump(user: dict, tg_id: int, uses: Uses) -> None:
+        user["tg_id"] = tg_id
+        user["quota"] = {feature: [u.isoformat() for u in items] for feature, items in uses.items()}
+
+    # ---------- кэш ----------
+
+    def _remember(self, tg_id: int, uses: Uses) -> None:
+        self._cache[tg_id] = uses
+        self._cache.move_to_end(tg_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _cached(self, tg_id: int) -> Uses:
+        uses = self._cache.get(tg_id)
+        if uses is not None:
+            self._cache.move_to_end(tg_id)
+            return uses
+        user = await self._backend_getter().get(str(tg_id)) or {}
+        # пока читали, списание могло обновить кэш — его данные новее
+        uses = self._cache.get(tg_id) or self._parse(user)
+        self._remember(tg_id, uses)
+        return uses
+
+    # ---------- окна ----------
+
+    @staticmethod
+    def _window(rule: QuotaRule, uses: list[datetime], now: datetime) -> tuple[list[datetime], datetime | None]:
+        """Отметки внутри текущего окна + когда освободится место, если лимит выбран."""
+        if rule.calendar_week:
+            start = week_start_utc(now)
+            live = [u for u in uses if u >= start]
+            retry_at = start + timedelta(days=7)
+        else:
+            live = [u for u in uses if u > now - rule.period]
+            retry_at = (live[0] + rule.period) if live else None
+        return live, (retry_at if len(live) >= rule.limit else None)
+
+    async def _refund(self, tg_id: int, feature: str, stamp: datetime) -> None:
+        def _apply(user: dict):
+            uses = self._parse(user)
+            if stamp in uses[feature]:
+                uses[feature].remove(stamp)
+                self._dump(user, tg_id, uses)
+            return uses
+
+        self._remember(tg_id, await self._backend_getter().update(str(tg_id), _apply))
+
+    # ---------- API ----------
+
+    async def check(self, tg_id: int, feature: str, rule: QuotaRule | None = None) -> QuotaDecision:
+        """Только проверяем, НЕ списываем. rule — переопределить правило фичи для этого вызова."""
+        uses = await self._cached(tg_id)
+        _, retry_at = self._window(rule or self.rules[feature], uses[feature], datetime.now(timezone.utc))
+        return QuotaDecision(ok=retry_at is None, retry_at=retry_at)
+
+    async def reserve(
+        self, tg_id: int, feature: str, force: bool = False, rule: QuotaRule | None = None,
+        mutate: Callable[[dict], None] | None = None,
+    ) -> tuple[Reservation | None, QuotaDecision]:
+        """
+        Атомарно: проверка + списание одной попытки, сразу с сохранением.
+        force=True списывает даже сверх лимита (для фиксации уже случившегося события).
+        mutate — изменить запись пользователя в том же update, если попытка списана.
+        """
+        rule = rule or self.rules[feature]
+        now = datetime.now(timezone.utc)
+
+        def _apply(user: dict):
+            uses = self._parse(user)
+            live, retry_at = self._window(rule, uses[feature], now)
+            if retry_at is not None and not force:
+                return uses, retry_at
+            # старые отметки заодно выкидываем из записи
+            uses[feature] = live + [now]
+            self._dump(user, tg_id, uses)
+            if mutate is not None:
+                mutate(user)
+            return uses, None
+
+        uses, retry_at = await self._backend_getter().update(str(tg_id), _apply)
+        self._remember(tg_id, uses)
+        if retry_at is not None:
+            return None, QuotaDecision(ok=False, retry_at=retry_at)
+        return Reservation(self, tg_id, feature, now), QuotaDecision(ok=True)
+
+    async def try_consume(
+        self, tg_id: int, feature: str, force: bool = False, rule: QuotaRule | None = None,
+        mutate: Callable[[dict], None] | None = None,
+    ) -> QuotaDecision:
+        reservation, decision = await self.reserve(tg_id, feature, force=force, rule=rule, mutate=mutate)
+        if reservation:
+            reservation.commit()
+        return decision
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable
+
+
+def input_hash(*parts: str) -> str:
+    """Короткий хэш входных данных для ключа запроса."""
+    h = hashlib.sha1()
+    for p in parts:
+        h.update(p.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+class SingleFlight:
+    """
+    Одинаковые одновременные операции (один ключ) выполняются один раз:
+    первый вызов запускает работу, остальные ждут её же результат.
+
+    Работа идёт в отдельной задаче, поэтому отмена одного из ожидающих
+    не обрывает её для остальных.
+    """
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.started = 0
+        self.shared = 0
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._inflight
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """Возвращает (результат, shared) — shared=True, если присоединились к уже идущей работе."""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.shared += 1
+        else:
+            self.started += 1
+            task = asyncio.get_running_loop().create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task), shared
+
+    async def wait(self, key: str) -> Any:
+        """Дождаться уже идущей работы по ключу (None, если её нет)."""
+        task = self._inflight.get(key)
+        if task is None:
+            return None
+        self.shared += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "started": self.started, "shared": self.shared}
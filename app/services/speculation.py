@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+
+class SpeculationPolicy:
+    """
+    Решает, генерировать ли этапы 2/3 заранее сразу после этапа 1,
+    и считает, окупается ли это.
+
+    Ограничение стоимости: только PRO и только если доля нажатий на этапы 2/3
+    после этапа 1 (CTR) не ниже min_ctr. У пользователя с историей меньше
+    min_history анализов берём общий CTR по всем пользователям этого процесса.
+
+    Счётчики: generated — сколько этапов сгенерировано заранее, hits — сколько
+    из них пользователь открыл, wasted — сколько перезаписано неоткрытыми
+    (новый этап 1 или обычная генерация). Остальные (pending) ещё лежат
+    неоткрытыми и тоже могут оказаться лишними.
+    """
+
+    def __init__(self, enabled: bool = False, min_ctr: float = 0.5, min_history: int = 2):
+        self.enabled = enabled
+        self.min_ctr = min_ctr
+        self.min_history = min_history
+
+        # общий CTR: сколько раз этапы 2/3 можно было открыть и сколько открыли
+        self._offers = 0
+        self._clicks = 0
+
+        self.generated = 0
+        self.hits = 0
+        self.wasted = 0
+        self.skipped = 0
+
+    @staticmethod
+    def _ctr(offers: int, clicks: int) -> float | None:
+        return min(1.0, clicks / offers) if offers else None
+
+    def user_ctr(self, funnel: dict) -> float | None:
+        runs = funnel.get("stage1", 0)
+        if runs < self.min_history:
+            return self._ctr(self._offers, self._clicks)
+        return self._ctr(2 * runs, funnel.get("stage2", 0) + funnel.get("stage3", 0))
+
+    def should_speculate(self, pro: bool, funnel: dict) -> bool:
+        """funnel — счётчики пользователя до текущего прохождения этапа 1."""
+        if not self.enabled or not pro:
+            return False
+        ctr = self.user_ctr(funnel)
+        if ctr is None or ctr < self.min_ctr:
+            self.skipped += 1
+            return False
+        return True
+
+    def observe_stage1(self) -> None:
+        self._offers += 2
+
+    def observe_click(self) -> None:
+        self._clicks += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "generated": self.generated,
+            "hits": self.hits,
+            "wasted": self.wasted,
+            "pending": max(0, self.generated - self.hits - self.wasted),
+            "skipped": self.skipped,
+            "global_ctr": self._ctr(self._offers, self._clicks),
+            "hit_ratio": round(self.hits / self.generated, 4) if self.generated else 0.0,
+        }
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import re
+import time
+from typing import AsyncIterator, Callable
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+from app.services.ai_scheduler import AIRequestCancelled, QueuePosition
+
+# Telegram позволяет ~1 правку сообщения в секунду на чат, берём с запасом
+EDIT_INTERVAL_S = 1.2
+# не дёргаем API ради пары новых символов
+MIN_NEW_CHARS = 40
+PREVIEW_LIMIT = 3500
+
+_TAG_RE = re.compile(r"</?(b|i|code|blockquote)>")
+
+
+def plain_preview(text: str) -> str:
+    """
+    Черновик показываем простым текстом: незакрытые HTML-теги посреди генерации
+    Telegram не примет, поэтому теги просто выкидываем.
+    """
+    return _TAG_RE.sub("", text)
+
+
+async def _show_queue_position(draft: Message, position: int, placeholder: str) -> None:
+    text = f"⏳ Вы {position}-й в очереди, ответ начнётся автоматически." if position else placeholder
+    try:
+        await draft.edit_text(text)
+    except TelegramBadRequest:
+        pass
+
+
+async def stream_to_message(
+    message: Message,
+    chunks: AsyncIterator[str | QueuePosition],
+    placeholder: str = "✍ Пишу ответ…",
+    preview: Callable[[str], str] | None = None,
+) -> tuple[str, Message]:
+    """
+    Отправляет сообщение-заготовку и по мере генерации правит его
+    (не чаще EDIT_INTERVAL_S), чтобы пользователь видел текст через секунду-две,
+    а не после всей генерации.
+
+    preview: как превратить накопленный сырой ответ в текст черновика
+    (например, вырезать служебные маркеры ===FULL===).
+
+    Если chunks идёт через AIScheduler, пока запрос ждёт в очереди, в заготовке
+    показываем место в очереди. При отмене заготовка помечается отменённой,
+    а AIRequestCancelled пробрасывается вызывающему коду. При ошибке AI
+    заготовка удаляется (о причине сообщает вызывающий код), ошибка пробрасывается.
+
+    Возвращает (полный сырой ответ, сообщение-заготовку) — заготовку вызывающий
+    код потом заменяет финальным, уже санитизированным текстом.
+    """
+    draft = await message.answer(placeholder)
+
+    parts: list[str] = []
+    shown_len = 0
+    last_edit = time.monotonic()
+
+    try:
+        async for delta in chunks:
+            if isinstance(delta, QueuePosition):
+                await _show_queue_position(draft, delta.position, placeholder)
+                continue
+
+            parts.append(delta)
+
+            now = time.monotonic()
+            if now - last_edit < EDIT_INTERVAL_S:
+                continue
+
+            text = "".join(parts)
+            if len(text) - shown_len < MIN_NEW_CHARS:
+                continue
+            view = plain_preview(preview(text) if preview else text).strip()
+            if not view:
+                continue
+            if len(view) > PREVIEW_LIMIT:
+                view = "…" + view[-PREVIEW_LIMIT:]
+
+            try:
+                await draft.edit_text(view + " ▌")
+                shown_len = len(text)
+            except TelegramBadRequest:
+                # черновик — не критично, финальный текст всё равно придёт
+                pass
+            last_edit = time.monotonic()
+    except AIRequestCancelled:
+        try:
+            await draft.edit_text("⛔ Генерация отменена.")
+        except TelegramBadRequest:
+            pass
+        raise
+    except Exception:
+        # иначе в чате навсегда останется «пишу ответ…»
+        try:
+            await draft.delete()
+        except TelegramBadRequest:
+            pass
+        raise
+
+    return "".join(parts).strip(), draft
@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import itertools
+import logging
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    AnswerCallbackQuery,
+    DeleteMessage,
+    EditMessageCaption,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    SendChatAction,
+    TelegramMethod,
+)
+from aiogram.methods.base import Response, TelegramType
+
+logger = logging.getLogger(__name__)
+
+# чем меньше число, тем раньше отправляем
+PRIORITY_UI = 0        # правки панелей, ответы на кнопки
+PRIORITY_MESSAGE = 10  # обычные сообщения
+PRIORITY_BULK = 20     # куски длинных отчётов
+
+_UI_METHODS = (
+    AnswerCallbackQuery, DeleteMessage, EditMessageCaption, EditMessageReplyMarkup, EditMessageText, SendChatAction,
+)
+
+_priority_override: contextvars.ContextVar[int | None] = contextvars.ContextVar("tg_send_priority", default=None)
+
+
+@contextmanager
+def send_priority(priority: int) -> Iterator[None]:
+    """
+    Все запросы к Telegram внутри блока идут с этим приоритетом (например, PRIORITY_BULK).
+    Влияет на очередь между чатами, порядок внутри чата не меняет.
+    """
+    token = _priority_override.set(priority)
+    try:
+        yield
+    finally:
+        _priority_override.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_s(self, now: float) -> float:
+        """Сколько ждать до свободного токена (0 — можно сейчас)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "go")
+
+    def __init__(self, priority: int, seq: int, go: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.go = go
+
+
+class _Chat:
+    __slots__ = ("bucket", "ui", "sends", "busy", "paused_until")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        # правки уже отправленных сообщений не зависят от порядка новых —
+        # им можно обгонять очередь отправок; сами отправки строго по порядку
+        self.ui: deque[_Job] = deque()
+        self.sends: deque[_Job] = deque()
+        self.busy = False
+        self.paused_until = 0.0
+
+    def head(self) -> deque[_Job] | None:
+        if self.ui:
+            return self.ui
+        if self.sends:
+            return self.sends
+        return None
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Все исходящие запросы бота к чатам идут через очередь:
+    - общий токен-бакет (global_rate в секунду) и бакет на каждый чат;
+    - в одном чате один запрос за раз, новые сообщения — строго по порядку;
+    - при 429 (TelegramRetryAfter) чат ставится на паузу на retry_after,
+      запрос повторяется первым в очереди чата (до max_retries раз);
+    - из готовых чатов первым обслуживается запрос с меньшим приоритетом
+      (PRIORITY_UI раньше PRIORITY_BULK).
+
+    Приоритет упорядочивает только разные чаты. Внутри одного чата правки
+    (ui) всегда идут раньше новых сообщений, а новые сообщения — строго по
+    порядку отправки, какой бы приоритет им ни дали: иначе куски отчёта
+    перемешались бы. Поэтому send_priority(PRIORITY_BULK) пропускает вперёд
+    другие чаты, но не следующее сообщение того же чата.
+
+    Запросы без chat_id (getUpdates, setWebhook, …) идут напрямую.
+    Подключается как middleware сессии: bot.session.middleware(scheduler).
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 25.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        max_retries: int = 3,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+        self._chats: dict[Any, _Chat] = {}
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+        self._counters: Counter = Counter()
+        self._wait_ms: deque[float] = deque(maxlen=1000)
+        self._send_ms: deque[float] = deque(maxlen=1000)
+
+    # ---------- middleware ----------
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        priority = _priority_override.get()
+        if priority is None:
+            priority = PRIORITY_UI if isinstance(method, _UI_METHODS) else PRIORITY_MESSAGE
+        lane = "ui" if isinstance(method, _UI_METHODS) else "sends"
+
+        started = time.monotonic()
+        job = _Job(priority, next(self._seq), asyncio.get_running_loop().create_future())
+        attempt = 0
+        while True:
+            chat = await self._wait_turn(chat_id, lane, job, front=attempt > 0)
+            if attempt == 0:
+                self._wait_ms.append((time.monotonic() - started) * 1000)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self._counters["retry_after"] += 1
+                chat.paused_until = max(chat.paused_until, time.monotonic() + e.retry_after)
+                logger.warning("Telegram 429 в чате %s: пауза %s с", chat_id, e.retry_after)
+                if attempt >= self.max_retries:
+                    self._counters["failed"] += 1
+                    raise
+            else:
+                self._counters["sent"] += 1
+                self._send_ms.append((time.monotonic() - started) * 1000)
+                return response
+            finally:
+                self._release(chat)
+            attempt += 1
+            job.go = asyncio.get_running_loop().create_future()
+
+    # ---------- очередь ----------
+
+    async def _wait_turn(self, chat_id: Any, lane: str, job: _Job, front: bool) -> _Chat:
+        self._ensure_started()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(TokenBucket(self.chat_rate, self.chat_burst))
+        queue: deque[_Job] = getattr(chat, lane)
+        # повтор после 429 встаёт в начало, чтобы не нарушить порядок в чате
+        if front:
+            queue.appendleft(job)
+        else:
+            queue.append(job)
+        self._wake.set()
+        try:
+            await job.go
+        except BaseException:
+            if job in queue:
+                queue.remove(job)
+            elif job.go.done() and not job.go.cancelled():
+                # очередь уже дошла, но отправлять некому — освобождаем чат
+                self._release(chat)
+            raise
+        return chat
+
+    def _release(self, chat: _Chat) -> None:
+        chat.busy = False
+        self._wake.set()
+
+    def _dispatch(self) -> float | None:
+        """Раздаёт разрешения; возвращает, через сколько проверить снова (None — ждать событий)."""
+        now = time.monotonic()
+        ready: list[tuple[int, int, _Chat]] = []
+        next_check: float | None = None
+        idle = []
+
+        for chat_id, chat in self._chats.items():
+            queue = chat.head()
+            if chat.busy:
+                continue
+            if queue is None:
+                # простаивающий чат с полным бакетом можно забыть
+                if chat.paused_until <= now and chat.bucket.full(now):
+                    idle.append(chat_id)
+                continue
+            wait = max(chat.paused_until - now, chat.bucket.wait_s(now))
+            if wait > 0:
+                next_check = wait if next_check is None else min(next_check, wait)
+                continue
+            ready.append((queue[0].priority, queue[0].seq, chat))
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+        ready.sort(key=lambda r: (r[0], r[1]))
+        for _, _, chat in ready:
+            wait = self.global_bucket.wait_s(now)
+            if wait > 0:
+                return wait if next_check is None else min(next_check, wait)
+            job = chat.head().popleft()
+            if job.go.done():
+                # ожидавший уже отменён — у чата могут быть следующие
+                self._wake.set()
+                continue
+            chat.busy = True
+            chat.bucket.take(now)
+            self.global_bucket.take(now)
+            job.go.set_result(None)
+        return next_check
+
+    async def _loop(self) -> None:
+        while True:
+            self._wake.clear()
+            wait = self._dispatch()
+            if wait is None:
+                await self._wake.wait()
+            else:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # ---------- метрики ----------
+
+    def stats(self) -> dict:
+        depth = Counter()
+        for chat in self._chats.values():
+            for job in itertools.chain(chat.ui, chat.sends):
+                depth[job.priority] += 1
+
+        def pct(samples: deque[float], q: float) -> float | None:
+            ordered = sorted(samples)
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 1) if ordered else None
+
+        return {
+            "depth": sum(depth.values()),
+            "depth_by_priority": dict(sorted(depth.items())),
+            "chats": len(self._chats),
+            "sent": self._counters["sent"],
+            "retry_after": self._counters["retry_after"],
+            "failed": self._counters["failed"],
+            "queue_wait_p50_ms": pct(self._wait_ms, 0.50),
+            "queue_wait_p95_ms": pct(self._wait_ms, 0.95),
+            "send_p50_ms": pct(self._send_ms, 0.50),
+            "send_p95_ms": pct(self._send_ms, 0.95),
+        }
@@ -1,13 +1,35 @@
 from __future__ import annotations
 
+import asyncio
+import contextvars
+import hashlib
+import itertools
+import time
+from collections import Counter
 from typing import Optional, Tuple
 
+from aiogram import BaseMiddleware, Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
 # tg_id -> (chat_id, message_id)
 _UI: dict[int, tuple[int, int]] = {}
 
+# tg_id -> (message_id, отпечаток текста, отпечаток клавиатуры) последнего показанного на панели
+_RENDERED: dict[int, tuple[int, str, str]] = {}
+
+# unchanged — правки, не ушедшие в API (ничего не изменилось);
+# markup_only — вместо edit_message_text ушёл edit_message_reply_markup;
+# not_modified — Telegram всё-таки ответил "message is not modified";
+# coalesced — отрисовки, которые устарели, пока ждали очереди
+_stats: Counter = Counter()
+
 
 def set_ui_message(tg_id: int, chat_id: int, message_id: int) -> None:
     _UI[tg_id] = (chat_id, message_id)
+    rendered = _RENDERED.get(tg_id)
+    if rendered is not None and rendered[0] != message_id:
+        _RENDERED.pop(tg_id, None)
 
 
 def get_ui_message(tg_id: int) -> Optional[Tuple[int, int]]:
@@ -16,6 +38,7 @@ def get_ui_message(tg_id: int) -> Optional[Tuple[int, int]]:
 
 def clear_ui_message(tg_id: int) -> None:
     _UI.pop(tg_id, None)
+    _RENDERED.pop(tg_id, None)
 
 
 def ui_is_last(known_ui_msg_id: int, current_msg_id: int) -> bool:
@@ -24,3 +47,219 @@ def ui_is_last(known_ui_msg_id: int, current_msg_id: int) -> bool:
     Если после UI были сообщения, current_msg_id будет больше.
     """
     return known_ui_msg_id >= current_msg_id
+
+
+def _digest(raw: str) -> str:
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def render_fingerprint(text: str, reply_markup=None, parse_mode: str | None = None) -> tuple[str, str]:
+    """(отпечаток текста с parse_mode, отпечаток клавиатуры)."""
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup is not None else ""
+    return _digest(f"{parse_mode or ''}\0{text}"), _digest(markup)
+
+
+def remember_render(tg_id: int, message_id: int, text: str, reply_markup=None, parse_mode: str | None = None) -> None:
+    """Запоминает, что сейчас показано на панели (после отправки новой панели)."""
+    _RENDERED[tg_id] = (message_id, *render_fingerprint(text, reply_markup, parse_mode))
+
+
+async def edit_ui(
+    bot: Bot,
+    tg_id: int,
+    chat_id: int,
+    message_id: int,
+    text: str,
+    reply_markup=None,
+    parse_mode: str | None = None,
+) -> None:
+    """
+    Перерисовывает панель, не тратя запрос к API, если ничего не изменилось;
+    если поменялась только клавиатура — правит только её.
+    """
+    text_fp, markup_fp = render_fingerprint(text, reply_markup, parse_mode)
+    last = _RENDERED.get(tg_id)
+
+    if last is not None and last[0] == message_id and last[1] == text_fp:
+        if last[2] == markup_fp:
+            _stats["unchanged"] += 1
+            return
+        _stats["markup_only"] += 1
+        edit = bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=reply_markup)
+    else:
+        _stats["edits"] += 1
+        edit = bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=message_id,
+            text=text,
+            reply_markup=reply_markup,
+            parse_mode=parse_mode,
+        )
+
+    try:
+        await edit
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            _RENDERED.pop(tg_id, None)
+            raise
+        _stats["not_modified"] += 1
+    _RENDERED[tg_id] = (message_id, text_fp, markup_fp)
+
+
+# порядковый номер апдейта, в рамках которого идёт отрисовка (ставит UpdateOrderMiddleware)
+_update_stamp: contextvars.ContextVar[int | None] = contextvars.ContextVar("ui_update_stamp", default=None)
+_stamps = itertools.count(1)
+
+
+def begin_update() -> int:
+    """Отмечает начало обработки нового апдейта; отрисовки из более старых апдейтов станут устаревшими."""
+    stamp = next(_stamps)
+    _update_stamp.set(stamp)
+    return stamp
+
+
+_BACKGROUND: set[asyncio.Task] = set()
+
+
+def run_in_background(coro) -> asyncio.Task:
+    """
+    Запускает долгую работу handler-а (генерацию отчёта и т.п.) отдельной задачей.
+
+    Задача не наследует номер апдейта: её отрисовки приходят уже после
+    следующих нажатий пользователя и не должны считаться устаревшими.
+    """
+    ctx = contextvars.copy_context()
+    ctx.run(_update_stamp.set, None)
+    task = asyncio.get_running_loop().create_task(coro, context=ctx)
+    # держим ссылку, иначе задачу может собрать сборщик мусора
+    _BACKGROUND.add(task)
+    task.add_done_callback(_BACKGROUND.discard)
+    return task
+
+
+class UpdateOrderMiddleware(BaseMiddleware):
+    """
+    Нумерует апдейты в порядке поступления (dp.update.outer_middleware).
+    Handler может сначала ответить на callback и только потом рисовать —
+    по номеру видно, какая отрисовка относится к более позднему нажатию.
+    """
+
+    async def __call__(self, handler, event, data):
+        begin_update()
+        return await handler(event, data)
+
+
+class _Lane:
+    """Очередь отрисовок панели одного пользователя."""
+    __slots__ = ("lock", "seq", "newest_stamp", "carry_new", "carry_trigger", "used_at")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.seq = 0
+        self.used_at = time.monotonic()
+        self.newest_stamp = 0
+        # что унаследовать от выброшенных устаревших отрисовок
+        self.carry_new = False
+        self.carry_trigger = 0
+
+    def drop(self, new_panel: bool, trigger_id: int) -> None:
+        # если выброшенная отрисовка должна была создать новую панель, это сделает следующая
+        self.carry_new = self.carry_new or new_panel
+        self.carry_trigger = max(self.carry_trigger, trigger_id)
+        _stats["coalesced"] += 1
+
+
+# tg_id -> очередь; простаивающие дольше LANE_IDLE_S выкидываются
+_LANES: dict[int, _Lane] = {}
+# newest_stamp нужен, пока могут прийти запоздавшие отрисовки, — это секунды
+LANE_IDLE_S = 300.0
+_lanes_swept_at = time.monotonic()
+
+
+def _evict_idle_lanes(now: float) -> None:
+    global _lanes_swept_at
+    if now - _lanes_swept_at < LANE_IDLE_S:
+        return
+    _lanes_swept_at = now
+    for tg_id in [k for k, lane in _LANES.items() if not lane.lock.locked() and now - lane.used_at > LANE_IDLE_S]:
+        del _LANES[tg_id]
+
+
+async def _apply(
+    message: Message, tg_id: int, text: str, reply_markup, parse_mode: str | None, new_panel: bool, trigger_id: int,
+) -> None:
+    ui = get_ui_message(tg_id)
+
+    # если событие новее панели — панель уже не последняя, создаём новую
+    if new_panel or not ui or trigger_id > ui[1]:
+        sent = await message.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
+        set_ui_message(tg_id, sent.chat.id, sent.message_id)
+        remember_render(tg_id, sent.message_id, text, reply_markup, parse_mode=parse_mode)
+        return
+
+    chat_id, ui_msg_id = ui
+    await edit_ui(message.bot, tg_id, chat_id, ui_msg_id, text, reply_markup, parse_mode=parse_mode)
+
+
+async def _render(
+    message: Message, tg_id: int, text: str, reply_markup, parse_mode: str | None, new_panel: bool,
+) -> None:
+    now = time.monotonic()
+    lane = _LANES.get(tg_id)
+    if lane is None:
+        _evict_idle_lanes(now)
+        lane = _LANES[tg_id] = _Lane()
+    lane.used_at = now
+    trigger_id = message.message_id or 0
+
+    # отрисовка из апдейта старше уже показанного/ожидающего — не нужна
+    # (новую панель рисуем всегда: это явное «показать меню после результата»)
+    stamp = _update_stamp.get()
+    if stamp is not None and not new_panel:
+        if stamp < lane.newest_stamp:
+            lane.drop(new_panel, trigger_id)
+            return
+        lane.newest_stamp = stamp
+
+    lane.seq += 1
+    seq = lane.seq
+    async with lane.lock:
+        if seq != lane.seq:
+            # пока ждали, пришла более новая отрисовка
+            lane.drop(new_panel, trigger_id)
+            return
+
+        new_panel = new_panel or lane.carry_new
+        trigger_id = max(trigger_id, lane.carry_trigger)
+        lane.carry_new = False
+        lane.carry_trigger = 0
+        await _apply(message, tg_id, text, reply_markup, parse_mode, new_panel, trigger_id)
+
+
+async def render_ui(message: Message, tg_id: int, text: str, reply_markup=None, parse_mode: str | None = None) -> None:
+    """
+    UI всегда должен быть последним сообщением:
+    - если текущая UI-панель всё ещё последняя -> редактируем её
+    - если после неё появились сообщения -> создаём новую UI-панель
+
+    Отрисовки одного пользователя идут строго по очереди; устаревшие (пока ждали,
+    пришла более новая, или апдейт старше уже показанного) в API не уходят.
+    """
+    await _render(message, tg_id, text, reply_markup, parse_mode, new_panel=False)
+
+
+async def force_new_ui(message: Message, tg_id: int, text: str, reply_markup=None, parse_mode: str | None = None) -> None:
+    """Всегда создаёт новую UI-панель и делает её последним сообщением."""
+    await _render(message, tg_id, text, reply_markup, parse_mode, new_panel=True)
+
+
+def render_stats() -> dict:
+    """Сколько запросов к API сэкономили кэш и очередь отрисовки."""
+    return {
+        "edits": _stats["edits"],
+        "markup_only": _stats["markup_only"],
+        "unchanged": _stats["unchanged"],
+        "coalesced": _stats["coalesced"],
+        "not_modified": _stats["not_modified"],
+        "saved_calls": _stats["unchanged"] + _stats["coalesced"],
+    }
@@ -0,0 +1,264 @@
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Any, Callable
+
+from app.storage.io import run_io, write_atomic
+from app.storage.journal import JournalStore
+from app.storage.locks import StripedLock, TimedLock
+
+logger = logging.getLogger(__name__)
+
+
+# fn получает изменяемую копию записи (или {} если записи нет) и правит её на месте.
+# То, что вернёт fn, возвращается из update(). Если запись не изменилась — ничего не пишем.
+Mutator = Callable[[dict], Any]
+
+
+class RecordBackend:
+    """
+    Общий интерфейс хранилищ вида "tg_id -> dict".
+    Ключи — строки (str(tg_id)), значения — JSON-совместимые dict.
+
+    get() возвращает запись только для чтения — менять её нельзя,
+    все изменения идут через update(), который атомарен для одного ключа.
+    """
+
+    async def get(self, key: str) -> dict | None:
+        raise NotImplementedError
+
+    async def update(self, key: str, fn: Mutator) -> Any:
+        raise NotImplementedError
+
+    async def flush(self) -> None:
+        """Ждёт, пока все уже применённые изменения окажутся на диске."""
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class JournalBackend(RecordBackend):
+    """
+    JSON-снапшот + append-only журнал (см. JournalStore).
+
+    Изменение записи держит только лок полосы этого пользователя,
+    сам файл (дозапись в журнал и компактизация) — отдельный лок.
+    Чтения идут из памяти без локов. Весь файловый I/O — в пуле run_io.
+    """
+
+    def __init__(self, path: Path, compact_every: int = 5000):
+        self._store = JournalStore(path, compact_every=compact_every)
+        self._record_locks = StripedLock(f"{path.stem}.record")
+        self._file_lock = TimedLock(f"{path.stem}.file")
+        self._compaction_task: asyncio.Task | None = None
+
+    async def _ready(self):
+        if not self._store.loaded:
+            async with self._file_lock:
+                if not self._store.loaded:
+                    await run_io(self._store.load)
+
+    async def _compact(self):
+        async with self._file_lock:
+            await run_io(self._store.compact)
+
+    async def get(self, key: str) -> dict | None:
+        await self._ready()
+        return self._store.get(key)
+
+    async def update(self, key: str, fn: Mutator) -> Any:
+        await self._ready()
+        async with self._record_locks.for_key(key):
+            old = self._store.get(key)
+            record = copy.deepcopy(old) if isinstance(old, dict) else {}
+            result = fn(record)
+            if record != old:
+                async with self._file_lock:
+                    await run_io(self._store.put, key, record)
+
+        # журнал разросся — в фоне переписываем снапшот
+        if self._store.needs_compaction() and (self._compaction_task is None or self._compaction_task.done()):
+            self._compaction_task = asyncio.get_running_loop().create_task(self._compact())
+
+        return result
+
+    async def flush(self) -> None:
+        await self._ready()
+        async with self._file_lock:
+            await run_io(self._store.sync)
+
+    async def close(self) -> None:
+        if self._compaction_task is not None:
+            await self._compaction_task
+        await run_io(self._store.close)
+
+
+class JsonFileBackend(RecordBackend):
+    """
+    Один JSON-файл {"users": {...}}. Подходит для маленьких установок.
+
+    Файл читается один раз, дальше все чтения и изменения идут в памяти.
+    Изменение держит только лок полосы пользователя.
+
+    Запись на диск — group commit: изменения копятся, фоновый flusher
+    переписывает файл не чаще раза в flush_interval_ms или сразу после
+    flush_max_changes изменений (tmp + fsync + rename, в пуле run_io).
+    flush_interval_ms=0 — старое поведение: каждое изменение сразу пишется на диск.
+    Кому нужна гарантия записи — ждёт flush().
+    """
+
+    def __init__(self, path: Path, flush_interval_ms: int = 0, flush_max_changes: int = 50):
+        self.path = path
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_changes = flush_max_changes
+
+        self._record_locks = StripedLock(f"{path.stem}.record")
+        self._file_lock = TimedLock(f"{path.stem}.file")
+
+        self._users: dict[str, dict] | None = None
+        # номер последнего применённого изменения и последнего записанного на диск
+        self._seq = 0
+        self._flushed_seq = 0
+
+        self._dirty = asyncio.Event()
+        self._full = asyncio.Event()
+        self._flusher_task: asyncio.Task | None = None
+
+    def _load(self) -> dict[str, dict]:
+        if not self.path.exists():
+            return {}
+        try:
+            text = self.path.read_text(encoding="utf-8")
+            db = json.loads(text) if text.strip() else {}
+        except Exception:
+            return {}
+        if not isinstance(db, dict) or not isinstance(db.get("users"), dict):
+            return {}
+        return db["users"]
+
+    def _save(self, users: dict[str, dict]) -> None:
+        write_atomic(self.path, json.dumps({"users": users}, ensure_ascii=False, indent=2))
+
+    async def _ready(self) -> dict[str, dict]:
+        if self._users is None:
+            async with self._file_lock:
+                if self._users is None:
+                    self._users = await run_io(self._load)
+        return self._users
+
+    # ---------- запись на диск ----------
+
+    async def _flusher(self):
+        while True:
+            await self._dirty.wait()
+            # копим изменения: до таймаута или пока не наберётся flush_max_changes
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._dirty.clear()
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось записать %s, повторим при следующем изменении", self.path)
+
+    def _schedule_flush(self):
+        if self._flusher_task is None or self._flusher_task.done():
+            self._flusher_task = asyncio.get_running_loop().create_task(self._flusher())
+        self._dirty.set()
+        if self._seq - self._flushed_seq >= self.flush_max_changes:
+            self._full.set()
+
+    async def flush(self) -> None:
+        target = self._seq
+        # одновременные flush() выстраиваются на файловом локе;
+        # запись, сделанная первым, покрывает изменения остальных
+        while self._flushed_seq < target:
+            async with self._file_lock:
+                if self._flushed_seq >= target:
+                    break
+                seq = self._seq
+                # записи не меняются на месте (только заменяются), поэтому хватает поверхностной копии
+                snapshot = dict(self._users)
+                await run_io(self._save, snapshot)
+                self._flushed_seq = seq
+
+    # ---------- API ----------
+
+    async def get(self, key: str) -> dict | None:
+        users = await self._ready()
+        return users.get(key)
+
+    async def update(self, key: str, fn: Mutator) -> Any:
+        users = await self._ready()
+        async with self._record_locks.for_key(key):
+            old = users.get(key)
+            record = copy.deepcopy(old) if isinstance(old, dict) else {}
+            result = fn(record)
+            if record != old:
+                users[key] = record
+                self._seq += 1
+                if self.flush_interval <= 0:
+                    await self.flush()
+                else:
+                    self._schedule_flush()
+            return result
+
+    async def close(self) -> None:
+        if self._flusher_task is not None:
+            self._flusher_task.cancel()
+            try:
+                await self._flusher_task
+            except asyncio.CancelledError:
+                pass
+            self._flusher_task = None
+        await self.flush()
+
+
+class ShardedJsonBackend(RecordBackend):
+    """
+    Отдельный JSON-файл на пользователя: <root>/<2 символа sha1(tg_id)>/<tg_id>.json.
+
+    Чтение и запись трогают только байты одного пользователя,
+    размер файлов не растёт вместе с базой. Префикс-каталоги нужны,
+    чтобы в одном каталоге не оказалось сотни тысяч файлов.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._record_locks = StripedLock(f"{root.name}.record")
+
+    def path_for(self, key: str) -> Path:
+        prefix = hashlib.sha1(key.encode("utf-8")).hexdigest()[:2]
+        return self.root / prefix / f"{key}.json"
+
+    def _read(self, key: str) -> dict | None:
+        path = self.path_for(key)
+        try:
+            record = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning("Битый файл %s, считаем запись пустой", path)
+            return None
+        return record if isinstance(record, dict) else None
+
+    def write(self, key: str, record: dict, durable: bool = True) -> None:
+        write_atomic(self.path_for(key), json.dumps(record, ensure_ascii=False, indent=2), durable=durable)
+
+    async def get(self, key: str) -> dict | None:
+        return await run_io(self._read, key)
+
+    async def update(self, key: str, fn: Mutator) -> Any:
+        async with self._record_locks.for_key(key):
+            old = await run_io(self._read, key)
+            record = copy.deepcopy(old) if old is not None else {}
+            result = fn(record)
+            if record != old:
+                await run_io(self.write, key, record)
+            return result
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from typing import Any
+
+from app.storage.backends import RecordBackend, Mutator
+
+
+def _approx_size(value) -> int:
+    """Грубая оценка объёма записи без сериализации (её не хотим делать в event loop)."""
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, dict):
+        return sum(len(str(k)) + 4 + _approx_size(v) for k, v in value.items()) + 2
+    if isinstance(value, (list, tuple)):
+        return sum(_approx_size(v) + 1 for v in value) + 2
+    return 8
+
+
+class CachedBackend(RecordBackend):
+    """
+    Write-through LRU-кэш разобранных записей поверх любого RecordBackend.
+
+    - get(): сначала кэш, при промахе читаем из inner и кладём в кэш;
+    - update(): пишем через inner и кладём в кэш уже изменённую запись;
+    - размер ограничен и по числу записей, и по примерному объёму записей.
+
+    Кэш живёт внутри процесса: если в ту же базу пишут другие процессы,
+    их изменения здесь увидим только после вытеснения записи.
+    """
+
+    def __init__(self, inner: RecordBackend, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024):
+        self.inner = inner
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries: OrderedDict[str, tuple[dict, int]] = OrderedDict()
+        self._bytes = 0
+        # версия ключа растёт при каждой записи: промах, начавшийся до записи,
+        # не должен положить в кэш устаревшее значение
+        self._versions: dict[str, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ---------- кэш ----------
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _put(self, key: str, record: dict) -> None:
+        self._drop(key)
+        size = _approx_size(record)
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = (record, size)
+        self._bytes += size
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, old_size) = self._entries.popitem(last=False)
+            self._bytes -= old_size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    # ---------- API ----------
+
+    async def get(self, key: str) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        version = self._versions.get(key, 0)
+        record = await self.inner.get(key)
+        if record is not None and self._versions.get(key, 0) == version:
+            self._put(key, record)
+        return record
+
+    async def update(self, key: str, fn: Mutator) -> Any:
+        captured: dict[str, dict] = {}
+
+        def _capture(record: dict):
+            result = fn(record)
+            captured["record"] = record
+            return result
+
+        self._versions[key] = self._versions.get(key, 0) + 1
+        try:
+            result = await self.inner.update(key, _capture)
+        except BaseException:
+            self._drop(key)
+            raise
+
+        if "record" in captured:
+            self._put(key, captured["record"])
+        return result
+
+    async def flush(self) -> None:
+        await self.inner.flush()
+
+    async def close(self) -> None:
+        await self.inner.close()
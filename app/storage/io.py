@@ -0,0 +1,36 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Общий ограниченный пул для файлового I/O и (де)сериализации больших JSON.
+# Event loop никогда не ждёт диск сам — только результат из пула.
+STORAGE_IO_WORKERS = int(os.getenv("STORAGE_IO_WORKERS", "4") or 4)
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=STORAGE_IO_WORKERS, thread_name_prefix="storage-io")
+
+
+async def run_io(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_EXECUTOR, func, *args)
+
+
+def write_atomic(path, text: str, durable: bool = True) -> None:
+    """
+    Атомарная запись файла: tmp + fsync + rename (+ fsync каталога).
+    После падения на диске будет либо старая, либо новая версия целиком.
+    durable=False пропускает fsync (массовые операции, где в конце делается os.sync()).
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+    if durable and hasattr(os, "O_DIRECTORY"):
+        fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
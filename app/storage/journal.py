@@ -0,0 +1,143 @@
+import json
+import os
+from pathlib import Path
+
+from app.storage.io import write_atomic
+
+
+class JournalStore:
+    """
+    Хранилище "ключ -> dict" из двух файлов:
+    - снапшот (обычный JSON вида {"users": {...}}), переписывается только при компактизации;
+    - журнал (*.journal), куда каждая мутация дописывается одной компактной строкой.
+
+    Чтения идут из индекса в памяти, который собирается при старте:
+    снапшот + проигрывание журнала поверх него.
+    Стоимость записи зависит от размера изменения, а не от числа пользователей.
+    """
+
+    def __init__(self, snapshot_path: Path, compact_every: int = 5000):
+        self.snapshot_path = snapshot_path
+        self.journal_path = snapshot_path.with_suffix(".journal")
+        self.compact_every = compact_every
+
+        self._data: dict[str, dict] | None = None
+        self._journal_records = 0
+        self._fh = None
+
+    # ---------- загрузка ----------
+
+    def _read_snapshot(self) -> dict[str, dict]:
+        if not self.snapshot_path.exists():
+            return {}
+        try:
+            raw = self.snapshot_path.read_text(encoding="utf-8").strip()
+            if not raw:
+                return {}
+            data = json.loads(raw)
+            if not isinstance(data, dict) or not isinstance(data.get("users"), dict):
+                return {}
+            return data["users"]
+        except Exception:
+            # Если снапшот битый — не падаем, а начинаем заново
+            return {}
+
+    def _replay_journal(self, users: dict[str, dict]) -> tuple[int, int]:
+        """Проигрывает журнал; возвращает (число записей, конец последней полной строки)."""
+        if not self.journal_path.exists():
+            return 0, 0
+
+        applied = 0
+        good_end = 0
+        with open(self.journal_path, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    # недописанный хвост после падения процесса — его обрежет load()
+                    break
+                good_end += len(raw)
+                line = raw.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(rec, dict) or "k" not in rec:
+                    continue
+                users[str(rec["k"])] = rec.get("v") or {}
+                applied += 1
+        return applied, good_end
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+    def load(self) -> None:
+        """Собирает индекс в памяти. Блокирующая операция — звать из пула I/O."""
+        if self._data is None:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            users = self._read_snapshot()
+            self._journal_records, good_end = self._replay_journal(users)
+            # журнал дописывается в режиме "a": без обрезки первая же новая
+            # запись склеилась бы с оборванной строкой и потерялась
+            if self.journal_path.exists() and self.journal_path.stat().st_size > good_end:
+                with open(self.journal_path, "r+b") as f:
+                    f.truncate(good_end)
+            self._data = users
+
+    def _ensure_loaded(self) -> dict[str, dict]:
+        if self._data is None:
+            self.load()
+        return self._data
+
+    def _journal(self):
+        if self._fh is None:
+            self._fh = open(self.journal_path, "a", encoding="utf-8")
+        return self._fh
+
+    # ---------- API ----------
+
+    def get(self, key: str) -> dict | None:
+        return self._ensure_loaded().get(key)
+
+    def put(self, key: str, value: dict) -> None:
+        data = self._ensure_loaded()
+        line = json.dumps({"k": key, "v": value}, ensure_ascii=False, separators=(",", ":"))
+        fh = self._journal()
+        fh.write(line + "\n")
+        fh.flush()
+        data[key] = value
+        self._journal_records += 1
+
+    def __len__(self) -> int:
+        return len(self._ensure_loaded())
+
+    def needs_compaction(self) -> bool:
+        return self._journal_records >= self.compact_every
+
+    def compact(self) -> None:
+        """
+        Переписывает снапшот целиком и обнуляет журнал.
+        Если упадём между replace и truncate — журнал просто проиграется
+        поверх нового снапшота ещё раз (записи полные, повтор безопасен).
+        """
+        data = self._ensure_loaded()
+
+        write_atomic(self.snapshot_path, json.dumps({"users": data}, ensure_ascii=False, indent=2))
+
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        self.journal_path.write_text("", encoding="utf-8")
+        self._journal_records = 0
+
+    def sync(self) -> None:
+        """fsync журнала: всё, что уже дописано, гарантированно на диске."""
+        if self._fh is not None:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
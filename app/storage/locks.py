@@ -0,0 +1,85 @@
+import asyncio
+import time
+import zlib
+
+
+class LockStats:
+    """Сколько раз брали лок, сколько раз пришлось ждать и сколько ждали."""
+
+    __slots__ = ("acquisitions", "contended", "wait_total", "wait_max")
+
+    def __init__(self):
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited: float, contended: bool) -> None:
+        self.acquisitions += 1
+        if contended:
+            self.contended += 1
+        self.wait_total += waited
+        if waited > self.wait_max:
+            self.wait_max = waited
+
+    def as_dict(self) -> dict:
+        return {
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "wait_total_ms": round(self.wait_total * 1000, 3),
+            "wait_avg_ms": round(self.wait_total * 1000 / self.acquisitions, 3) if self.acquisitions else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+# имя лока -> статистика (общая для всех полос одного StripedLock)
+_STATS: dict[str, LockStats] = {}
+
+
+def _stats_for(name: str) -> LockStats:
+    stats = _STATS.get(name)
+    if stats is None:
+        stats = _STATS[name] = LockStats()
+    return stats
+
+
+def lock_stats() -> dict[str, dict]:
+    """Метрика конкуренции по всем локам хранилища."""
+    return {name: st.as_dict() for name, st in sorted(_STATS.items())}
+
+
+class TimedLock:
+    """asyncio.Lock, который учитывает время ожидания."""
+
+    def __init__(self, name: str, stats: LockStats | None = None):
+        self.name = name
+        self.stats = stats or _stats_for(name)
+        self._lock = asyncio.Lock()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    async def __aenter__(self):
+        contended = self._lock.locked()
+        t0 = time.perf_counter()
+        await self._lock.acquire()
+        self.stats.record(time.perf_counter() - t0, contended)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._lock.release()
+
+
+class StripedLock:
+    """
+    Набор локов-«полос»: ключ попадает в полосу по хэшу.
+    Операции над разными пользователями почти никогда не ждут друг друга,
+    а над одним пользователем — строго по очереди.
+    """
+
+    def __init__(self, name: str, stripes: int = 64):
+        stats = _stats_for(name)
+        self._locks = [TimedLock(name, stats) for _ in range(stripes)]
+
+    def for_key(self, key: str) -> TimedLock:
+        return self._locks[zlib.crc32(key.encode("utf-8")) % len(self._locks)]
@@ -0,0 +1,137 @@
+"""
+Перенос data/pro_scenario.json в пошардированную раскладку data/pro_scenario/<prefix>/<tg_id>.json.
+
+Запуск из корня проекта:
+    python -m app.storage.migrate_pro_scenario [--src data/pro_scenario.json] [--dst data/pro_scenario]
+
+Исходный файл читается потоково: в памяти одновременно держится только
+одна запись пользователя и буфер чтения, поэтому размер файла не важен.
+Исходник не удаляется — после проверки его можно убрать руками.
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import Iterator
+
+from app.storage.backends import ShardedJsonBackend
+from app.storage.pro_scenario_store import DATA_PATH, SHARDS_DIR
+
+CHUNK_SIZE = 1024 * 1024
+
+_WS = " \t\r\n"
+
+
+class _JsonStream:
+    """Минимальный потоковый разбор: значения достаются через raw_decode по мере чтения файла."""
+
+    def __init__(self, f):
+        self._f = f
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._f.read(CHUNK_SIZE)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WS:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError("Неожиданный конец файла")
+
+    def expect(self, ch: str) -> None:
+        if self.peek() != ch:
+            raise ValueError(f"Ожидался {ch!r}, а встретился {self._buf[self._pos]!r}")
+        self._pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+                # значение, упёршееся в конец буфера (например, число), могло быть обрезано
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return obj
+            except ValueError:
+                if self._eof:
+                    raise
+            self._fill()
+
+
+def iter_users(path: Path) -> Iterator[tuple[str, dict]]:
+    """Отдаёт пары (tg_id, запись) из файла вида {"users": {...}}, не загружая его целиком."""
+    with open(path, "r", encoding="utf-8") as f:
+        stream = _JsonStream(f)
+        stream.expect("{")
+        if stream.peek() == "}":
+            return
+
+        while True:
+            key = stream.value()
+            stream.expect(":")
+
+            if key != "users":
+                stream.value()
+            else:
+                stream.expect("{")
+                if stream.peek() != "}":
+                    while True:
+                        tg_id = stream.value()
+                        stream.expect(":")
+                        record = stream.value()
+                        if isinstance(record, dict):
+                            yield str(tg_id), record
+                        if stream.peek() == ",":
+                            stream.expect(",")
+                            continue
+                        break
+                stream.expect("}")
+
+            if stream.peek() == ",":
+                stream.expect(",")
+                continue
+            stream.expect("}")
+            return
+
+
+def migrate(src: Path, dst: Path) -> int:
+    backend = ShardedJsonBackend(dst)
+    count = 0
+    for tg_id, record in iter_users(src):
+        backend.write(tg_id, record, durable=False)
+        count += 1
+        if count % 10000 == 0:
+            print(f"… перенесено {count}")
+    os.sync()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--src", type=Path, default=DATA_PATH)
+    parser.add_argument("--dst", type=Path, default=SHARDS_DIR)
+    args = parser.parse_args()
+
+    if not args.src.exists():
+        raise SystemExit(f"Нет исходного файла: {args.src}")
+
+    count = migrate(args.src, args.dst)
+    print(f"✅ Перенесено пользователей: {count} → {args.dst}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,46 @@
-import json
-import asyncio
 from pathlib import Path
 from datetime import datetime, timezone
 
-_LOCK = asyncio.Lock()
+from app.storage.backends import RecordBackend, JsonFileBackend
+from app.storage.cache import CachedBackend
 
 BASE_DIR = Path(__file__).resolve().parents[2]
 DATA_PATH = BASE_DIR / "data" / "pro_scenario.json"
+# пошардированная раскладка: data/pro_scenario/<prefix>/<tg_id>.json
+SHARDS_DIR = BASE_DIR / "data" / "pro_scenario"
 
+# По умолчанию — один JSON-файл (он и так держит записи в памяти, кэш не нужен).
+# main.py может подменить backend (например, на SQLite за CachedBackend).
+_backend: RecordBackend = JsonFileBackend(DATA_PATH)
+
+
+def set_backend(backend: RecordBackend) -> None:
+    global _backend
+    _backend = backend
 
-def _utc_now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
 
+def get_backend() -> RecordBackend:
+    return _backend
 
-async def _load() -> dict:
-    if not DATA_PATH.exists():
-        return {"users": {}}
-    try:
-        text = DATA_PATH.read_text(encoding="utf-8")
-        return json.loads(text) if text.strip() else {"users": {}}
-    except Exception:
-        return {"users": {}}
 
+async def flush() -> None:
+    """Дождаться, пока все уже сделанные изменения будут записаны на диск."""
+    await _backend.flush()
 
-async def _save(db: dict) -> None:
-    DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
-    DATA_PATH.write_text(json.dumps(db, ensure_ascii=False, indent=2), encoding="utf-8")
+
+def cache_stats() -> dict:
+    """Счётчики попаданий/промахов кэша (пусто, если backend без кэша)."""
+    if isinstance(_backend, CachedBackend):
+        return _backend.stats()
+    return {}
+
+
+def _utc_now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
 
 
 async def get_scenario(tg_id: int) -> dict | None:
-    async with _LOCK:
-        db = await _load()
-        return db.get("users", {}).get(str(tg_id))
+    return await _backend.get(str(tg_id))
 
 
 async def upsert_stage1(
@@ -40,34 +49,75 @@ async def upsert_stage1(
     analysis_full: str | None = None,
     analysis_short: str | None = None,
 ) -> None:
-    async with _LOCK:
-        db = await _load()
-        users = db.setdefault("users", {})
-        u = users.setdefault(str(tg_id), {})
+    def _apply(u: dict):
         u["updated_at"] = _utc_now_iso()
         u["stage1"] = {
             "qa": qa,
             "analysis_full": analysis_full,
             "analysis_short": analysis_short,
         }
-        await _save(db)
 
+    await _backend.update(str(tg_id), _apply)
 
-async def upsert_stage2(tg_id: int, text: str) -> None:
-    async with _LOCK:
-        db = await _load()
-        users = db.setdefault("users", {})
-        u = users.setdefault(str(tg_id), {})
-        u["updated_at"] = _utc_now_iso()
-        u["stage2"] = {"text": text}
-        await _save(db)
 
+def _stage_entry(text: str, speculative: bool, input_hash: str | None) -> dict:
+    entry = {"text": text}
+    if speculative:
+        # сгенерировано заранее, пользователь ещё не открывал
+        entry["speculative"] = True
+    if input_hash:
+        entry["input"] = input_hash
+    return entry
 
-async def upsert_stage3(tg_id: int, text: str) -> None:
-    async with _LOCK:
-        db = await _load()
-        users = db.setdefault("users", {})
-        u = users.setdefault(str(tg_id), {})
+
+async def _upsert_stage(tg_id: int, stage: str, text: str, speculative: bool, input_hash: str | None) -> bool:
+    """Возвращает True, если затёрли заранее сгенерированный и так и не открытый текст."""
+    replaced_unclaimed = False
+
+    def _apply(u: dict):
+        nonlocal replaced_unclaimed
+        replaced_unclaimed = bool((u.get(stage) or {}).get("speculative"))
         u["updated_at"] = _utc_now_iso()
-        u["stage3"] = {"text": text}
-        await _save(db)
+        u[stage] = _stage_entry(text, speculative, input_hash)
+
+    await _backend.update(str(tg_id), _apply)
+    return replaced_unclaimed
+
+
+async def upsert_stage2(tg_id: int, text: str, speculative: bool = False, input_hash: str | None = None) -> bool:
+    return await _upsert_stage(tg_id, "stage2", text, speculative, input_hash)
+
+
+async def upsert_stage3(tg_id: int, text: str, speculative: bool = False, input_hash: str | None = None) -> bool:
+    return await _upsert_stage(tg_id, "stage3", text, speculative, input_hash)
+
+
+async def claim_speculative(tg_id: int, stage: str) -> bool:
+    """Пользователь открыл этап: снимаем пометку. True — текст был сгенерирован заранее."""
+    was = False
+
+    def _apply(u: dict):
+        nonlocal was
+        entry = u.get(stage)
+        if isinstance(entry, dict) and entry.pop("speculative", None):
+            was = True
+
+    await _backend.update(str(tg_id), _apply)
+    return was
+
+
+async def record_funnel(tg_id: int, step: str) -> dict:
+    """
+    Счётчики воронки пользователя (stage1 — завершённые анализы, stage2/stage3 — нажатия).
+    Возвращает значения ДО этого события.
+    """
+    before: dict = {}
+
+    def _apply(u: dict):
+        nonlocal before
+        funnel = u.setdefault("funnel", {})
+        before = dict(funnel)
+        funnel[step] = funnel.get(step, 0) + 1
+
+    await _backend.update(str(tg_id), _apply)
+    return before
@@ -0,0 +1,276 @@
+import asyncio
+import copy
+import json
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Any
+
+from app.storage.backends import RecordBackend, Mutator
+from app.storage.io import run_io
+from app.storage.locks import StripedLock, TimedLock
+
+# запись: длина ключа (u16), длина значения (u32), ключ (utf-8), значение (компактный JSON, utf-8)
+_REC = struct.Struct("<HI")
+# индекс: длина файла данных, которую он покрывает (u64), затем пары (длина ключа u16, ключ, смещение u64)
+_IDX_HEAD = struct.Struct("<Q")
+_IDX_KEY = struct.Struct("<H")
+_IDX_OFF = struct.Struct("<Q")
+
+
+class RecordFile:
+    """
+    Файл записей с префиксом длины + индекс tg_id -> смещение.
+
+    - <name>.rec — только дозапись; обновление пользователя = новая запись в конец;
+    - <name>.idx — сохранённый индекс, чтобы не сканировать весь файл при старте
+      (хвост после последнего сохранения индекса досканируется);
+    - чтение идёт через mmap: разбираем только нужную запись, кэшированием страниц занимается ОС.
+
+    Мёртвые (перезаписанные) записи убираются компактизацией.
+    Все методы блокирующие — вызывать из пула run_io.
+    """
+
+    def __init__(self, path: Path, compact_ratio: float = 0.5):
+        self.path = path
+        self.index_path = path.with_suffix(".idx")
+        self.compact_ratio = compact_ratio
+
+        self._index: dict[str, tuple[int, int]] | None = None  # key -> (offset, полная длина записи)
+        self._size = 0
+        self._live_bytes = 0
+        self._fh = None
+        self._mm: mmap.mmap | None = None
+        # чтения идут из разных потоков пула: смещение и mmap должны браться из одной версии файла
+        self._swap_lock = threading.Lock()
+
+    # ---------- индекс ----------
+
+    def _load_index(self) -> tuple[dict[str, tuple[int, int]], int]:
+        index: dict[str, tuple[int, int]] = {}
+        try:
+            raw = self.index_path.read_bytes()
+        except FileNotFoundError:
+            return index, 0
+
+        try:
+            (covered,) = _IDX_HEAD.unpack_from(raw, 0)
+            pos = _IDX_HEAD.size
+            while pos < len(raw):
+                (klen,) = _IDX_KEY.unpack_from(raw, pos)
+                pos += _IDX_KEY.size
+                key = raw[pos:pos + klen].decode("utf-8")
+                pos += klen
+                (off,) = _IDX_OFF.unpack_from(raw, pos)
+                pos += _IDX_OFF.size
+                index[key] = (off, 0)
+        except (struct.error, UnicodeDecodeError):
+            # битый индекс — пересоберём сканированием
+            return {}, 0
+        return index, covered
+
+    def _save_index(self) -> None:
+        parts = [_IDX_HEAD.pack(self._size)]
+        for key, (off, _) in self._index.items():
+            kb = key.encode("utf-8")
+            parts.append(_IDX_KEY.pack(len(kb)))
+            parts.append(kb)
+            parts.append(_IDX_OFF.pack(off))
+        tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+        tmp.write_bytes(b"".join(parts))
+        os.replace(tmp, self.index_path)
+
+    def _scan(self, mm, start: int, index: dict[str, tuple[int, int]]) -> int:
+        """Досканирует записи с позиции start. Возвращает конец последней целой записи."""
+        pos = start
+        end = len(mm)
+        while pos + _REC.size <= end:
+            klen, vlen = _REC.unpack_from(mm, pos)
+            total = _REC.size + klen + vlen
+            if pos + total > end:
+                break  # недописанный хвост после падения
+            key = mm[pos + _REC.size:pos + _REC.size + klen].decode("utf-8")
+            index[key] = (pos, total)
+            pos += total
+        return pos
+
+    @property
+    def loaded(self) -> bool:
+        return self._index is not None
+
+    def load(self) -> None:
+        if self._index is not None:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.touch(exist_ok=True)
+        file_size = self.path.stat().st_size
+
+        index, covered = self._load_index()
+        if covered > file_size:
+            index, covered = {}, 0
+
+        if file_size:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # длины записей в сохранённом индексе не хранятся — дочитываем заголовки
+                for key, (off, _) in index.items():
+                    klen, vlen = _REC.unpack_from(mm, off)
+                    index[key] = (off, _REC.size + klen + vlen)
+                good_end = self._scan(mm, covered, index)
+        else:
+            good_end = 0
+
+        if good_end < file_size:
+            with open(self.path, "r+b") as f:
+                f.truncate(good_end)
+
+        self._index = index
+        self._size = good_end
+        self._live_bytes = sum(length for _, length in index.values())
+
+    # ---------- чтение / запись ----------
+
+    def _mapping(self, need: int) -> mmap.mmap:
+        if self._mm is None or len(self._mm) < need:
+            with open(self.path, "rb") as f:
+                # старый mmap не закрываем: его может дочитывать другой поток, закроется сборщиком
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+    def get(self, key: str) -> dict | None:
+        self.load()
+        with self._swap_lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            off, total = entry
+            mm = self._mapping(off + total)
+        klen, vlen = _REC.unpack_from(mm, off)
+        start = off + _REC.size + klen
+        return json.loads(mm[start:start + vlen])
+
+    def put(self, key: str, value: dict) -> None:
+        self.load()
+        kb = key.encode("utf-8")
+        vb = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        if self._fh is None:
+            self._fh = open(self.path, "ab")
+        self._fh.write(_REC.pack(len(kb), len(vb)) + kb + vb)
+        self._fh.flush()
+
+        total = _REC.size + len(kb) + len(vb)
+        old = self._index.get(key)
+        if old is not None:
+            self._live_bytes -= old[1]
+        self._index[key] = (self._size, total)
+        self._size += total
+        self._live_bytes += total
+
+    def sync(self) -> None:
+        if self._fh is not None:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+        self._save_index()
+
+    def __len__(self) -> int:
+        self.load()
+        return len(self._index)
+
+    def needs_compaction(self) -> bool:
+        return self._size > 1024 * 1024 and self._live_bytes < self._size * self.compact_ratio
+
+    def compact(self) -> None:
+        """Переписывает только живые записи в новый файл и атомарно подменяет старый."""
+        self.load()
+        mm = self._mapping(self._size)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+
+        new_index: dict[str, tuple[int, int]] = {}
+        pos = 0
+        with open(tmp, "wb") as out:
+            for key, (off, total) in self._index.items():
+                out.write(mm[off:off + total])
+                new_index[key] = (pos, total)
+                pos += total
+            out.flush()
+            os.fsync(out.fileno())
+
+        with self._swap_lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+            # старый индекс указывает в старый файл: без него после падения просто пересканируем
+            self.index_path.unlink(missing_ok=True)
+            os.replace(tmp, self.path)
+            self._mm = None
+            self._index = new_index
+            self._size = pos
+            self._live_bytes = pos
+        self._save_index()
+
+    def close(self) -> None:
+        if self._index is not None:
+            self.sync()
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        self._mm = None
+
+
+class RecordFileBackend(RecordBackend):
+    """
+    RecordBackend поверх RecordFile: лок полосы на запись пользователя, файловый лок на дозапись.
+    Компактизация идёт фоновой задачей, а не внутри update, вызвавшего её.
+    """
+
+    def __init__(self, path: Path):
+        self._file = RecordFile(path)
+        self._record_locks = StripedLock(f"{path.stem}.record")
+        self._file_lock = TimedLock(f"{path.stem}.file")
+        self._compaction_task: asyncio.Task | None = None
+
+    async def _ready(self):
+        if not self._file.loaded:
+            async with self._file_lock:
+                if not self._file.loaded:
+                    await run_io(self._file.load)
+
+    async def get(self, key: str) -> dict | None:
+        await self._ready()
+        return await run_io(self._file.get, key)
+
+    async def _compact(self):
+        async with self._file_lock:
+            # пока ждали лок, файл мог уже переписать кто-то другой
+            if self._file.needs_compaction():
+                await run_io(self._file.compact)
+
+    async def update(self, key: str, fn: Mutator) -> Any:
+        await self._ready()
+        async with self._record_locks.for_key(key):
+            old = await run_io(self._file.get, key)
+            record = copy.deepcopy(old) if old is not None else {}
+            result = fn(record)
+            if record != old:
+                async with self._file_lock:
+                    await run_io(self._file.put, key, record)
+
+        # мёртвых записей слишком много — переписываем файл в фоне
+        if self._file.needs_compaction() and (self._compaction_task is None or self._compaction_task.done()):
+            self._compaction_task = asyncio.get_running_loop().create_task(self._compact())
+
+        return result
+
+    async def flush(self) -> None:
+        await self._ready()
+        async with self._file_lock:
+            await run_io(self._file.sync)
+
+    async def close(self) -> None:
+        if self._compaction_task is not None:
+            await self._compaction_task
+        async with self._file_lock:
+            await run_io(self._file.close)
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from app.storage.backends import RecordBackend, Mutator
+
+_TABLE_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class SqliteBackend(RecordBackend):
+    """
+    SQLite в режиме WAL: одна строка на пользователя, первичный ключ по tg_id.
+
+    Вся работа с соединением идёт в отдельном потоке (executor на 1 воркер),
+    поэтому event loop не блокируется. Запросы — фиксированные строки с параметрами,
+    sqlite3 кэширует их подготовленные statements.
+    Чтение-изменение-запись делается в BEGIN IMMEDIATE, так что с одной базой
+    могут работать несколько процессов.
+    """
+
+    def __init__(self, path: Path, table: str):
+        if not _TABLE_RE.match(table):
+            raise ValueError(f"Некорректное имя таблицы: {table!r}")
+
+        self.path = path
+        self.table = table
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sqlite-{table}")
+        self._conn: sqlite3.Connection | None = None
+
+        self._sql_get = f"SELECT data FROM {table} WHERE tg_id = ?"
+        self._sql_put = (
+            f"INSERT INTO {table} (tg_id, data) VALUES (?, ?) "
+            "ON CONFLICT(tg_id) DO UPDATE SET data = excluded.data"
+        )
+
+    # ---------- поток SQLite ----------
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None, cached_statements=64, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "tg_id TEXT PRIMARY KEY, "
+                "data TEXT NOT NULL"
+                ")"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _get_sync(self, key: str) -> dict | None:
+        row = self._connection().execute(self._sql_get, (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _update_sync(self, key: str, fn: Mutator) -> Any:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(self._sql_get, (key,)).fetchone()
+            old_text = row[0] if row else None
+            record = json.loads(old_text) if old_text else {}
+
+            result = fn(record)
+
+            new_text = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+            if new_text != old_text:
+                conn.execute(self._sql_put, (key, new_text))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _close_sync(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # ---------- API ----------
+
+    async def get(self, key: str) -> dict | None:
+        return await self._run(self._get_sync, key)
+
+    async def update(self, key: str, fn: Mutator) -> Any:
+        return await self._run(self._update_sync, key, fn)
+
+    async def close(self) -> None:
+        await self._run(self._close_sync)
+        self._executor.shutdown(wait=True)
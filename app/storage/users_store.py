@@ -1,50 +1,34 @@
-import json
-import os
 from pathlib import Path
-from datetime import datetime, timezone
-import asyncio
+from datetime import datetime, timezone, timedelta
+
+from app.services.quota import QuotaEngine, QuotaRule
+from app.storage.backends import RecordBackend, JournalBackend
 
 # users.json лежит в корне проекта: /data/users.json
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 DATA_DIR = PROJECT_ROOT / "data"
 USERS_FILE = DATA_DIR / "users.json"
 
-# Чтобы два запроса одновременно не портили файл
-_file_lock = asyncio.Lock()
+# По умолчанию — users.json + users.journal. main.py может подменить backend (например, на SQLite).
+_backend: RecordBackend = JournalBackend(USERS_FILE)
 
 
-def _utc_now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+def set_backend(backend: RecordBackend) -> None:
+    global _backend
+    _backend = backend
 
 
-def _ensure_file():
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    if not USERS_FILE.exists():
-        USERS_FILE.write_text(json.dumps({"users": {}}, ensure_ascii=False, indent=2), encoding="utf-8")
+def get_backend() -> RecordBackend:
+    return _backend
 
 
-def _read_sync() -> dict:
-    _ensure_file()
-    try:
-        raw = USERS_FILE.read_text(encoding="utf-8").strip()
-        if not raw:
-            return {"users": {}}
-        data = json.loads(raw)
-        if not isinstance(data, dict):
-            return {"users": {}}
-        if "users" not in data or not isinstance(data["users"], dict):
-            data["users"] = {}
-        return data
-    except Exception:
-        # Если файл битый — не падаем, а начинаем заново
-        return {"users": {}}
+async def flush() -> None:
+    """Дождаться, пока все уже сделанные изменения будут записаны на диск."""
+    await _backend.flush()
 
 
-def _write_sync(data: dict):
-    _ensure_file()
-    tmp = USERS_FILE.with_suffix(".json.tmp")
-    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-    os.replace(tmp, USERS_FILE)
+def _utc_now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
 
 
 async def save_fitness_profile_result(
@@ -55,36 +39,22 @@ async def save_fitness_profile_result(
     Сохраняем только ФИНАЛ теста.
     answers: dict где ключи — индексы вопросов (0..7), значения — строки ответов.
     """
-    async with _file_lock:
-        data = _read_sync()
-
-        users = data["users"]
-        key = str(tg_id)
-
-        user = users.get(key, {})
-        if not isinstance(user, dict):
-            user = {}
-
+    def _apply(user: dict):
         user["tg_id"] = tg_id
         user["fitness_profile"] = {
             "completed_at": _utc_now_iso(),
             "answers": answers,
         }
 
-        users[key] = user
-        data["users"] = users
-
-        _write_sync(data)
+    # результат и отметка кулдауна пишутся одним update записи.
+    # Прохождение уже случилось — фиксируем его даже сверх лимита
+    await quota.try_consume(tg_id, FITNESS_PROFILE, force=True, mutate=_apply)
 
 
 async def get_user(tg_id: int) -> dict | None:
-    async with _file_lock:
-        data = _read_sync()
-        return data["users"].get(str(tg_id))
+    return await _backend.get(str(tg_id))
 
 
-from datetime import datetime, timezone, timedelta
-
 def _parse_iso(dt_str: str) -> datetime | None:
     try:
         # поддержка isoformat с timezone
@@ -93,33 +63,48 @@ def _parse_iso(dt_str: str) -> datetime | None:
         return None
 
 
-async def can_start_fitness_profile(tg_id: int, cooldown_days: int = 7) -> tuple[bool, str | None]:
-    """
-    Возвращает:
-      (True, None) — можно запускать
-      (False, msg) — нельзя, msg содержит текст когда можно
-    """
-    user = await get_user(tg_id)
-    if not user:
-        return True, None
+# ---------- квоты бесплатной версии ----------
+
+FITNESS_PROFILE = "fitness_profile"
+NUTRITION = "nutrition"
+
+FITNESS_COOLDOWN_DAYS = 7
+NUTRITION_LIMIT_PER_WEEK = 3
+
 
+def _legacy_fitness_uses(user: dict) -> list[datetime]:
+    """До QuotaEngine кулдаун считался от fitness_profile.completed_at."""
     fp = user.get("fitness_profile")
-    if not fp:
-        return True, None
+    dt = _parse_iso(fp.get("completed_at") or "") if isinstance(fp, dict) else None
+    return [dt] if dt else []
 
-    completed_at = fp.get("completed_at")
-    if not completed_at:
-        return True, None
 
-    dt = _parse_iso(completed_at)
-    if not dt:
-        return True, None
+def _legacy_nutrition_uses(user: dict) -> list[datetime]:
+    """До QuotaEngine попытки хранились как free_usage.nutrition = {week_start, count}."""
+    free = user.get("free_usage")
+    nut = free.get("nutrition") if isinstance(free, dict) else None
+    if not isinstance(nut, dict):
+        return []
+    ws = _parse_iso(nut.get("week_start") or "")
+    count = int(nut.get("count", 0) or 0)
+    return [ws] * count if ws else []
 
-    now = datetime.now(timezone.utc)
-    next_allowed = dt + timedelta(days=cooldown_days)
 
-    if now >= next_allowed:
-        return True, None
+quota = QuotaEngine(
+    rules={
+        FITNESS_PROFILE: QuotaRule(limit=1, period=timedelta(days=FITNESS_COOLDOWN_DAYS)),
+        NUTRITION: QuotaRule(limit=NUTRITION_LIMIT_PER_WEEK, calendar_week=True),
+    },
+    backend_getter=get_backend,
+    legacy_loaders={
+        FITNESS_PROFILE: _legacy_fitness_uses,
+        NUTRITION: _legacy_nutrition_uses,
+    },
+)
+
+
+def _fitness_limit_msg(next_allowed: datetime) -> str:
+    now = datetime.now(timezone.utc)
 
     # сколько осталось
     remaining = next_allowed - now
@@ -130,142 +115,73 @@ async def can_start_fitness_profile(tg_id: int, cooldown_days: int = 7) -> tuple
     # когда можно (в UTC); можно потом сделать по МСК — позже
     when_str = next_allowed.strftime("%d.%m.%Y %H:%M UTC")
 
-    msg = (
+    return (
         "⏳ Фитнес-профиль в бесплатной версии можно проходить **1 раз в неделю**.\n\n"
         f"Следующая попытка будет доступна: **{when_str}**.\n"
         f"Осталось примерно: **{days} д {hours} ч**."
     )
-    return False, msg
-
-from datetime import datetime, timezone, timedelta
 
-def _week_start_utc_iso(dt: datetime) -> str:
-    # неделя с понедельника 00:00 UTC
-    dt0 = dt.astimezone(timezone.utc)
-    start = dt0 - timedelta(days=dt0.weekday(), hours=dt0.hour, minutes=dt0.minute, seconds=dt0.second, microseconds=dt0.microsecond)
-    return start.isoformat()
 
-def _parse_iso(dt_str: str) -> datetime | None:
-    try:
-        return datetime.fromisoformat(dt_str.replace("Z", "+00:00"))
-    except Exception:
-        return None
+def _nutrition_limit_msg(next_week: datetime) -> str:
+    when_str = next_week.strftime("%d.%m.%Y %H:%M UTC")
+    return (
+        "⏳ Подбор рациона в бесплатной версии доступен **3 раза в неделю**.\n\n"
+        f"Лимит на эту неделю исчерпан. Следующие попытки будут доступны: **{when_str}**."
+    )
 
 
-from datetime import datetime, timezone, timedelta
+def _fitness_rule(cooldown_days: int) -> QuotaRule | None:
+    # None — правило по умолчанию из quota.rules
+    if cooldown_days == FITNESS_COOLDOWN_DAYS:
+        return None
+    return QuotaRule(limit=1, period=timedelta(days=cooldown_days))
 
-def _week_start_utc_iso(dt: datetime) -> str:
-    dt0 = dt.astimezone(timezone.utc)
-    start = dt0 - timedelta(
-        days=dt0.weekday(),
-        hours=dt0.hour,
-        minutes=dt0.minute,
-        seconds=dt0.second,
-        microseconds=dt0.microsecond
-    )
-    return start.isoformat()
 
-def _parse_iso(dt_str: str) -> datetime | None:
-    try:
-        return datetime.fromisoformat(dt_str.replace("Z", "+00:00"))
-    except Exception:
+def _nutrition_rule(limit_per_week: int) -> QuotaRule | None:
+    if limit_per_week == NUTRITION_LIMIT_PER_WEEK:
         return None
+    return QuotaRule(limit=limit_per_week, calendar_week=True)
 
 
-async def can_use_free_nutrition(tg_id: int, limit_per_week: int = 3) -> tuple[bool, str | None]:
+async def can_start_fitness_profile(tg_id: int, cooldown_days: int = FITNESS_COOLDOWN_DAYS) -> tuple[bool, str | None]:
     """
-    Только проверяем, НЕ списываем.
+    Возвращает:
+      (True, None) — можно запускать
+      (False, msg) — нельзя, msg содержит текст когда можно
     """
-    now = datetime.now(timezone.utc)
-    week_start = _week_start_utc_iso(now)
-
-    user = await get_user(tg_id)
-    if not user:
+    decision = await quota.check(tg_id, FITNESS_PROFILE, rule=_fitness_rule(cooldown_days))
+    if decision.ok:
         return True, None
+    return False, _fitness_limit_msg(decision.retry_at)
 
-    free = user.get("free_usage", {})
-    if not isinstance(free, dict):
-        return True, None
 
-    nut = free.get("nutrition", {})
-    if not isinstance(nut, dict):
-        return True, None
-
-    saved_week = nut.get("week_start")
-    count = int(nut.get("count", 0) or 0)
-
-    # новая неделя -> считаем, что доступно
-    if saved_week != week_start:
+async def can_use_free_nutrition(tg_id: int, limit_per_week: int = NUTRITION_LIMIT_PER_WEEK) -> tuple[bool, str | None]:
+    """
+    Только проверяем, НЕ списываем.
+    """
+    decision = await quota.check(tg_id, NUTRITION, rule=_nutrition_rule(limit_per_week))
+    if decision.ok:
         return True, None
+    return False, _nutrition_limit_msg(decision.retry_at)
 
-    if count >= limit_per_week:
-        ws_dt = _parse_iso(saved_week) or now
-        next_week = ws_dt + timedelta(days=7)
-        when_str = next_week.strftime("%d.%m.%Y %H:%M UTC")
 
-        msg = (
-            "⏳ Подбор рациона в бесплатной версии доступен **3 раза в неделю**.\n\n"
-            f"Лимит на эту неделю исчерпан. Следующие попытки будут доступны: **{when_str}**."
-        )
-        return False, msg
-
-    return True, None
-
-
-async def consume_free_nutrition_use(tg_id: int, limit_per_week: int = 3) -> tuple[bool, str | None]:
+async def reserve_free_nutrition_use(tg_id: int, limit_per_week: int = NUTRITION_LIMIT_PER_WEEK):
     """
-    Списываем 1 попытку. Вызывать ТОЛЬКО после успешного ответа GPT.
+    Атомарно проверяем и списываем 1 попытку ДО вызова GPT.
+    Возвращает (reservation, None) или (None, msg).
+    При ошибке AI — await reservation.refund(), при успехе — reservation.commit().
     """
-    now = datetime.now(timezone.utc)
-    week_start = _week_start_utc_iso(now)
-
-    async with _file_lock:
-        data = _read_sync()
-        users = data["users"]
-        key = str(tg_id)
-
-        user = users.get(key, {})
-        if not isinstance(user, dict):
-            user = {}
-
-        free = user.get("free_usage", {})
-        if not isinstance(free, dict):
-            free = {}
-
-        nut = free.get("nutrition", {})
-        if not isinstance(nut, dict):
-            nut = {}
-
-        saved_week = nut.get("week_start")
-        count = int(nut.get("count", 0) or 0)
-
-        # новая неделя -> сбрасываем
-        if saved_week != week_start:
-            saved_week = week_start
-            count = 0
-
-        if count >= limit_per_week:
-            ws_dt = _parse_iso(saved_week) or now
-            next_week = ws_dt + timedelta(days=7)
-            when_str = next_week.strftime("%d.%m.%Y %H:%M UTC")
-
-            msg = (
-                "⏳ Подбор рациона в бесплатной версии доступен **3 раза в неделю**.\n\n"
-                f"Лимит на эту неделю исчерпан. Следующие попытки будут доступны: **{when_str}**."
-            )
-            return False, msg
-
-        count += 1
-        nut["week_start"] = saved_week
-        nut["count"] = count
-
-        free["nutrition"] = nut
-        user["free_usage"] = free
-        user["tg_id"] = tg_id
+    reservation, decision = await quota.reserve(tg_id, NUTRITION, rule=_nutrition_rule(limit_per_week))
+    if reservation is None:
+        return None, _nutrition_limit_msg(decision.retry_at)
+    return reservation, None
 
-        users[key] = user
-        data["users"] = users
-        _write_sync(data)
 
+async def consume_free_nutrition_use(tg_id: int, limit_per_week: int = NUTRITION_LIMIT_PER_WEEK) -> tuple[bool, str | None]:
+    """
+    Списываем 1 попытку (проверка и списание — одна атомарная операция).
+    """
+    decision = await quota.try_consume(tg_id, NUTRITION, rule=_nutrition_rule(limit_per_week))
+    if decision.ok:
         return True, None
-
+    return False, _nutrition_limit_msg(decision.retry_at)
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Mapping
+
+import yaml
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from pydantic import ConfigDict
+
+from app.ui.keyboards import custom_keyboard, question_keyboard
+
+CONFIG_DIR = Path(__file__).resolve().parents[2] / "config"
+
+# имя -> (файл в config/, префикс callback_data)
+SOURCES: dict[str, tuple[str, str]] = {
+    "mental": ("mental_test.yaml", "mental"),
+    "fitness": ("fitness_test.yaml", "fitness"),
+}
+
+
+def strip_option_prefix(text: str) -> str:
+    """
+    Убирает префиксы вида 'A) ' / 'B) ' и т.п. в начале строки.
+    Пример: 'A) Тревога о будущем' -> 'Тревога о будущем'
+    """
+    t = (text or "").strip()
+    if len(t) >= 3 and t[0].isalpha() and t[1] == ")" and t[2] == " ":
+        return t[3:].strip()
+    if len(t) >= 2 and t[0].isalpha() and t[1] == ")":
+        return t[2:].strip()
+    return t
+
+
+class _FrozenButton(InlineKeyboardButton):
+    """Кнопка, которую нельзя изменить: одни и те же объекты уходят всем пользователям."""
+    model_config = ConfigDict(frozen=True)
+
+
+# ряды клавиатуры; кортежи и замороженные кнопки — общий экземпляр не испортить
+Rows = tuple[tuple[InlineKeyboardButton, ...], ...]
+
+
+def _freeze(markup: InlineKeyboardMarkup) -> Rows:
+    return tuple(
+        tuple(_FrozenButton(**button.model_dump(exclude_none=True)) for button in row)
+        for row in markup.inline_keyboard
+    )
+
+
+def _markup(rows: Rows) -> InlineKeyboardMarkup:
+    # новая разметка на каждую отрисовку: списки свои, кнопки — общие и неизменяемые
+    return InlineKeyboardMarkup(inline_keyboard=[list(row) for row in rows])
+
+
+@dataclass(frozen=True)
+class CompiledOption:
+    id: str
+    text: str     # текст кнопки
+    answer: str   # то, что сохраняем как ответ (без 'A) ')
+
+
+@dataclass(frozen=True)
+class CompiledQuestion:
+    index: int
+    id: str | None
+    text: str                              # готовый текст панели «Вопрос i/N: …»
+    rows: Rows                             # кнопки вопроса
+    options: Mapping[str, CompiledOption]  # id варианта -> вариант
+
+    @property
+    def keyboard(self) -> InlineKeyboardMarkup:
+        return _markup(self.rows)
+
+
+@dataclass(frozen=True)
+class CompiledQuestionnaire:
+    title: str
+    prefix: str
+    questions: tuple[CompiledQuestion, ...]
+    custom_rows: Rows
+
+    @property
+    def custom_keyboard(self) -> InlineKeyboardMarkup:
+        return _markup(self.custom_rows)
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+
+def compile_questionnaire(path: Path, prefix: str) -> CompiledQuestionnaire:
+    """
+    Собирает из YAML всё, что нужно для отрисовки вопросов: тексты, клавиатуры
+    и словарь вариантов. Делается один раз — handlers только берут готовое.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        raw = yaml.safe_load(f)
+
+    items = raw["questions"]
+    total = len(items)
+    questions = []
+    for i, q in enumerate(items):
+        options = {
+            str(o["id"]): CompiledOption(id=str(o["id"]), text=o["text"], answer=strip_option_prefix(o["text"]))
+            for o in q["options"]
+        }
+        if len(options) != len(q["options"]):
+            raise ValueError(f"{path.name}: повторяющиеся id вариантов в вопросе {i + 1}")
+        questions.append(CompiledQuestion(
+            index=i,
+            id=q.get("id"),
+            text=f"Вопрос {i + 1}/{total}:\n{q['text']}",
+            rows=_freeze(question_keyboard(prefix, i, q["options"])),
+            options=MappingProxyType(options),
+        ))
+
+    return CompiledQuestionnaire(
+        title=raw.get("title", ""),
+        prefix=prefix,
+        questions=tuple(questions),
+        custom_rows=_freeze(custom_keyboard(prefix)),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_questionnaire(name: str) -> CompiledQuestionnaire:
+    filename, prefix = SOURCES[name]
+    return compile_questionnaire(CONFIG_DIR / filename, prefix)
+
+
+def compile_all() -> None:
+    """Компилирует все анкеты при запуске — ошибки в YAML видны сразу, а не на первом нажатии."""
+    for name in SOURCES:
+        get_questionnaire(name)
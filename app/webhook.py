@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import asyncio
+import hmac
+import logging
+import time
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class UpdateQueue:
+    """
+    Ограниченная очередь апдейтов между HTTP-приёмом и Dispatcher.
+
+    Приём только кладёт апдейт в очередь и сразу отвечает Telegram;
+    обрабатывают workers задач. Если очередь полна — отвечаем 503,
+    и Telegram сам повторит доставку позже (естественное противодавление).
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, maxsize: int = 1000, workers: int = 64):
+        self.dp = dp
+        self.bot = bot
+        self.workers = workers
+        self._queue: asyncio.Queue[tuple[float, Update]] = asyncio.Queue(maxsize=maxsize)
+        self._tasks: list[asyncio.Task] = []
+
+        self.received = 0
+        self.rejected = 0
+        self.processed = 0
+        self.errors = 0
+        self._latency_ms: list[float] = []
+
+    def offer(self, update: Update) -> bool:
+        try:
+            self._queue.put_nowait((time.perf_counter(), update))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.received += 1
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            enqueued, update = await self._queue.get()
+            # задержка «апдейт принят → начата обработка»
+            self._latency_ms.append((time.perf_counter() - enqueued) * 1000)
+            if len(self._latency_ms) > 10000:
+                del self._latency_ms[:5000]
+            try:
+                await self.dp.feed_update(self.bot, update)
+                self.processed += 1
+            except Exception:
+                self.errors += 1
+                logger.exception("Ошибка обработки апдейта %s", update.update_id)
+            finally:
+                self._queue.task_done()
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain_timeout_s: float = 10.0) -> None:
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout_s)
+        except asyncio.TimeoutError:
+            logger.warning("Не дождались обработки %s апдейтов при остановке", self._queue.qsize())
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        ordered = sorted(self._latency_ms)
+
+        def pct(q: float) -> float | None:
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3) if ordered else None
+
+        return {
+            "depth": self._queue.qsize(),
+            "received": self.received,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "errors": self.errors,
+            "latency_p50_ms": pct(0.50),
+            "latency_p95_ms": pct(0.95),
+            "latency_p99_ms": pct(0.99),
+        }
+
+
+def make_webhook_app(bot: Bot, queue: UpdateQueue, path: str, secret: str) -> web.Application:
+    expected = secret.encode("utf-8")
+
+    def authorized(request: web.Request) -> bool:
+        # сравниваем байты: compare_digest не принимает строки с не-ASCII символами,
+        # а заголовок присылает кто угодно
+        got = request.headers.get(SECRET_HEADER, "").encode("utf-8", "surrogateescape")
+        return hmac.compare_digest(got, expected)
+
+    async def receive(request: web.Request) -> web.Response:
+        if not authorized(request):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": bot})
+        except Exception:
+            return web.Response(status=400)
+        if not queue.offer(update):
+            return web.Response(status=503)
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        # счётчики очереди — только с секретом, остальным — что сервер жив
+        if authorized(request):
+            return web.json_response(queue.stats())
+        return web.json_response({"status": "ok"})
+
+    app = web.Application()
+    app.router.add_post(path, receive)
+    app.router.add_get("/healthz", health)
+    return app
+
+
+async def run_webhook(
+    bot: Bot,
+    dp: Dispatcher,
+    base_url: str,
+    path: str,
+    secret: str,
+    host: str = "0.0.0.0",
+    port: int = 8080,
+    queue_size: int = 1000,
+    workers: int = 64,
+) -> None:
+    """Поднимает aiohttp-сервер, регистрирует webhook в Telegram и работает до отмены."""
+    queue = UpdateQueue(dp, bot, maxsize=queue_size, workers=workers)
+    runner = web.AppRunner(make_webhook_app(bot, queue, path, secret))
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    queue.start()
+    await bot.set_webhook(
+        url=base_url.rstrip("/") + path,
+        secret_token=secret,
+        drop_pending_updates=True,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info("Webhook: %s%s, слушаем %s:%s", base_url.rstrip("/"), path, host, port)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.shutdown()
+        await queue.stop()
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
@@ -0,0 +1,254 @@
+"""
+Локальный OpenAI-совместимый сервер для нагрузочных тестов без трат на прокси.
+
+Запуск из корня проекта:
+    python -m bench.fake_openai --port 8090 --ttfb-ms 800 --tokens-per-s 40 --error-rate 0.02
+
+И в .env бота:
+    PROXYAPI_BASE_URL=http://127.0.0.1:8090/v1
+
+Реализует POST <любой префикс>/chat/completions — обычный ответ и stream=True (SSE,
+с usage в последнем куске при stream_options.include_usage).
+
+Режимы (--mode):
+- synth  — синтетический текст; задержка первого байта — логнормальная вокруг --ttfb-ms,
+           скорость — --tokens-per-s. Служебные маркеры из промпта (===FULL===, ===STAGE2===, …)
+           воспроизводятся, чтобы handlers могли разобрать ответ;
+- record — запросы уходят в настоящий API (--upstream, ключ из PROXYAPI_KEY),
+           ответы дописываются в --tape;
+- replay — ответы берутся из --tape по хэшу (модель + сообщения), детерминированно;
+           чего нет на ленте — ошибка 404 (или synth с --replay-fallback).
+
+Инъекция ошибок: --error-rate (доля ответов со статусом из --error-status),
+--stall-rate (доля запросов, которые «зависают» на --stall-s — проверка таймаутов).
+
+GET /stats — счётчики запросов.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+import uuid
+from pathlib import Path
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+WORDS = (
+    "жизнь сценарий выбор опыт привычка энергия цель шаг завтрак обед ужин белок "
+    "овощи крупа рутина мечта работа семья интерес изменение ресурс поддержка план"
+).split()
+
+_MARKER_RE = re.compile(r"===[A-Z0-9_]+===")
+
+
+def _request_key(body: dict) -> str:
+    raw = json.dumps({"model": body.get("model"), "messages": body.get("messages")}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeOpenAI:
+    def __init__(self, args):
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.tape: dict[str, dict] = {}
+        self.tape_path = Path(args.tape) if args.tape else None
+        self.stats = {"requests": 0, "streams": 0, "errors": 0, "stalls": 0, "replayed": 0, "recorded": 0, "missed": 0}
+        if args.mode == "replay" and self.tape_path and self.tape_path.exists():
+            for line in self.tape_path.read_text(encoding="utf-8").splitlines():
+                if line.strip():
+                    row = json.loads(line)
+                    self.tape[row["key"]] = row
+
+    # ---------- содержимое ----------
+
+    def _synth_text(self, body: dict, rnd: random.Random) -> str:
+        prompt = "\n".join(m.get("content") or "" for m in body.get("messages", []))
+        markers = list(dict.fromkeys(_MARKER_RE.findall(prompt)))
+        n = max(1, int(rnd.gauss(self.args.tokens, self.args.tokens * 0.2)))
+
+        def words(k: int) -> str:
+            return " ".join(rnd.choice(WORDS) for _ in range(k)).capitalize() + "."
+
+        if not markers:
+            return words(n)
+        per = max(1, n // len(markers))
+        return "\n".join(f"{m}\n{words(per)}" for m in markers)
+
+    async def _upstream(self, body: dict) -> dict:
+        # записываем всегда обычный (не потоковый) ответ — поток потом нарезаем сами
+        headers = {"Authorization": f"Bearer {os.getenv('PROXYAPI_KEY', '')}"}
+        payload = {k: v for k, v in body.items() if k not in ("stream", "stream_options")}
+        async with ClientSession(timeout=ClientTimeout(total=600)) as s:
+            async with s.post(self.args.upstream.rstrip("/") + "/chat/completions", json=payload, headers=headers) as r:
+                r.raise_for_status()
+                return await r.json()
+
+    async def _content(self, body: dict) -> tuple[str, dict | None]:
+        """Текст ответа и usage (None — посчитать приблизительно)."""
+        key = _request_key(body)
+        mode = self.args.mode
+
+        if mode == "replay":
+            row = self.tape.get(key)
+            if row is not None:
+                self.stats["replayed"] += 1
+                return row["content"], row.get("usage")
+            self.stats["missed"] += 1
+            if not self.args.replay_fallback:
+                raise web.HTTPNotFound(text=json.dumps({"error": {"message": "not on tape", "type": "replay_miss"}}),
+                                       content_type="application/json")
+
+        if mode == "record":
+            resp = await self._upstream(body)
+            content = resp["choices"][0]["message"]["content"] or ""
+            usage = resp.get("usage")
+            self.tape[key] = {"key": key, "content": content, "usage": usage}
+            with self.tape_path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(self.tape[key], ensure_ascii=False) + "\n")
+            self.stats["recorded"] += 1
+            return content, usage
+
+        # synth (и replay без записи): детерминированно по запросу
+        return self._synth_text(body, random.Random(f"{self.args.seed}:{key}")), None
+
+    def _usage(self, body: dict, content: str, usage: dict | None) -> dict:
+        if usage:
+            return usage
+        prompt = sum(_approx_tokens(m.get("content") or "") for m in body.get("messages", []))
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": _approx_tokens(content),
+            "total_tokens": prompt + _approx_tokens(content),
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+
+    # ---------- задержки и ошибки ----------
+
+    def _ttfb_s(self) -> float:
+        if self.args.mode == "replay" and not self.args.replay_latency:
+            return 0.0
+        # логнормальное распределение с медианой ttfb-ms
+        return self.args.ttfb_ms / 1000 * self.rnd.lognormvariate(0, self.args.ttfb_sigma)
+
+    def _token_delay_s(self) -> float:
+        if self.args.tokens_per_s <= 0:
+            return 0.0
+        return self.rnd.expovariate(self.args.tokens_per_s)
+
+    async def _maybe_fail(self) -> None:
+        if self.rnd.random() < self.args.stall_rate:
+            self.stats["stalls"] += 1
+            await asyncio.sleep(self.args.stall_s)
+        if self.rnd.random() < self.args.error_rate:
+            self.stats["errors"] += 1
+            status = self.rnd.choice(self.args.error_status)
+            headers = {"Retry-After": "1"} if status == 429 else None
+            raise _http_error(status, headers)
+
+    # ---------- HTTP ----------
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.stats["requests"] += 1
+        await self._maybe_fail()
+        content, usage = await self._content(body)
+        usage = self._usage(body, content, usage)
+        model = body.get("model", "fake")
+        rid = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        await asyncio.sleep(self._ttfb_s())
+
+        if not body.get("stream"):
+            # обычный ответ приходит целиком — ждём и время «генерации»
+            if self.args.mode != "replay" or self.args.replay_latency:
+                await asyncio.sleep(sum(self._token_delay_s() for _ in content.split()))
+            return web.json_response({
+                "id": rid, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        self.stats["streams"] += 1
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await resp.prepare(request)
+
+        async def send(choices: list, extra: dict | None = None):
+            chunk = {"id": rid, "object": "chat.completion.chunk", "created": created, "model": model, "choices": choices}
+            if extra:
+                chunk.update(extra)
+            await resp.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        await send([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        # режем по словам: примерно один кусок на токен-другой, как у настоящего API
+        for piece in re.findall(r"\S+\s*|\s+", content):
+            delay = 0.0 if self.args.mode == "replay" and not self.args.replay_latency else self._token_delay_s()
+            if delay:
+                await asyncio.sleep(delay)
+            await send([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+        await send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send([], {"usage": usage})
+        await resp.write(b"data: [DONE]\n\n")
+        await resp.write_eof()
+        return resp
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+
+def _http_error(status: int, headers: dict | None) -> web.HTTPException:
+    cls = {429: web.HTTPTooManyRequests, 500: web.HTTPInternalServerError, 502: web.HTTPBadGateway,
+           503: web.HTTPServiceUnavailable, 504: web.HTTPGatewayTimeout}.get(status, web.HTTPInternalServerError)
+    return cls(
+        headers=headers,
+        text=json.dumps({"error": {"message": f"injected {status}", "type": "injected", "code": status}}),
+        content_type="application/json",
+    )
+
+
+def make_app(args) -> web.Application:
+    fake = FakeOpenAI(args)
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app.router.add_post("/{prefix:.*}chat/completions", fake.chat_completions)
+    app.router.add_get("/stats", fake.get_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--mode", choices=["synth", "record", "replay"], default="synth")
+    parser.add_argument("--tape", default="bench/tapes/ai.jsonl", help="файл записи для record/replay")
+    parser.add_argument("--upstream", default=os.getenv("PROXYAPI_BASE_URL", "https://api.proxyapi.ru/openai/v1"))
+    parser.add_argument("--replay-fallback", action="store_true", help="в replay отвечать synth, если записи нет")
+    parser.add_argument("--replay-latency", action="store_true", help="в replay тоже имитировать задержки")
+    parser.add_argument("--ttfb-ms", type=float, default=800, help="медиана задержки первого байта")
+    parser.add_argument("--ttfb-sigma", type=float, default=0.5, help="разброс логнормального распределения")
+    parser.add_argument("--tokens-per-s", type=float, default=40, help="скорость генерации (0 — мгновенно)")
+    parser.add_argument("--tokens", type=int, default=600, help="средняя длина synth-ответа в словах")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=lambda v: [int(x) for x in v.split(",")], default=[429, 500, 503])
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--stall-s", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        Path(args.tape).parent.mkdir(parents=True, exist_ok=True)
+
+    print(f"fake OpenAI: http://{args.host}:{args.port}/v1 (mode={args.mode})")
+    web.run_app(make_app(args), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Задержка event loop, пока хранилище переписывает большой pro_scenario.json.
+
+Запуск из корня проекта:
+    python -m bench.loop_lag --users 2000 --writes 20
+
+Параллельно с записями крутится «тикер», который просыпается каждые 5 мс
+и замеряет, насколько он опоздал. Режим inline повторяет старое поведение
+(чтение/запись файла прямо в event loop) — для сравнения.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from app.storage.backends import JsonFileBackend
+
+TICK = 0.005
+
+
+def _make_record(i: int) -> dict:
+    text = ("Длинный сгенерированный текст отчёта. " * 400)[:15000]
+    return {
+        "updated_at": "2026-02-18T17:50:49.119959+00:00",
+        "stage1": {"qa": [{"q": "Мой возраст —", "a": str(20 + i % 40)}], "analysis_full": text, "analysis_short": text[:3000]},
+        "stage2": {"text": text[:3000]},
+    }
+
+
+async def _ticker(stop: asyncio.Event, lags: list[float]):
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, time.perf_counter() - t - TICK))
+
+
+async def _run(users: int, writes: int, inline: bool) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "pro_scenario.json"
+        path.write_text(json.dumps({"users": {str(i): _make_record(i) for i in range(users)}}, ensure_ascii=False), encoding="utf-8")
+        backend = JsonFileBackend(path)
+
+        stop = asyncio.Event()
+        lags: list[float] = []
+        ticker = asyncio.create_task(_ticker(stop, lags))
+
+        t0 = time.perf_counter()
+        for i in range(writes):
+            if inline:
+                users_db = backend._load()
+                users_db[str(i)]["stage3"] = {"text": "x"}
+                backend._save(users_db)
+                await asyncio.sleep(0)
+            else:
+                await backend.update(str(i), lambda u: u.__setitem__("stage3", {"text": "x"}))
+        elapsed = time.perf_counter() - t0
+
+        stop.set()
+        await ticker
+
+    lags.sort()
+    return {
+        "mode": "inline" if inline else "executor",
+        "users": users,
+        "writes": writes,
+        "elapsed_s": round(elapsed, 3),
+        "lag_p50_ms": round(statistics.median(lags) * 1000, 2) if lags else None,
+        "lag_p99_ms": round(lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000, 2) if lags else None,
+        "lag_max_ms": round(lags[-1] * 1000, 2) if lags else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--writes", type=int, default=20)
+    args = parser.parse_args()
+
+    for inline in (True, False):
+        print(json.dumps(asyncio.run(_run(args.users, args.writes, inline))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Стоимость обработки нажатия на вариант ответа в анкете — до и после предкомпиляции.
+
+Запуск из корня проекта:
+    python -m bench.questionnaire_render --iterations 20000
+
+«до» повторяет прежний handler: линейный поиск варианта по списку из YAML,
+снятие префикса 'A) ', форматирование текста следующего вопроса и сборка
+InlineKeyboardMarkup через question_keyboard().
+«после» — то же через app.ui.questionnaire: словарь вариантов, готовый текст
+и разметка из заранее собранных неизменяемых кнопок.
+Запросов к Telegram нет, меряется только работа handler-а.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import yaml
+
+from app.ui.keyboards import question_keyboard
+from app.ui.questionnaire import CONFIG_DIR, SOURCES, compile_questionnaire, strip_option_prefix
+
+
+def _callbacks(questions: list[dict], prefix: str) -> list[str]:
+    # по одному нажатию на каждый вариант каждого вопроса, кроме последнего
+    return [
+        f"{prefix}:ans:{i}:{o['id']}"
+        for i, q in enumerate(questions[:-1])
+        for o in q["options"]
+        if o["id"] != "custom"
+    ]
+
+
+def _before(questions: list[dict], prefix: str, data: str):
+    _, _, q_index_str, opt_id = data.split(":", 3)
+    q_index = int(q_index_str)
+    opt = next((o for o in questions[q_index]["options"] if o["id"] == opt_id), None)
+    answer = strip_option_prefix(opt["text"])
+    nq = q_index + 1
+    text = f"Вопрос {nq + 1}/{len(questions)}:\n{questions[nq]['text']}"
+    markup = question_keyboard(prefix, nq, questions[nq]["options"])
+    return answer, text, markup
+
+
+def _after(compiled, data: str):
+    _, _, q_index_str, opt_id = data.split(":", 3)
+    q_index = int(q_index_str)
+    opt = compiled.questions[q_index].options.get(opt_id)
+    nq = compiled.questions[q_index + 1]
+    return opt.answer, nq.text, nq.keyboard
+
+
+def _measure(fn, callbacks: list[str], iterations: int) -> dict:
+    n = len(callbacks)
+    t0 = time.perf_counter()
+    for i in range(iterations):
+        fn(callbacks[i % n])
+    elapsed = time.perf_counter() - t0
+
+    tracemalloc.start()
+    for i in range(min(iterations, 1000)):
+        fn(callbacks[i % n])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "us_per_call": round(elapsed / iterations * 1e6, 2),
+        "peak_alloc_kb": round(peak / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, (filename, prefix) in SOURCES.items():
+        path = CONFIG_DIR / filename
+        with open(path, "r", encoding="utf-8") as f:
+            questions = yaml.safe_load(f)["questions"]
+
+        t0 = time.perf_counter()
+        compiled = compile_questionnaire(path, prefix)
+        compile_ms = (time.perf_counter() - t0) * 1000
+
+        callbacks = _callbacks(questions, prefix)
+        before = _measure(lambda d: _before(questions, prefix, d), callbacks, args.iterations)
+        after = _measure(lambda d: _after(compiled, d), callbacks, args.iterations)
+        print(json.dumps({
+            "questionnaire": name,
+            "questions": len(compiled),
+            "compile_ms": round(compile_ms, 2),
+            "before": before,
+            "after": after,
+            "speedup": round(before["us_per_call"] / after["us_per_call"], 1) if after["us_per_call"] else None,
+        }, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Поиск одного пользователя: JSON-файл целиком против RecordFile (индекс + mmap).
+
+Запуск из корня проекта:
+    python -m bench.record_file --sizes 10000,100000,1000000 --lookups 2000
+
+JSON-путь каждый раз разбирает весь документ (как get_user/get_scenario раньше),
+поэтому для него делается всего несколько итераций.
+"""
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from app.storage.record_file import RecordFile
+
+JSON_LOOKUPS = 5
+
+
+def _make_user(tg_id: int) -> dict:
+    return {
+        "tg_id": tg_id,
+        "fitness_profile": {
+            "completed_at": "2026-02-17T18:36:09.635801+00:00",
+            "answers": {str(i): f"ответ {i}" for i in range(10)},
+        },
+    }
+
+
+def _stats(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50_us": round(statistics.median(samples) * 1e6, 1),
+        "max_us": round(samples[-1] * 1e6, 1),
+    }
+
+
+def bench(n: int, lookups: int) -> list[dict]:
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = Path(tmp) / "users.json"
+        json_path.write_text(
+            json.dumps({"users": {str(i): _make_user(i) for i in range(n)}}, ensure_ascii=False),
+            encoding="utf-8",
+        )
+
+        rf = RecordFile(Path(tmp) / "users.rec")
+        for i in range(n):
+            rf.put(str(i), _make_user(i))
+        rf.close()
+
+        json_samples = []
+        for _ in range(JSON_LOOKUPS):
+            key = str(random.randrange(n))
+            t = time.perf_counter()
+            json.loads(json_path.read_text(encoding="utf-8"))["users"].get(key)
+            json_samples.append(time.perf_counter() - t)
+
+        rf = RecordFile(Path(tmp) / "users.rec")
+        t = time.perf_counter()
+        rf.load()
+        open_s = time.perf_counter() - t
+
+        rec_samples = []
+        for _ in range(lookups):
+            key = str(random.randrange(n))
+            t = time.perf_counter()
+            rf.get(key)
+            rec_samples.append(time.perf_counter() - t)
+        rf.close()
+
+    return [
+        {"format": "json", "users": n, **_stats(json_samples)},
+        {"format": "records", "users": n, "open_s": round(open_s, 3), **_stats(rec_samples)},
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    for n in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        for row in bench(n, args.lookups):
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Нагрузочный бенчмарк хранилища через публичные async API users_store и pro_scenario_store.
+
+Запуск из корня проекта:
+    python -m bench.storage --backend json --users 5000 --ops 20000 --concurrency 64 > bench_output.json
+
+Что делает:
+1) во временном каталоге создаёт выбранный backend (json | sharded | sqlite | records);
+2) заполняет синтетическую базу: ответы теста + stage1/2/3 с текстами по несколько КБ;
+3) гоняет смесь операций с заданной конкуренцией;
+4) печатает JSON-отчёт: p50/p95/p99 по каждой операции, общий throughput и пиковый RSS.
+
+Отчёты разных коммитов можно сравнивать между собой — формат стабильный.
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.storage import users_store, pro_scenario_store
+from app.storage.backends import JournalBackend, JsonFileBackend, ShardedJsonBackend
+from app.storage.cache import CachedBackend
+from app.storage.locks import lock_stats
+from app.storage.record_file import RecordFileBackend
+from app.storage.sqlite_backend import SqliteBackend
+
+WORDS = (
+    "сценарий жизнь позиция родитель взрослый ребёнок конфликт страх ценность "
+    "рутина мечта работа семья интерес изменение сопротивление прогноз траектория"
+).split()
+
+# операция -> вес в смеси по умолчанию
+DEFAULT_MIX = {
+    "get_user": 30,
+    "save_fitness_profile_result": 5,
+    "consume_free_nutrition_use": 10,
+    "get_scenario": 35,
+    "upsert_stage1": 5,
+    "upsert_stage2": 8,
+    "upsert_stage3": 7,
+}
+
+
+def _text(rnd: random.Random, kb: int) -> str:
+    out = []
+    size = 0
+    while size < kb * 1024:
+        w = rnd.choice(WORDS)
+        out.append(w)
+        size += len(w.encode("utf-8")) + 1
+    return " ".join(out)
+
+
+def _setup(backend: str, root: Path, flush_ms: int, cache_entries: int):
+    if backend == "sqlite":
+        users_store.set_backend(SqliteBackend(root / "bench.sqlite3", "users"))
+        scenario = SqliteBackend(root / "bench.sqlite3", "pro_scenario")
+    elif backend == "records":
+        users_store.set_backend(RecordFileBackend(root / "users.rec"))
+        scenario = RecordFileBackend(root / "pro_scenario.rec")
+    else:
+        users_store.set_backend(JournalBackend(root / "users.json"))
+        if backend == "sharded":
+            scenario = ShardedJsonBackend(root / "pro_scenario")
+        else:
+            scenario = JsonFileBackend(root / "pro_scenario.json", flush_interval_ms=flush_ms)
+    # как в main.py: JSON-файл и так в памяти, кэш — только для backends, читающих с диска
+    if not isinstance(scenario, JsonFileBackend):
+        scenario = CachedBackend(scenario, max_entries=cache_entries)
+    pro_scenario_store.set_backend(scenario)
+
+
+async def _populate(users: int, text_kb: int, concurrency: int, seed: int):
+    rnd = random.Random(seed)
+    texts = [_text(rnd, text_kb) for _ in range(16)]
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(tg_id: int):
+        async with sem:
+            await users_store.save_fitness_profile_result(tg_id, {str(i): rnd.choice(WORDS) for i in range(10)})
+            await pro_scenario_store.upsert_stage1(
+                tg_id,
+                qa=[{"q": f"Вопрос {i}", "a": rnd.choice(WORDS)} for i in range(7)],
+                analysis_full=rnd.choice(texts),
+                analysis_short=rnd.choice(texts)[:text_kb * 256],
+            )
+            await pro_scenario_store.upsert_stage2(tg_id, rnd.choice(texts))
+
+    await asyncio.gather(*(one(i) for i in range(users)))
+    await users_store.flush()
+    await pro_scenario_store.flush()
+    return texts
+
+
+async def _run_ops(users: int, ops: int, concurrency: int, mix: dict[str, int], texts: list[str], seed: int):
+    rnd = random.Random(seed + 1)
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    plan = [(rnd.choices(names, weights)[0], rnd.randrange(users)) for _ in range(ops)]
+    latencies: dict[str, list[float]] = {n: [] for n in names}
+    queue = iter(plan)
+
+    async def call(op: str, tg_id: int):
+        if op == "get_user":
+            await users_store.get_user(tg_id)
+        elif op == "save_fitness_profile_result":
+            await users_store.save_fitness_profile_result(tg_id, {"0": rnd.choice(WORDS)})
+        elif op == "consume_free_nutrition_use":
+            await users_store.consume_free_nutrition_use(tg_id)
+        elif op == "get_scenario":
+            await pro_scenario_store.get_scenario(tg_id)
+        elif op == "upsert_stage1":
+            await pro_scenario_store.upsert_stage1(tg_id, qa=[], analysis_full=rnd.choice(texts), analysis_short=rnd.choice(texts))
+        elif op == "upsert_stage2":
+            await pro_scenario_store.upsert_stage2(tg_id, rnd.choice(texts))
+        elif op == "upsert_stage3":
+            await pro_scenario_store.upsert_stage3(tg_id, rnd.choice(texts))
+        else:
+            raise ValueError(f"Неизвестная операция: {op}")
+
+    async def worker():
+        for op, tg_id in queue:
+            t = time.perf_counter()
+            await call(op, tg_id)
+            latencies[op].append(time.perf_counter() - t)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    await users_store.flush()
+    await pro_scenario_store.flush()
+    elapsed = time.perf_counter() - t0
+    return latencies, elapsed
+
+
+def _summary(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    if len(samples) < 2:
+        return {"count": 1, "p50_ms": round(samples[0] * 1000, 3)}
+    q = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "count": len(samples),
+        "p50_ms": round(q[49] * 1000, 3),
+        "p95_ms": round(q[94] * 1000, 3),
+        "p99_ms": round(q[98] * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+async def _main(args) -> dict:
+    mix = dict(DEFAULT_MIX)
+    if args.mix:
+        mix = {k: int(v) for k, v in (part.split("=") for part in args.mix.split(","))}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _setup(args.backend, Path(tmp), args.flush_ms, args.cache_entries)
+
+        t0 = time.perf_counter()
+        texts = await _populate(args.users, args.text_kb, args.concurrency, args.seed)
+        populate_s = time.perf_counter() - t0
+
+        latencies, elapsed = await _run_ops(args.users, args.ops, args.concurrency, mix, texts, args.seed)
+
+        await users_store.get_backend().close()
+        await pro_scenario_store.get_backend().close()
+
+    total_ops = sum(len(v) for v in latencies.values())
+    # ru_maxrss в Linux — КБ, в macOS — байты
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+    return {
+        "commit": _git_commit(),
+        "backend": args.backend,
+        "users": args.users,
+        "text_kb": args.text_kb,
+        "concurrency": args.concurrency,
+        "populate_s": round(populate_s, 3),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_ops_s": round(total_ops / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "scenario_cache": pro_scenario_store.cache_stats(),
+        "locks": lock_stats(),
+        "ops": {op: _summary(samples) for op, samples in latencies.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["json", "sharded", "sqlite", "records"], default="json")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--ops", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--text-kb", type=int, default=4, help="размер одного сгенерированного текста этапа, КБ")
+    parser.add_argument("--flush-ms", type=int, default=200, help="group commit для json backend (0 — писать сразу)")
+    parser.add_argument("--cache-entries", type=int, default=1000, help="размер LRU-кэша pro_scenario (0 — почти без кэша)")
+    parser.add_argument("--mix", default="", help="например: get_user=50,get_scenario=50")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(_main(args)), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
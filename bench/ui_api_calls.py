@@ -0,0 +1,195 @@
+"""
+Запросы к Telegram API на один пройденный «Психологический портрет» —
+прежняя отрисовка панели против очереди отрисовок из app.services.ui_session.
+
+Запуск из корня проекта:
+    python -m bench.ui_api_calls --users 200 --double-tap 0.3 --back-forth 0.1
+
+Вместо Telegram — поддельный бот со случайной задержкой ответа, поэтому
+параллельные правки могут приходить на «сервер» в другом порядке.
+Пользователь отвечает на вопросы; иногда нажимает кнопку дважды (--double-tap)
+или быстро «назад» и снова вперёд (--back-forth), не дожидаясь обновления панели.
+
+«до» — копия прежнего _render_ui: правка вслепую, «message is not modified»
+ловим уже после запроса. «после» — render_ui: очередь на пользователя,
+выбрасывание устаревших отрисовок и кэш отпечатков панели.
+
+wrong_panel — сколько раз после серии нажатий на панели остался не тот вопрос.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+from collections import Counter
+
+from aiogram.exceptions import TelegramBadRequest
+
+from app.services import ui_session
+from app.services.ui_session import begin_update, force_new_ui, get_ui_message, render_ui, set_ui_message
+from app.ui.keyboards import main_menu_keyboard
+from app.ui.questionnaire import get_questionnaire
+
+MAIN_MENU = "Главное меню 👇"
+DONE = "Готово ✅\n\nСобираю запрос…"
+
+
+class FakeChat:
+    def __init__(self, chat_id: int):
+        self.id = chat_id
+
+
+class FakeMessage:
+    def __init__(self, bot: "FakeBot", chat_id: int, message_id: int):
+        self.bot = bot
+        self.chat = FakeChat(chat_id)
+        self.message_id = message_id
+
+    async def answer(self, text: str, reply_markup=None, parse_mode=None) -> "FakeMessage":
+        return await self.bot.send_message(self.chat.id, text, reply_markup)
+
+
+class FakeBot:
+    def __init__(self, rnd: random.Random, latency_ms: float):
+        self.rnd = rnd
+        self.latency_ms = latency_ms
+        self.calls: Counter = Counter()
+        self.panels: dict[tuple[int, int], tuple[str, str]] = {}
+        self._ids = itertools.count(1000)
+
+    async def _network(self, method: str) -> None:
+        self.calls[method] += 1
+        await asyncio.sleep(self.latency_ms / 1000 * self.rnd.lognormvariate(0, 0.6))
+
+    @staticmethod
+    def _markup(reply_markup) -> str:
+        return reply_markup.model_dump_json(exclude_none=True) if reply_markup is not None else ""
+
+    async def send_message(self, chat_id: int, text: str, reply_markup=None) -> FakeMessage:
+        await self._network("sendMessage")
+        msg = FakeMessage(self, chat_id, next(self._ids))
+        self.panels[(chat_id, msg.message_id)] = (text, self._markup(reply_markup))
+        return msg
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str, reply_markup=None, parse_mode=None):
+        await self._network("editMessageText")
+        new = (text, self._markup(reply_markup))
+        if self.panels.get((chat_id, message_id)) == new:
+            raise TelegramBadRequest(method=None, message="Bad Request: message is not modified")
+        self.panels[(chat_id, message_id)] = new
+
+    async def edit_message_reply_markup(self, chat_id: int, message_id: int, reply_markup=None):
+        await self._network("editMessageReplyMarkup")
+        text, old_markup = self.panels[(chat_id, message_id)]
+        if old_markup == self._markup(reply_markup):
+            raise TelegramBadRequest(method=None, message="Bad Request: message is not modified")
+        self.panels[(chat_id, message_id)] = (text, self._markup(reply_markup))
+
+    async def answer_callback_query(self) -> None:
+        await self._network("answerCallbackQuery")
+
+
+# ---------- прежняя отрисовка (до общей очереди) ----------
+
+async def _legacy_render_ui(message: FakeMessage, tg_id: int, text: str, reply_markup=None):
+    ui = get_ui_message(tg_id)
+    if not ui or (message.message_id and message.message_id > ui[1]):
+        sent = await message.answer(text, reply_markup=reply_markup)
+        set_ui_message(tg_id, sent.chat.id, sent.message_id)
+        return
+    chat_id, ui_msg_id = ui
+    try:
+        await message.bot.edit_message_text(chat_id=chat_id, message_id=ui_msg_id, text=text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if "message is not modified" in str(e):
+            return
+        raise
+
+
+async def _legacy_force_new_ui(message: FakeMessage, tg_id: int, text: str, reply_markup=None):
+    sent = await message.answer(text, reply_markup=reply_markup)
+    set_ui_message(tg_id, sent.chat.id, sent.message_id)
+
+
+# ---------- сценарий пользователя ----------
+
+async def _user(tg_id: int, bot: FakeBot, rnd: random.Random, args, render, force_new, wrong: Counter) -> None:
+    questions = get_questionnaire("mental").questions
+    panel = await bot.send_message(tg_id, MAIN_MENU, main_menu_keyboard())
+    set_ui_message(tg_id, tg_id, panel.message_id)
+
+    async def tap(text: str, markup) -> None:
+        # то же, что UpdateOrderMiddleware: номер апдейта в момент нажатия
+        begin_update()
+        # handler нажатия: ответ на callback + перерисовка панели
+        await bot.answer_callback_query()
+        await render(panel, tg_id, text, reply_markup=markup)
+
+    async def burst(steps: list[int]) -> None:
+        tasks = []
+        for i, q in enumerate(steps):
+            if i:
+                await asyncio.sleep(rnd.uniform(0, args.latency_ms / 1000))
+            tasks.append(asyncio.create_task(tap(questions[q].text, questions[q].keyboard)))
+        await asyncio.gather(*tasks)
+        chat_id, ui_msg_id = get_ui_message(tg_id)
+        if bot.panels[(chat_id, ui_msg_id)][0] != questions[steps[-1]].text:
+            wrong["wrong_panel"] += 1
+
+    await burst([0])
+    for q in range(1, len(questions)):
+        steps = [q]
+        if rnd.random() < args.double_tap:
+            steps.append(q)
+        if q > 1 and rnd.random() < args.back_forth:
+            steps += [q - 1, q]
+        await burst(steps)
+        await asyncio.sleep(rnd.uniform(0, args.think_ms / 1000))
+
+    await bot.answer_callback_query()
+    await render(panel, tg_id, DONE)
+    await force_new(panel, tg_id, MAIN_MENU, reply_markup=main_menu_keyboard())
+
+
+async def _run(args, engine: bool) -> dict:
+    rnd = random.Random(args.seed)
+    bot = FakeBot(rnd, args.latency_ms)
+    wrong: Counter = Counter()
+    for tg_id in range(1, args.users + 1):
+        ui_session.clear_ui_message(tg_id)
+    ui_session._stats.clear()
+
+    render, force_new = (render_ui, force_new_ui) if engine else (_legacy_render_ui, _legacy_force_new_ui)
+    await asyncio.gather(*(
+        _user(tg_id, bot, random.Random(args.seed * 1000 + tg_id), args, render, force_new, wrong)
+        for tg_id in range(1, args.users + 1)
+    ))
+
+    total = sum(bot.calls.values())
+    renders = total - bot.calls["answerCallbackQuery"]
+    return {
+        "mode": "render_ui" if engine else "legacy",
+        "api_calls_per_questionnaire": round(total / args.users, 2),
+        "render_calls_per_questionnaire": round(renders / args.users, 2),
+        "calls": dict(bot.calls),
+        "wrong_panel": wrong["wrong_panel"],
+        "render_stats": ui_session.render_stats() if engine else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--double-tap", type=float, default=0.3, help="доля вопросов с повторным нажатием")
+    parser.add_argument("--back-forth", type=float, default=0.1, help="доля вопросов с быстрым «назад-вперёд»")
+    parser.add_argument("--latency-ms", type=float, default=150, help="медиана задержки ответа API")
+    parser.add_argument("--think-ms", type=float, default=300, help="пауза пользователя между вопросами")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    for engine in (False, True):
+        print(json.dumps(asyncio.run(_run(args, engine)), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
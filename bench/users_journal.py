@@ -0,0 +1,102 @@
+"""
+Латентность одной записи в users_store в зависимости от числа пользователей.
+
+Запуск из корня проекта:
+    python -m bench.users_journal --sizes 1000,10000,100000,1000000 --writes 2000
+
+Для журнала время записи должно оставаться примерно одинаковым на всех размерах.
+С флагом --legacy для сравнения меряется старая схема (полная перезапись users.json).
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from app.storage.journal import JournalStore
+
+
+def _make_user(tg_id: int) -> dict:
+    return {
+        "tg_id": tg_id,
+        "fitness_profile": {
+            "completed_at": "2026-02-17T18:36:09.635801+00:00",
+            "answers": {str(i): f"ответ {i}" for i in range(10)},
+        },
+        "free_usage": {"nutrition": {"week_start": "2026-02-16T00:00:00+00:00", "count": 1}},
+    }
+
+
+def _write_snapshot(path: Path, n: int):
+    users = {str(i): _make_user(i) for i in range(n)}
+    path.write_text(json.dumps({"users": users}, ensure_ascii=False), encoding="utf-8")
+
+
+def _percentiles(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    q = statistics.quantiles(samples, n=100)
+    return {"p50_us": round(q[49] * 1e6, 1), "p99_us": round(q[98] * 1e6, 1)}
+
+
+def bench_journal(n: int, writes: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "users.json"
+        _write_snapshot(path, n)
+
+        store = JournalStore(path, compact_every=writes + 1)
+        t0 = time.perf_counter()
+        len(store)
+        load_s = time.perf_counter() - t0
+
+        samples = []
+        for _ in range(writes):
+            key = str(random.randrange(n))
+            user = dict(store.get(key) or {})
+            user["fitness_profile"] = {"completed_at": "now", "answers": {"0": "x"}}
+            t = time.perf_counter()
+            store.put(key, user)
+            samples.append(time.perf_counter() - t)
+        store.close()
+
+    return {"users": n, "load_s": round(load_s, 3), **_percentiles(samples)}
+
+
+def bench_legacy(n: int, writes: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "users.json"
+        _write_snapshot(path, n)
+
+        samples = []
+        for _ in range(writes):
+            key = str(random.randrange(n))
+            t = time.perf_counter()
+            data = json.loads(path.read_text(encoding="utf-8"))
+            data["users"][key]["fitness_profile"] = {"completed_at": "now", "answers": {"0": "x"}}
+            tmp_path = path.with_suffix(".json.tmp")
+            tmp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp_path, path)
+            samples.append(time.perf_counter() - t)
+
+    return {"users": n, **_percentiles(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--legacy", action="store_true")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    for n in sizes:
+        print(json.dumps({"backend": "journal", **bench_journal(n, args.writes)}))
+        if args.legacy:
+            # старая схема очень медленная на больших размерах, поэтому мало итераций
+            print(json.dumps({"backend": "legacy", **bench_legacy(n, min(args.writes, 20))}))
+
+
+if __name__ == "__main__":
+    main()
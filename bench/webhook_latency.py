@@ -0,0 +1,138 @@
+"""
+Задержка «апдейт отправлен → вызван handler» в режиме webhook.
+
+Запуск из корня проекта:
+    python -m bench.webhook_latency --updates 5000 --rate 1000 --handler-ms 5
+
+Поднимает тот же aiohttp-сервер, что и бот (app.webhook), с настоящим Dispatcher
+и одним handler-ом, который только засекает время и «работает» --handler-ms.
+Клиент шлёт синтетические апдейты с нужной частотой; время отправки зашито
+в текст сообщения. В Telegram ничего не уходит — handler не вызывает API.
+
+Маленькая --queue-size и медленный handler показывают противодавление:
+лишние апдейты получают 503 (Telegram повторил бы их позже).
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from aiohttp import ClientSession, TCPConnector, web
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+
+from app.webhook import SECRET_HEADER, UpdateQueue, make_webhook_app
+
+SECRET = "bench-secret"
+PATH = "/tg/webhook"
+
+
+def _update(i: int, sent_at: float, chats: int) -> dict:
+    chat_id = 100000 + i % chats
+    return {
+        "update_id": i,
+        "message": {
+            "message_id": i,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+            "text": repr(sent_at),
+        },
+    }
+
+
+def _pct(ordered: list[float], q: float) -> float | None:
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 2)
+
+
+async def _run(args) -> dict:
+    latencies: list[float] = []
+
+    router = Router()
+
+    @router.message()
+    async def _handler(message: Message):
+        latencies.append((time.perf_counter() - float(message.text)) * 1000)
+        if args.handler_ms:
+            await asyncio.sleep(args.handler_ms / 1000)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot(token="123456:BENCH")
+
+    queue = UpdateQueue(dp, bot, maxsize=args.queue_size, workers=args.workers)
+    runner = web.AppRunner(make_webhook_app(bot, queue, PATH, SECRET))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    queue.start()
+
+    url = f"http://127.0.0.1:{args.port}{PATH}"
+    statuses: dict[int, int] = {}
+
+    async def _post(session: ClientSession, i: int):
+        payload = json.dumps(_update(i, time.perf_counter(), args.chats))
+        async with session.post(url, data=payload, headers={SECRET_HEADER: SECRET, "Content-Type": "application/json"}) as r:
+            statuses[r.status] = statuses.get(r.status, 0) + 1
+
+    t0 = time.perf_counter()
+    async with ClientSession(connector=TCPConnector(limit=args.connections)) as session:
+        tasks = []
+        for i in range(args.updates):
+            # равномерный поток с заданной частотой
+            delay = t0 + i / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(_post(session, i)))
+        await asyncio.gather(*tasks)
+    send_s = time.perf_counter() - t0
+
+    # ждём, пока handler увидит все принятые апдейты
+    deadline = time.perf_counter() + 60
+    while len(latencies) < statuses.get(200, 0) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    total_s = time.perf_counter() - t0
+
+    server = queue.stats()
+    await queue.stop()
+    await runner.cleanup()
+    await bot.session.close()
+
+    latencies.sort()
+    return {
+        "updates": args.updates,
+        "rate": args.rate,
+        "handler_ms": args.handler_ms,
+        "workers": args.workers,
+        "queue_size": args.queue_size,
+        "statuses": statuses,
+        "send_s": round(send_s, 3),
+        "total_s": round(total_s, 3),
+        "handled_per_s": round(len(latencies) / total_s, 1) if total_s else None,
+        "latency_p50_ms": _pct(latencies, 0.50),
+        "latency_p95_ms": _pct(latencies, 0.95),
+        "latency_p99_ms": _pct(latencies, 0.99),
+        "latency_max_ms": round(latencies[-1], 2) if latencies else None,
+        "queue_wait_p50_ms": server["latency_p50_ms"],
+        "queue_wait_p99_ms": server["latency_p99_ms"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=1000, help="апдейтов в секунду")
+    parser.add_argument("--chats", type=int, default=500, help="сколько разных пользователей")
+    parser.add_argument("--handler-ms", type=float, default=0, help="время работы handler-а")
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--connections", type=int, default=100, help="параллельных HTTP-соединений клиента")
+    parser.add_argument("--port", type=int, default=8091)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(_run(args)), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
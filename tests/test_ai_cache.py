@@ -0,0 +1,46 @@
+import asyncio
+import os
+import time
+
+from app.services.ai_cache import ResponseCache
+
+
+def _files(root):
+    return sorted(p.stem for p in root.glob("*/*.json"))
+
+
+def test_disk_sweep_drops_expired_and_keeps_size_under_limit(tmp_path):
+    async def main():
+        cache = ResponseCache(ttl_s=3600, disk_dir=tmp_path, disk_max_bytes=10 * 1024)
+        # фоновую чистку не ждём — зовём её явно ниже
+        cache._swept_at = time.monotonic()
+        for i in range(8):
+            await cache.put(f"{i:02d}" + "a" * 62, "x" * 2000)
+
+        # первый файл будто записан вчера, остальные — по порядку
+        paths = sorted(tmp_path.glob("*/*.json"))
+        now = time.time()
+        for n, path in enumerate(paths):
+            age = 2 * 3600 if n == 0 else 100 - n
+            os.utime(path, (now - age, now - age))
+
+        assert await asyncio.to_thread(cache._sweep_disk) == 4
+        left = _files(tmp_path)
+        # просроченный 00 и самые старые 01–03 удалены, объём — не больше 90% лимита
+        assert [k[:2] for k in left] == ["04", "05", "06", "07"]
+        assert sum(p.stat().st_size for p in tmp_path.glob("*/*.json")) <= 0.9 * 10 * 1024
+
+    asyncio.run(main())
+
+
+def test_expired_entry_is_deleted_on_read(tmp_path):
+    async def main():
+        key = "ab" + "c" * 62
+        cache = ResponseCache(ttl_s=0, disk_dir=tmp_path)
+        await cache.put(key, "text")
+        await asyncio.sleep(0.01)
+        fresh = ResponseCache(ttl_s=0, disk_dir=tmp_path)
+        assert await fresh.get(key, "f") is None
+        assert _files(tmp_path) == []
+
+    asyncio.run(main())
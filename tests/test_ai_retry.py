@@ -0,0 +1,209 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import APIConnectionError, APIStatusError
+
+from app.services import ai_provider
+from app.services.ai_provider import AIProvider
+from app.services.ai_retry import BACKOFF_CAP_S, backoff_delay, hedged, is_retryable
+
+REQUEST = httpx.Request("POST", "http://ai.test/v1/chat/completions")
+
+
+def _status_error(status: int, headers: dict | None = None) -> APIStatusError:
+    response = httpx.Response(status, request=REQUEST, headers=headers)
+    return APIStatusError(f"HTTP {status}", response=response, body=None)
+
+
+def _answer(text: str):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, prompt_tokens_details=None),
+    )
+
+
+class FakeCompletions:
+    """Вместо chat.completions: по очереди отдаёт заданные ответы или ошибки."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        step = self.script.pop(0)
+        if isinstance(step, BaseException):
+            raise step
+        if callable(step):
+            try:
+                return await step()
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+        return step
+
+
+class FakeMetrics:
+    def __init__(self):
+        self.records = []
+
+    def record(self, rec):
+        self.records.append(rec)
+
+
+def _provider(completions: FakeCompletions, **kwargs) -> AIProvider:
+    ai = AIProvider(api_key="test", base_url="http://ai.test/v1", model="test-model", **kwargs)
+    ai.client.chat = SimpleNamespace(completions=completions)
+    return ai
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(ai_provider, "backoff_delay", lambda attempt, e=None: 0)
+
+
+# ---------- классификация и задержки ----------
+
+def test_is_retryable():
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(APIConnectionError(request=REQUEST))
+    for status in (408, 409, 429, 500, 502, 503, 504):
+        assert is_retryable(_status_error(status))
+    for status in (400, 401, 403, 404, 422):
+        assert not is_retryable(_status_error(status))
+    assert not is_retryable(ValueError("bug"))
+
+
+def test_backoff_delay_honours_retry_after_with_cap():
+    assert backoff_delay(0, _status_error(429, {"retry-after": "3"})) == 3.0
+    assert backoff_delay(0, _status_error(429, {"retry-after": "120"})) == BACKOFF_CAP_S
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, _status_error(503)) <= BACKOFF_CAP_S
+
+
+# ---------- повторы ----------
+
+def test_retryable_error_is_retried():
+    async def main():
+        completions = FakeCompletions(_status_error(503), APIConnectionError(request=REQUEST), _answer("ok"))
+        ai = _provider(completions, max_retries=2)
+        try:
+            assert await ai.generate("sys", "user", feature="f") == "ok"
+        finally:
+            await ai.aclose()
+        assert completions.calls == 3
+        assert ai.stats()["f"] == {"calls": 1, "retries": 2}
+
+    asyncio.run(main())
+
+
+def test_non_retryable_error_fails_at_once():
+    async def main():
+        completions = FakeCompletions(_status_error(400), _answer("never"))
+        ai = _provider(completions, max_retries=2)
+        try:
+            with pytest.raises(APIStatusError):
+                await ai.generate("sys", "user", feature="f")
+        finally:
+            await ai.aclose()
+        assert completions.calls == 1
+        assert ai.stats()["f"] == {"calls": 1, "failures": 1}
+
+    asyncio.run(main())
+
+
+def test_retries_are_limited():
+    async def main():
+        completions = FakeCompletions(*[_status_error(429)] * 3)
+        ai = _provider(completions, max_retries=2)
+        try:
+            with pytest.raises(APIStatusError):
+                await ai.generate("sys", "user", feature="f")
+        finally:
+            await ai.aclose()
+        assert completions.calls == 3
+        assert ai.stats()["f"] == {"calls": 1, "retries": 2, "failures": 1}
+
+    asyncio.run(main())
+
+
+# ---------- хедж ----------
+
+def test_hedged_cancels_the_loser_and_discards_late_result():
+    async def main():
+        started = []
+        discarded = []
+        cancelled = asyncio.Event()
+
+        async def make():
+            n = len(started)
+            started.append(n)
+            if n == 0:
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+            return f"ответ {n}"
+
+        async def discard(result):
+            discarded.append(result)
+
+        result, hedge_won = await hedged(make, after_s=0.01, discard=discard)
+        assert (result, hedge_won) == ("ответ 1", True)
+        assert cancelled.is_set()
+        # отменённый проигравший ничего не вернул — освобождать нечего
+        assert discarded == []
+
+    asyncio.run(main())
+
+
+def test_hedged_without_threshold_runs_once():
+    async def main():
+        calls = 0
+
+        async def make():
+            nonlocal calls
+            calls += 1
+            return "ok"
+
+        assert await hedged(make, after_s=None) == ("ok", False)
+        assert calls == 1
+
+    asyncio.run(main())
+
+
+def test_provider_hedge_accounts_winner_and_loser():
+    async def main():
+        async def slow():
+            await asyncio.sleep(10)
+            return _answer("slow")
+
+        async def fast():
+            return _answer("fast")
+
+        completions = FakeCompletions(slow, fast)
+        metrics = FakeMetrics()
+        ai = _provider(completions, hedge_percentile=0.5, metrics=metrics)
+        # история задержек фичи: порог хеджа ~10 мс
+        for _ in range(ai_provider.HEDGE_MIN_SAMPLES):
+            ai._observe("f", "total", 0.01)
+        try:
+            assert await ai.generate("sys", "user", feature="f") == "fast"
+        finally:
+            await ai.aclose()
+
+        assert completions.calls == 2
+        assert completions.cancelled == 1
+        assert ai.stats()["f"] == {"calls": 1, "hedges": 1, "hedge_wins": 1}
+
+        # проигравший — отдельная строка с hedge=True, победитель — обычная
+        losers = [r for r in metrics.records if r.hedge]
+        winners = [r for r in metrics.records if not r.hedge]
+        assert len(losers) == 1 and not losers[0].ok and losers[0].completion_tokens == 0
+        assert len(winners) == 1 and winners[0].ok and winners[0].completion_tokens == 5
+
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from app.services.ai_scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_FREE,
+    PRIORITY_PRO,
+    AIRequestCancelled,
+    AIScheduler,
+)
+
+
+async def _until(cond, timeout_s: float = 2.0):
+    for _ in range(int(timeout_s / 0.01)):
+        if cond():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("условие не выполнилось")
+
+
+class Gate:
+    """Вместо AI: запрос держит слот, пока тест его не отпустит."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.order: list[str] = []
+
+    def call(self, name: str):
+        async def make():
+            self.order.append(name)
+            await self.release.wait()
+            return name
+        return make
+
+
+def test_higher_priority_is_served_first():
+    async def main():
+        sched = AIScheduler(max_concurrent=1, per_user=1)
+        gate = Gate()
+
+        busy = asyncio.create_task(sched.run(1, PRIORITY_FREE, gate.call("busy")))
+        await _until(lambda: gate.order == ["busy"])
+
+        # встают в очередь в обратном порядке приоритетов
+        waiting = [
+            asyncio.create_task(sched.run(2, PRIORITY_BACKGROUND, gate.call("background"))),
+            asyncio.create_task(sched.run(3, PRIORITY_FREE, gate.call("free"))),
+            asyncio.create_task(sched.run(4, PRIORITY_PRO, gate.call("pro"))),
+        ]
+        await _until(lambda: sched.stats()["waiting"] == 3)
+
+        gate.release.set()
+        await asyncio.gather(busy, *waiting)
+        assert gate.order == ["busy", "pro", "free", "background"]
+        assert sched.stats()["queued"] == 3
+
+    asyncio.run(main())
+
+
+def test_per_user_cap_lets_other_users_through():
+    async def main():
+        sched = AIScheduler(max_concurrent=4, per_user=1)
+        gate = Gate()
+
+        first = asyncio.create_task(sched.run(1, PRIORITY_PRO, gate.call("user1-a")))
+        await _until(lambda: gate.order == ["user1-a"])
+
+        # второй запрос того же пользователя ждёт, хотя слоты есть; чужой — проходит
+        second = asyncio.create_task(sched.run(1, PRIORITY_PRO, gate.call("user1-b")))
+        other = asyncio.create_task(sched.run(2, PRIORITY_FREE, gate.call("user2")))
+        await _until(lambda: "user2" in gate.order)
+        assert "user1-b" not in gate.order
+        assert sched.stats()["running"] == 2
+
+        gate.release.set()
+        await asyncio.gather(first, second, other)
+        assert gate.order == ["user1-a", "user2", "user1-b"]
+
+    asyncio.run(main())
+
+
+def test_cancel_while_queued_frees_the_place():
+    async def main():
+        sched = AIScheduler(max_concurrent=1, per_user=1)
+        gate = Gate()
+
+        busy = asyncio.create_task(sched.run(1, PRIORITY_PRO, gate.call("busy")))
+        await _until(lambda: gate.order == ["busy"])
+        queued = asyncio.create_task(sched.run(2, PRIORITY_FREE, gate.call("cancelled")))
+        after = asyncio.create_task(sched.run(3, PRIORITY_FREE, gate.call("after")))
+        await _until(lambda: sched.stats()["waiting"] == 2)
+
+        assert sched.cancel(2) == 1
+        with pytest.raises(AIRequestCancelled):
+            await queued
+
+        gate.release.set()
+        await asyncio.gather(busy, after)
+        # отменённый запрос так и не дошёл до AI, а его место не потерялось
+        assert gate.order == ["busy", "after"]
+        stats = sched.stats()
+        assert stats["cancelled"] == 1
+        assert stats["running"] == 0 and stats["waiting"] == 0
+
+    asyncio.run(main())
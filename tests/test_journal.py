@@ -0,0 +1,19 @@
+from app.storage.journal import JournalStore
+
+
+def test_torn_tail_is_truncated_before_next_append(tmp_path):
+    store = JournalStore(tmp_path / "users.json")
+    store.put("1", {"n": 1})
+    store.close()
+    # процесс упал посреди записи второй строки
+    with open(store.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"k":"2","v":{"n"')
+
+    store = JournalStore(tmp_path / "users.json")
+    assert store.get("2") is None
+    store.put("3", {"n": 3})
+    store.close()
+
+    reopened = JournalStore(tmp_path / "users.json")
+    assert reopened.get("1") == {"n": 1}
+    assert reopened.get("3") == {"n": 3}
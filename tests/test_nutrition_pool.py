@@ -0,0 +1,111 @@
+import asyncio
+
+from app.services.nutrition_pool import PlanPool
+
+KEYS = ["a", "b", "c"]
+
+
+class Producer:
+    """Вместо AI: считает параллельные генерации, ответ выдаёт по сигналу."""
+
+    def __init__(self, gated: bool = False):
+        self.gate = asyncio.Event()
+        if not gated:
+            self.gate.set()
+        self.active = 0
+        self.peak = 0
+        self.calls = 0
+
+    async def __call__(self, key):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await self.gate.wait()
+            return f"plan {key} #{self.calls}"
+        finally:
+            self.active -= 1
+
+
+async def _until(cond, timeout_s: float = 2.0):
+    for _ in range(int(timeout_s / 0.01)):
+        if cond():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("условие не выполнилось")
+
+
+def test_take_serves_ready_plan_and_refills():
+    async def main():
+        produce = Producer()
+        pool = PlanPool(KEYS, produce, size=2, concurrency=2)
+        pool.start()
+        try:
+            await _until(lambda: pool.stats()["ready"] == 6)
+
+            assert pool.take("a").startswith("plan a")
+            assert pool.take("unknown") is None
+            assert pool.stats()["served"] == 1
+
+            # take будит фон, и пул доливает выданный ответ
+            await _until(lambda: pool.stats()["ready"] == 6)
+            assert pool.stats()["generated"] == 7
+        finally:
+            await pool.stop()
+
+    asyncio.run(main())
+
+
+def test_empty_key_returns_none():
+    async def main():
+        produce = Producer(gated=True)
+        pool = PlanPool(KEYS, produce, size=1, concurrency=1)
+        pool.start()
+        try:
+            assert pool.take("a") is None
+            assert pool.stats()["empty"] == 1
+        finally:
+            await pool.stop()
+
+    asyncio.run(main())
+
+
+def test_stale_plans_are_dropped():
+    async def main():
+        produce = Producer()
+        pool = PlanPool(KEYS, produce, size=1, concurrency=3, max_age_s=3600)
+        pool.start()
+        try:
+            await _until(lambda: pool.stats()["ready"] == 3)
+
+            # ответ по ключу "a" старше max_age_s
+            ts, text = pool._plans["a"][0]
+            pool._plans["a"][0] = (ts - 3601, text)
+
+            assert pool.take("a") is None
+            assert pool.stats()["expired"] == 1
+            await _until(lambda: len(pool._plans["a"]) == 1)
+        finally:
+            await pool.stop()
+
+    asyncio.run(main())
+
+
+def test_refill_respects_concurrency_cap():
+    async def main():
+        produce = Producer(gated=True)
+        pool = PlanPool(KEYS, produce, size=4, concurrency=2)
+        pool.start()
+        try:
+            await _until(lambda: produce.active == 2)
+            # при пустом пуле на старте всё равно не больше concurrency запросов
+            await asyncio.sleep(0.05)
+            assert produce.active == 2
+
+            produce.gate.set()
+            await _until(lambda: pool.stats()["ready"] == 12)
+            assert produce.peak == 2
+        finally:
+            await pool.stop()
+
+    asyncio.run(main())
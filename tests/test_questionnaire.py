@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("aiogram")
+
+from pydantic import ValidationError
+
+from app.ui.keyboards import question_keyboard
+from app.ui.questionnaire import CONFIG_DIR, SOURCES, compile_questionnaire
+
+
+def test_shared_keyboard_cannot_be_corrupted():
+    filename, prefix = SOURCES["mental"]
+    q = compile_questionnaire(CONFIG_DIR / filename, prefix).questions[1]
+
+    markup = q.keyboard
+    markup.inline_keyboard.pop()
+    markup.inline_keyboard[0].clear()
+    with pytest.raises(ValidationError):
+        q.keyboard.inline_keyboard[0][0].text = "другой"
+
+    # следующая отрисовка получает исходную клавиатуру
+    assert q.keyboard is not markup
+    assert len(q.keyboard.inline_keyboard) == len(q.rows)
+    assert q.keyboard.model_dump_json(exclude_none=True) == question_keyboard(
+        prefix, 1, [{"id": o.id, "text": o.text} for o in q.options.values()]
+    ).model_dump_json(exclude_none=True)
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import timedelta
+
+from app.services.quota import QuotaEngine, QuotaRule
+from app.storage.sqlite_backend import SqliteBackend
+
+RULES = {"nutrition": QuotaRule(limit=3, calendar_week=True)}
+
+
+def test_concurrent_reserves_never_exceed_limit_and_persist_immediately(tmp_path):
+    async def main():
+        backend = SqliteBackend(tmp_path / "bot.db", table="users")
+        engine = QuotaEngine(RULES, lambda: backend)
+
+        results = await asyncio.gather(*(engine.reserve(1, "nutrition") for _ in range(10)))
+        granted = [r for r, _ in results if r is not None]
+        assert len(granted) == 3
+
+        # без flush: другой движок (другой процесс) сразу видит списания
+        other = QuotaEngine(RULES, lambda: backend)
+        assert not (await other.check(1, "nutrition")).ok
+
+        await granted[0].refund()
+        assert (await other.reserve(1, "nutrition"))[0] is not None
+        await backend.close()
+
+    asyncio.run(main())
+
+
+def test_rule_override_and_bounded_cache(tmp_path):
+    async def main():
+        backend = SqliteBackend(tmp_path / "bot.db", table="users")
+        engine = QuotaEngine({"fitness": QuotaRule(limit=1, period=timedelta(days=7))}, lambda: backend, cache_size=2)
+
+        await engine.try_consume(1, "fitness")
+        assert not (await engine.check(1, "fitness")).ok
+        assert (await engine.check(1, "fitness", rule=QuotaRule(limit=1, period=timedelta(0)))).ok
+
+        for tg_id in range(2, 6):
+            await engine.check(tg_id, "fitness")
+        assert len(engine._cache) == 2
+        await backend.close()
+
+    asyncio.run(main())
+
+
+def test_mutate_is_written_with_the_quota_in_one_update(tmp_path):
+    async def main():
+        backend = SqliteBackend(tmp_path / "bot.db", table="users")
+        engine = QuotaEngine({"fitness": QuotaRule(limit=1, period=timedelta(days=7))}, lambda: backend)
+        updates = 0
+        update = backend.update
+
+        async def counting_update(key, mutator):
+            nonlocal updates
+            updates += 1
+            return await update(key, mutator)
+
+        backend.update = counting_update
+
+        def _apply(user: dict):
+            user["fitness_profile"] = {"answers": {}}
+
+        await engine.try_consume(1, "fitness", force=True, mutate=_apply)
+        # лимит выбран, но force всё равно фиксирует прохождение
+        await engine.try_consume(1, "fitness", force=True, mutate=_apply)
+        # по одному update на вызов: запись и квота не расходятся
+        assert updates == 2
+
+        user = await backend.get("1")
+        assert user["fitness_profile"] == {"answers": {}}
+        assert len(user["quota"]["fitness"]) == 2
+        await backend.close()
+
+    asyncio.run(main())
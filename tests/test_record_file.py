@@ -0,0 +1,42 @@
+import asyncio
+
+from app.storage.record_file import RecordFileBackend
+
+
+def test_compaction_runs_in_background_and_keeps_data(tmp_path):
+    path = tmp_path / "users.rec"
+
+    async def main():
+        backend = RecordFileBackend(path)
+        blob = "x" * 10_000
+
+        def _apply(i):
+            def mutate(user: dict):
+                user["blob"] = blob
+                user["n"] = i
+                return i
+            return mutate
+
+        # одна и та же запись перезаписывается: файл растёт мёртвыми версиями
+        i = 0
+        while backend._compaction_task is None:
+            assert await backend.update("1", _apply(i)) == i
+            await backend.update("2", lambda user: user.setdefault("name", "second"))
+            i += 1
+        # update вернулся раньше, чем файл переписан
+        assert not backend._compaction_task.done()
+
+        await backend._compaction_task
+        assert path.stat().st_size < 100_000
+        await backend.close()
+        return i - 1
+
+    last = asyncio.run(main())
+
+    async def reopen():
+        backend = RecordFileBackend(path)
+        assert (await backend.get("1"))["n"] == last
+        assert (await backend.get("2"))["name"] == "second"
+        await backend.close()
+
+    asyncio.run(reopen())
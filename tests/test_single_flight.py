@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight, input_hash
+
+
+def test_concurrent_calls_share_one_execution():
+    async def main():
+        flights = SingleFlight()
+        gate = asyncio.Event()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await gate.wait()
+            return "ответ"
+
+        callers = [asyncio.create_task(flights.do("k", work)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert flights.in_flight("k")
+
+        gate.set()
+        results = await asyncio.gather(*callers)
+        assert calls == 1
+        assert [r for r, _ in results] == ["ответ"] * 5
+        assert sorted(shared for _, shared in results) == [False] + [True] * 4
+        assert flights.stats() == {"in_flight": 0, "started": 1, "shared": 4}
+
+    asyncio.run(main())
+
+
+def test_error_reaches_every_waiter():
+    async def main():
+        flights = SingleFlight()
+        gate = asyncio.Event()
+
+        async def work():
+            await gate.wait()
+            raise RuntimeError("AI недоступен")
+
+        callers = [asyncio.create_task(flights.do("k", work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flights.wait("k"))
+        await asyncio.sleep(0)
+
+        gate.set()
+        results = await asyncio.gather(*callers, waiter, return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        # после ошибки ключ свободен: следующий вызов запускает работу заново
+        assert not flights.in_flight("k")
+
+        async def ok():
+            return 1
+
+        assert await flights.do("k", ok) == (1, False)
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_does_not_stop_the_work():
+    async def main():
+        flights = SingleFlight()
+        gate = asyncio.Event()
+
+        async def work():
+            await gate.wait()
+            return "готово"
+
+        first = asyncio.create_task(flights.do("k", work))
+        second = asyncio.create_task(flights.do("k", work))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        gate.set()
+        assert await second == ("готово", True)
+
+    asyncio.run(main())
+
+
+def test_input_hash_separates_parts():
+    assert input_hash("ab", "c") != input_hash("a", "bc")
+    assert len(input_hash("x")) == 16
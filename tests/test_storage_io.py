@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from app.storage.backends import ShardedJsonBackend
+
+# тик «живого» event loop и допустимая задержка между тиками
+TICK_S = 0.01
+MAX_LAG_S = 0.05
+
+
+async def _max_loop_lag(work) -> float:
+    """Крутит тикер asyncio.sleep(TICK_S), пока идёт work; возвращает худшую задержку тика."""
+    lag = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal lag
+        while not done.is_set():
+            t0 = time.perf_counter()
+            await asyncio.sleep(TICK_S)
+            lag = max(lag, time.perf_counter() - t0 - TICK_S)
+
+    task = asyncio.create_task(ticker())
+    try:
+        await work()
+    finally:
+        done.set()
+        await task
+    return lag
+
+
+def test_slow_backend_read_does_not_block_loop(tmp_path):
+    backend = ShardedJsonBackend(tmp_path)
+    read = backend._read
+
+    def slow_read(key):
+        # медленный диск: чтение висит в пуле run_io, а не в event loop
+        time.sleep(0.3)
+        return read(key)
+
+    backend._read = slow_read
+
+    async def work():
+        await backend.update("42", lambda rec: rec.update(n=1))
+        assert await backend.get("42") == {"n": 1}
+
+    lag = asyncio.run(_max_loop_lag(work))
+    assert lag < MAX_LAG_S, f"event loop простаивал {lag * 1000:.1f} мс"
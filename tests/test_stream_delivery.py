@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from app.services.ai_scheduler import AIRequestCancelled
+from app.services.stream_delivery import stream_to_message
+
+
+class FakeDraft:
+    def __init__(self, text: str):
+        self.text = text
+        self.deleted = False
+
+    async def edit_text(self, text, **kwargs):
+        self.text = text
+
+    async def delete(self):
+        self.deleted = True
+
+
+class FakeMessage:
+    def __init__(self):
+        self.drafts: list[FakeDraft] = []
+
+    async def answer(self, text, **kwargs):
+        draft = FakeDraft(text)
+        self.drafts.append(draft)
+        return draft
+
+
+async def _failing(error: BaseException):
+    yield "начало ответа"
+    raise error
+
+
+def test_draft_is_deleted_when_ai_fails():
+    async def main():
+        message = FakeMessage()
+        with pytest.raises(RuntimeError):
+            await stream_to_message(message, _failing(RuntimeError("503")), placeholder="🍽 Составляю рацион…")
+        assert message.drafts[0].deleted
+
+    asyncio.run(main())
+
+
+def test_draft_is_marked_when_cancelled():
+    async def main():
+        message = FakeMessage()
+        with pytest.raises(AIRequestCancelled):
+            await stream_to_message(message, _failing(AIRequestCancelled()))
+        draft = message.drafts[0]
+        assert not draft.deleted and draft.text == "⛔ Генерация отменена."
+
+    asyncio.run(main())
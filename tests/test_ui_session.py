@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from app.services import ui_session
+from app.services.ui_session import begin_update, render_ui, run_in_background, set_ui_message
+
+
+class FakeChat:
+    def __init__(self, chat_id: int):
+        self.id = chat_id
+
+
+class FakeBot:
+    def __init__(self):
+        self.panels: dict[tuple[int, int], str] = {}
+
+    async def edit_message_text(self, chat_id, message_id, text, reply_markup=None, parse_mode=None):
+        await asyncio.sleep(0)
+        self.panels[(chat_id, message_id)] = text
+
+
+class FakeMessage:
+    def __init__(self, bot: FakeBot, chat_id: int, message_id: int):
+        self.bot = bot
+        self.chat = FakeChat(chat_id)
+        self.message_id = message_id
+
+
+TG_ID = 7
+PANEL = 100
+
+
+def _setup() -> tuple[FakeBot, FakeMessage]:
+    ui_session.clear_ui_message(TG_ID)
+    ui_session._LANES.pop(TG_ID, None)
+    bot = FakeBot()
+    set_ui_message(TG_ID, TG_ID, PANEL)
+    return bot, FakeMessage(bot, TG_ID, PANEL)
+
+
+def test_background_render_is_not_stale():
+    async def main():
+        bot, panel = _setup()
+        ready = asyncio.Event()
+
+        async def finish():
+            # отчёт готов уже после следующих нажатий пользователя
+            await ready.wait()
+            await render_ui(panel, TG_ID, "Готово")
+
+        async def handler_with_background():
+            begin_update()
+            await render_ui(panel, TG_ID, "Собираю отчёт…")
+            return run_in_background(finish())
+
+        task = await asyncio.create_task(handler_with_background())
+
+        async def later_tap():
+            begin_update()
+            await render_ui(panel, TG_ID, "Вопрос")
+
+        await asyncio.create_task(later_tap())
+        ready.set()
+        await task
+        assert bot.panels[(TG_ID, PANEL)] == "Готово"
+
+    asyncio.run(main())
+
+
+def test_older_update_render_is_dropped():
+    async def main():
+        bot, panel = _setup()
+        first_tap = asyncio.Event()
+
+        async def slow_tap():
+            begin_update()
+            first_tap.set()
+            await asyncio.sleep(0.01)  # например, ответ на callback
+            await render_ui(panel, TG_ID, "Вопрос 1")
+
+        async def fast_tap():
+            await first_tap.wait()
+            begin_update()
+            await render_ui(panel, TG_ID, "Вопрос 2")
+
+        await asyncio.gather(slow_tap(), fast_tap())
+        assert bot.panels[(TG_ID, PANEL)] == "Вопрос 2"
+
+    asyncio.run(main())
+
+
+def test_idle_lanes_are_evicted(monkeypatch):
+    async def main():
+        bot, panel = _setup()
+        await render_ui(panel, TG_ID, "Меню")
+        assert TG_ID in ui_session._LANES
+
+        # прошло больше LANE_IDLE_S: при создании очереди другого пользователя старые выкидываются
+        ui_session._LANES[TG_ID].used_at -= ui_session.LANE_IDLE_S + 1
+        monkeypatch.setattr(ui_session, "_lanes_swept_at", ui_session._lanes_swept_at - ui_session.LANE_IDLE_S - 1)
+        other = FakeMessage(bot, TG_ID + 1, PANEL)
+        set_ui_message(TG_ID + 1, TG_ID + 1, PANEL)
+        await render_ui(other, TG_ID + 1, "Меню")
+        assert TG_ID not in ui_session._LANES
+        assert TG_ID + 1 in ui_session._LANES
+
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("aiogram")
+
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot
+
+from app.webhook import SECRET_HEADER, UpdateQueue, make_webhook_app
+
+SECRET = "test-secret"
+PATH = "/tg/webhook"
+
+
+class GatedDispatcher:
+    """Вместо Dispatcher: обработка апдейта ждёт, пока тест её не отпустит."""
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.fed = []
+
+    async def feed_update(self, bot, update):
+        await self.gate.wait()
+        self.fed.append(update.update_id)
+
+
+def _update(i: int) -> dict:
+    return {
+        "update_id": i,
+        "message": {
+            "message_id": i,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Test"},
+            "text": "hi",
+        },
+    }
+
+
+def _run(scenario, maxsize: int = 10, workers: int = 1, start: bool = True):
+    async def main():
+        bot = Bot(token="123456:TEST")
+        dp = GatedDispatcher()
+        queue = UpdateQueue(dp, bot, maxsize=maxsize, workers=workers)
+        if start:
+            queue.start()
+        client = TestClient(TestServer(make_webhook_app(bot, queue, PATH, SECRET)))
+        await client.start_server()
+        try:
+            await scenario(client, queue, dp)
+        finally:
+            dp.gate.set()
+            await queue.stop(drain_timeout_s=1)
+            await client.close()
+            await bot.session.close()
+
+    asyncio.run(main())
+
+
+def _post(client, i: int, secret: str = SECRET):
+    return client.post(PATH, json=_update(i), headers={SECRET_HEADER: secret})
+
+
+def test_response_does_not_wait_for_processing():
+    async def scenario(client, queue, dp):
+        resp = await _post(client, 1)
+        assert resp.status == 200
+        # ответ уже ушёл, а handler всё ещё ждёт
+        assert dp.fed == [] and queue.processed == 0
+
+        dp.gate.set()
+        for _ in range(100):
+            if queue.processed:
+                break
+            await asyncio.sleep(0.01)
+        assert dp.fed == [1]
+
+    _run(scenario)
+
+
+def test_full_queue_returns_503():
+    async def scenario(client, queue, dp):
+        assert (await _post(client, 1)).status == 200
+        assert (await _post(client, 2)).status == 503
+        assert queue.stats()["rejected"] == 1
+
+    # без workers очередь не разбирается
+    _run(scenario, maxsize=1, start=False)
+
+
+def test_wrong_secret_returns_401():
+    async def scenario(client, queue, dp):
+        assert (await _post(client, 1, secret="wrong")).status == 401
+        assert (await client.post(PATH, json=_update(2))).status == 401
+        # не-ASCII в заголовке — тоже 401, а не 500
+        assert (await _post(client, 3, secret="секрет")).status == 401
+        assert queue.stats()["received"] == 0
+
+    _run(scenario)
+
+
+def test_healthz_hides_stats_without_secret():
+    async def scenario(client, queue, dp):
+        assert await (await client.get("/healthz")).json() == {"status": "ok"}
+        stats = await (await client.get("/healthz", headers={SECRET_HEADER: SECRET})).json()
+        assert stats["depth"] == 0
+
+    _run(scenario)